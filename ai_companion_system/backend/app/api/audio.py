@@ -1,25 +1,49 @@
-from fastapi import APIRouter, HTTPException
+from functools import lru_cache
+import os
+import tempfile
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 import numpy as np
-from app.core.asr import SpeechRecognizer
-from app.core.tts import TextToSpeech
-from app.core.emotion import EmotionAnalyzer
-from app.core.voice_adjuster import VoiceAdjuster
 from app.utils.logger import audio_logger
 
 router = APIRouter()
 
-# 初始化模块
-asr = SpeechRecognizer()
-tts = TextToSpeech()
-emotion_analyzer = EmotionAnalyzer()
-voice_adjuster = VoiceAdjuster()
+# 批量情感分析上传的zip压缩包大小上限
+MAX_ARCHIVE_BYTES = 2 * 1024 * 1024 * 1024
+
+# 各模块在第一次请求时才创建，服务启动时不加载语音相关的重量级依赖
+@lru_cache(maxsize=None)
+def get_asr():
+    from app.core.asr import SpeechRecognizer
+    return SpeechRecognizer()
+
+@lru_cache(maxsize=None)
+def get_tts():
+    from app.core.tts import TextToSpeech
+    return TextToSpeech()
+
+@lru_cache(maxsize=None)
+def get_emotion_analyzer():
+    from app.core.emotion import EmotionAnalyzer
+    return EmotionAnalyzer()
+
+@lru_cache(maxsize=None)
+def get_voice_adjuster():
+    from app.core.voice_adjuster import VoiceAdjuster
+    return VoiceAdjuster()
+
+@lru_cache(maxsize=None)
+def get_emotion_batch_service():
+    from app.services.emotion_batch import EmotionBatchService
+    return EmotionBatchService()
 
 @router.post("/recognize")
 async def recognize_speech():
     """语音识别"""
     try:
         audio_logger.info("开始语音识别")
-        text = asr.recognize_from_microphone()
+        text = get_asr().recognize_from_microphone()
         if not text:
             raise HTTPException(status_code=400, detail="无法识别语音")
         return {"text": text}
@@ -37,6 +61,8 @@ async def synthesize_speech(text: str, emotion: str = "calm"):
             raise HTTPException(status_code=400, detail="文本不能为空")
         
         # 根据情感调整声音参数
+        tts = get_tts()
+        voice_adjuster = get_voice_adjuster()
         voice_params = voice_adjuster.adjust_voice_by_emotion(emotion)
         voice_adjuster.set_voice_parameters(tts, voice_params)
         
@@ -63,7 +89,7 @@ async def analyze_emotion(audio_data: list, sample_rate: int):
         audio_array = np.array(audio_data, dtype=np.float32)
         
         audio_logger.info("开始情感分析")
-        emotion, features = emotion_analyzer.analyze_audio(audio_array, sample_rate)
+        emotion, features = get_emotion_analyzer().analyze_audio(audio_array, sample_rate)
         
         return {"emotion": emotion, "features": features}
     except HTTPException:
@@ -72,6 +98,78 @@ async def analyze_emotion(audio_data: list, sample_rate: int):
         audio_logger.error(f"情感分析失败: {e}")
         raise HTTPException(status_code=500, detail="情感分析失败")
 
+@router.post("/analyze-emotion-batch")
+async def analyze_emotion_batch(directory: str, workers: Optional[int] = None, chunk_size: int = 32,
+                                recursive: bool = True):
+    """批量分析输入目录下某个子目录中所有WAV文件的情感（后台任务，返回任务ID）
+
+    directory为相对服务端输入目录的路径，结果写入服务端的输出目录（见任务的csv_path/npz_path）。
+    """
+    try:
+        service = get_emotion_batch_service()
+        job = service.submit_directory(
+            service.resolve_input_directory(directory), workers=workers, chunk_size=chunk_size, recursive=recursive
+        )
+        audio_logger.info(f"提交批量情感分析任务: {job.job_id}, 目录: {directory}")
+        return job.to_dict()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        audio_logger.error(f"提交批量情感分析任务失败: {e}")
+        raise HTTPException(status_code=500, detail="提交批量情感分析任务失败")
+
+@router.post("/analyze-emotion-batch/archive")
+async def analyze_emotion_archive(request: Request, workers: Optional[int] = None, chunk_size: int = 32):
+    """批量分析上传的zip压缩包（请求体为zip文件内容）中所有WAV文件的情感
+
+    请求体分块写入临时文件，不整体读入内存，文件操作在线程池中执行，不阻塞事件循环；
+    解压在任务线程中进行，压缩包由任务负责删除。
+    """
+    archive_path = None
+    try:
+        size = 0
+        f = await run_in_threadpool(tempfile.NamedTemporaryFile, suffix=".zip", delete=False)
+        archive_path = f.name
+        try:
+            async for chunk in request.stream():
+                size += len(chunk)
+                if size > MAX_ARCHIVE_BYTES:
+                    raise HTTPException(status_code=413, detail="压缩包过大")
+                await run_in_threadpool(f.write, chunk)
+        finally:
+            await run_in_threadpool(f.close)
+        if size == 0:
+            raise HTTPException(status_code=400, detail="压缩包不能为空")
+
+        job = await run_in_threadpool(
+            get_emotion_batch_service().submit_archive, archive_path, workers=workers, chunk_size=chunk_size
+        )
+        archive_path = None
+        audio_logger.info(f"提交批量情感分析任务: {job.job_id}, 压缩包大小: {size} 字节")
+        return job.to_dict()
+    except HTTPException:
+        raise
+    except Exception as e:
+        audio_logger.error(f"提交批量情感分析任务失败: {e}")
+        raise HTTPException(status_code=400, detail=f"无法处理压缩包: {e}")
+    finally:
+        # 提交成功后压缩包归任务所有，只有失败时才在这里删除
+        if archive_path:
+            await run_in_threadpool(os.unlink, archive_path)
+
+@router.get("/analyze-emotion-batch")
+async def list_emotion_batch_jobs():
+    """列出批量情感分析任务"""
+    return {"jobs": get_emotion_batch_service().list_jobs()}
+
+@router.get("/analyze-emotion-batch/{job_id}")
+async def get_emotion_batch_job(job_id: str):
+    """查询批量情感分析任务的进度和结果文件路径"""
+    job = get_emotion_batch_service().get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job.to_dict()
+
 @router.post("/adjust-voice")
 async def adjust_voice(emotion: str, speech_rate: float = 1.0):
     """调整声音参数"""
@@ -79,13 +177,14 @@ async def adjust_voice(emotion: str, speech_rate: float = 1.0):
         audio_logger.info(f"调整声音参数: 情感={emotion}, 语速={speech_rate}")
         
         # 综合调整声音参数
+        voice_adjuster = get_voice_adjuster()
         voice_params = voice_adjuster.adjust_voice_combined(emotion, speech_rate)
-        success = voice_adjuster.set_voice_parameters(tts, voice_params)
+        success = voice_adjuster.set_voice_parameters(get_tts(), voice_params)
         
         if not success:
             raise HTTPException(status_code=500, detail="调整声音参数失败")
         
-        return {"success": True, "params": voice_params}
+        return {"success": True, "params": voice_params.to_dict()}
     except HTTPException:
         raise
     except Exception as e:
@@ -31,3 +31,23 @@ async def update_config(sample_rate: int = None, audio_chunk: int = None, log_le
     except Exception as e:
         app_logger.error(f"更新系统配置失败: {e}")
         raise HTTPException(status_code=500, detail="更新系统配置失败")
+
+@router.get("/events")
+async def get_events():
+    """获取结构化事件的输出策略和统计"""
+    from app.utils.events import get_event_policies, get_event_stats
+    return {"policies": get_event_policies(), "stats": get_event_stats()}
+
+@router.post("/events")
+async def configure_event_policy(pattern: str = "*", enabled: bool = None, sample_rate: float = None,
+                                 rate_limit: float = None, burst: int = None):
+    """运行时调整事件的开关、采样比例和限流（pattern为事件名通配符，如tts.*）"""
+    try:
+        from app.utils.events import configure_events
+        policy = configure_events(pattern, enabled=enabled, sample_rate=sample_rate,
+                                  rate_limit=rate_limit, burst=burst)
+        app_logger.info(f"更新事件策略: {pattern} -> {policy.to_dict()}")
+        return {"success": True, "pattern": pattern, "policy": policy.to_dict()}
+    except Exception as e:
+        app_logger.error(f"更新事件策略失败: {e}")
+        raise HTTPException(status_code=500, detail="更新事件策略失败")
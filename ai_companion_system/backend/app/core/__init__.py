@@ -1,19 +1,17 @@
-from .asr import SpeechRecognizer
-from .tts import TextToSpeech
-from .vad import VoiceActivityDetector
-from .chat import ChatManager, LocalChatModel
-from .interrupt import InterruptDetector, InterruptHandler
-from .emotion import EmotionAnalyzer
-from .voice_adjuster import VoiceAdjuster
+# 应用模块初始化文件
+# 各子模块依赖speech_recognition、pyttsx3、webrtcvad、pyaudio、librosa等重量级库，
+# 这里按需延迟导入，避免import app.core时加载所有依赖
+from app.utils.lazy import lazy_module
 
-__all__ = [
-    "SpeechRecognizer",
-    "TextToSpeech",
-    "VoiceActivityDetector",
-    "ChatManager",
-    "LocalChatModel",
-    "InterruptDetector",
-    "InterruptHandler",
-    "EmotionAnalyzer",
-    "VoiceAdjuster"
-]
+__getattr__, __dir__, __all__ = lazy_module(__name__, {
+    "SpeechRecognizer": ".asr",
+    "TextToSpeech": ".tts",
+    "VoiceActivityDetector": ".vad",
+    "ChatManager": ".chat",
+    "LocalChatModel": ".chat",
+    "InterruptDetector": ".interrupt",
+    "InterruptHandler": ".interrupt",
+    "AudioCaptureService": ".capture",
+    "EmotionAnalyzer": ".emotion",
+    "VoiceAdjuster": ".voice_adjuster"
+})
@@ -1,3 +1,5 @@
+import time
+import numpy as np
 import speech_recognition as sr
 
 class SimpleLogger:
@@ -16,34 +18,81 @@ except Exception:
 class SpeechRecognizer:
     def __init__(self):
         self.recognizer = sr.Recognizer()
-        self.microphone = sr.Microphone()
+        self.rate = 16000
+        self.frame_size = 480  # 30ms
+        self.pause_duration = 0.8
+    
+    def _listen(self, subscription, timeout, phrase_time_limit):
+        """从共享采集流中截取一句话，返回int16字节串；超时未检测到语音时返回None"""
+        frame_seconds = self.frame_size / self.rate
+        
+        # 用前0.5秒估计环境噪音，对应原来的adjust_for_ambient_noise
+        noise = []
+        for _ in range(int(0.5 / frame_seconds)):
+            samples, _ = subscription.read(self.frame_size, timeout=1.0)
+            if samples is None:
+                return None
+            noise.append(np.abs(samples).mean())
+        threshold = max(300.0, float(np.mean(noise)) * 1.5)
+        
+        frames = []
+        started = False
+        silence_time = 0.0
+        speech_time = 0.0
+        wait_start = time.monotonic()
+        
+        while True:
+            samples, _ = subscription.read(self.frame_size, timeout=1.0)
+            if samples is None:
+                break
+            is_speech = np.abs(samples).mean() > threshold
+            
+            if not started:
+                if is_speech:
+                    started = True
+                elif timeout and time.monotonic() - wait_start > timeout:
+                    return None
+                else:
+                    continue
+            
+            frames.append(samples)
+            speech_time += frame_seconds
+            silence_time = 0.0 if is_speech else silence_time + frame_seconds
+            if silence_time >= self.pause_duration:
+                break
+            if phrase_time_limit and speech_time >= phrase_time_limit:
+                break
+        
+        return np.concatenate(frames).tobytes() if frames else None
     
     def recognize_from_microphone(self, timeout=5, phrase_time_limit=10):
         """从麦克风识别语音"""
-        try:
-            with self.microphone as source:
-                # 调整环境噪音
-                self.recognizer.adjust_for_ambient_noise(source, duration=0.5)
-                
-                # 监听语音输入
-                audio = self.recognizer.listen(
-                    source,
-                    timeout=timeout,
-                    phrase_time_limit=phrase_time_limit
-                )
-                
-                # 使用Google Web Speech API识别
-                text = self.recognizer.recognize_google(audio, language="zh-CN")
-                return text
-                
-        except sr.WaitTimeoutError:
+        from app.core.capture import get_capture_service
+        
+        subscription = get_capture_service().subscribe()
+        if subscription is None:
+            audio_logger.error("麦克风采集服务不可用")
             return ""
+        
+        try:
+            # 监听语音输入
+            data = self._listen(subscription, timeout, phrase_time_limit)
+            if not data:
+                return ""
+            audio = sr.AudioData(data, self.rate, 2)
+            
+            # 使用Google Web Speech API识别
+            text = self.recognizer.recognize_google(audio, language="zh-CN")
+            return text
+            
         except sr.UnknownValueError:
             return ""
         except sr.RequestError:
             return ""
         except Exception:
             return ""
+        finally:
+            subscription.close()
     
     def recognize_from_audio_file(self, audio_file):
         """从音频文件识别语音"""
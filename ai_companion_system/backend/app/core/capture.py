@@ -0,0 +1,279 @@
+import threading
+import time
+import numpy as np
+from app.utils.logger import audio_logger
+from app.utils.audio import StreamResampler
+
+
+class AudioRingBuffer:
+    """单写多读的int16环形缓冲区
+
+    写入方（采集回调线程）不加锁：先拷贝数据，再推进全局写位置；
+    读者各自维护读位置，读取后再次检查写位置，若期间被覆盖则视为溢出。
+    位置均为自采集开始以来的样本序号，所有读者共享同一时间轴。
+    """
+
+    def __init__(self, capacity):
+        self._capacity = int(capacity)
+        self._buffer = np.zeros(self._capacity, dtype=np.int16)
+        self._write_pos = 0
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def write_pos(self):
+        return self._write_pos
+
+    def write(self, samples):
+        """写入一段样本（仅允许单个写入线程调用）"""
+        n = len(samples)
+        if n == 0:
+            return
+        if n > self._capacity:
+            samples = samples[-self._capacity:]
+            self._write_pos += n - self._capacity
+            n = self._capacity
+
+        start = self._write_pos % self._capacity
+        first = min(n, self._capacity - start)
+        self._buffer[start:start + first] = samples[:first]
+        if first < n:
+            self._buffer[:n - first] = samples[first:]
+        # 数据写完后再发布新的写位置
+        self._write_pos += n
+
+    def read(self, pos, count):
+        """读取[pos, pos+count)的样本
+
+        返回(samples, pos)，数据尚未写入时samples为None；
+        若pos处的数据已被覆盖，则从仍然有效的最早位置开始读取，返回调整后的pos。
+        """
+        write_pos = self._write_pos
+        if pos < write_pos - self._capacity:
+            pos = write_pos - self._capacity
+        if pos + count > write_pos:
+            return None, pos
+
+        start = pos % self._capacity
+        first = min(count, self._capacity - start)
+        if first == count:
+            out = self._buffer[start:start + count].copy()
+        else:
+            out = np.concatenate((self._buffer[start:], self._buffer[:count - first]))
+
+        # 拷贝期间写入方可能已经追上并覆盖了这段数据
+        if pos < self._write_pos - self._capacity:
+            return self.read(self._write_pos - self._capacity, count)
+        return out, pos
+
+
+class CaptureSubscription:
+    """采集服务的一个读者，按自己的节奏顺序读取音频帧"""
+
+    def __init__(self, service, start_pos):
+        self._service = service
+        self._pos = start_pos
+        self._closed = False
+        self.overruns = 0
+
+    @property
+    def position(self):
+        return self._pos
+
+    @property
+    def rate(self):
+        return self._service.rate
+
+    def read(self, num_samples, timeout=None):
+        """阻塞读取num_samples个int16样本，返回(samples, 起始时间戳)；超时或服务停止时返回(None, None)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        ring = self._service.ring
+
+        while not self._closed:
+            samples, pos = ring.read(self._pos, num_samples)
+            if pos != self._pos:
+                self.overruns += 1
+                audio_logger.warning("音频读者落后，丢弃 %d 个样本", pos - self._pos)
+                self._pos = pos
+            if samples is not None:
+                timestamp = self._service.timestamp_of(self._pos)
+                self._pos += num_samples
+                return samples, timestamp
+
+            if not self._service.is_running():
+                return None, None
+            if deadline is not None and time.monotonic() >= deadline:
+                return None, None
+
+            # 按缺少的样本数估算等待时间，写入方无需唤醒读者
+            missing = self._pos + num_samples - ring.write_pos
+            time.sleep(min(0.02, max(0.002, missing / self._service.rate)))
+
+        return None, None
+
+    def read_bytes(self, num_samples, timeout=None):
+        """读取num_samples个样本并返回int16字节串（与pyaudio stream.read格式一致）"""
+        samples, _ = self.read(num_samples, timeout)
+        return None if samples is None else samples.tobytes()
+
+    def rewind(self, seconds):
+        """回退读位置（用于预录），不会早于缓冲区中最早的有效数据"""
+        ring = self._service.ring
+        earliest = max(0, ring.write_pos - ring.capacity)
+        self._pos = max(earliest, self._pos - int(seconds * self._service.rate))
+
+    def skip_to_latest(self):
+        self._pos = self._service.ring.write_pos
+
+    def close(self):
+        self._closed = True
+        self._service.unsubscribe(self)
+
+
+class AudioCaptureService:
+    """共享麦克风采集服务
+
+    进程内只打开一次输入设备，由一个长期运行的采集回调把16kHz单声道int16帧写入环形缓冲区，
+    录音、打断检测、VAD和情感分析都作为读者订阅，避免每轮对话重复打开/关闭设备和争用设备。
+    设备不支持目标采样率（如只支持44.1/48kHz）时按设备默认采样率采集，在回调中流式重采样。
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self, rate=16000, frames_per_buffer=480, buffer_seconds=30):
+        if hasattr(self, '_initialized') and self._initialized:
+            return
+
+        self._initialized = True
+        self.rate = rate
+        self.channels = 1
+        self.frames_per_buffer = frames_per_buffer
+        self.device_rate = rate
+        self.input_latency = 0.0
+        self._resampler = None
+        self.ring = AudioRingBuffer(rate * buffer_seconds)
+        self._pyaudio = None
+        self._stream = None
+        self._running = False
+        self._base_time = None
+        self._pa_continue = 0
+        self._lock = threading.Lock()
+        self._subscribers = set()
+
+    def _stream_callback(self, in_data, frame_count, time_info, status):
+        samples = np.frombuffer(in_data, dtype=np.int16)
+        if self._resampler is not None:
+            samples = np.clip(np.round(self._resampler.process(samples)), -32768, 32767).astype(np.int16)
+        if self._base_time is None:
+            # 重新启动时样本序号继续累加，时间基准按当前写位置推算；
+            # 扣除输入延迟后时间戳对应声音到达麦克风的时刻，便于与TTS播放时间对齐
+            self._base_time = time.monotonic() - self.input_latency - (self.ring.write_pos + len(samples)) / self.rate
+        self.ring.write(samples)
+        return (None, self._pa_continue)
+
+    def start(self):
+        """打开输入设备并开始采集（已在运行时直接返回）"""
+        with self._lock:
+            if self._running:
+                return True
+            try:
+                import pyaudio
+                if self._pyaudio is None:
+                    self._pyaudio = pyaudio.PyAudio()
+                self._pa_continue = pyaudio.paContinue
+                self.device_rate = self._select_device_rate(pyaudio)
+                self._resampler = StreamResampler(self.device_rate, self.rate) if self.device_rate != self.rate else None
+                self._stream = self._pyaudio.open(
+                    format=pyaudio.paInt16,
+                    channels=self.channels,
+                    rate=self.device_rate,
+                    input=True,
+                    frames_per_buffer=self.frames_per_buffer * self.device_rate // self.rate,
+                    stream_callback=self._stream_callback,
+                    start=False
+                )
+                try:
+                    self.input_latency = self._stream.get_input_latency()
+                except Exception:
+                    self.input_latency = 0.0
+                self._stream.start_stream()
+                self._running = True
+                audio_logger.info(f"麦克风采集服务已启动，采样率: {self.rate}，设备采样率: {self.device_rate}")
+                return True
+            except Exception as e:
+                audio_logger.error(f"启动麦克风采集服务失败: {e}")
+                self._stream = None
+                return False
+
+    def _select_device_rate(self, pyaudio):
+        """优先使用目标采样率，设备不支持时使用默认输入设备的默认采样率"""
+        try:
+            device_index = self._pyaudio.get_default_input_device_info()["index"]
+            self._pyaudio.is_format_supported(self.rate, input_device=device_index,
+                                              input_channels=self.channels, input_format=pyaudio.paInt16)
+            return self.rate
+        except ValueError:
+            device_rate = int(self._pyaudio.get_default_input_device_info()["defaultSampleRate"])
+            audio_logger.warning(f"输入设备不支持{self.rate}Hz，使用{device_rate}Hz采集并重采样")
+            return device_rate
+        except Exception:
+            return self.rate
+
+    def stop(self):
+        """关闭输入设备，所有读者随后读取将返回None"""
+        with self._lock:
+            self._running = False
+            try:
+                if self._stream:
+                    self._stream.stop_stream()
+                    self._stream.close()
+                if self._pyaudio:
+                    self._pyaudio.terminate()
+            except Exception as e:
+                audio_logger.error(f"关闭麦克风采集服务失败: {e}")
+            finally:
+                self._stream = None
+                self._pyaudio = None
+                self._base_time = None
+            audio_logger.info("麦克风采集服务已停止")
+
+    def is_running(self):
+        return self._running
+
+    def subscribe(self, preroll_seconds=0.0):
+        """新增一个读者，从当前位置（减去预录时长）开始读取；服务未启动时自动启动"""
+        if not self._running and not self.start():
+            return None
+        subscription = CaptureSubscription(self, self.ring.write_pos)
+        if preroll_seconds > 0:
+            subscription.rewind(preroll_seconds)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def timestamp_of(self, sample_pos):
+        """样本序号对应的单调时钟时间（time.monotonic，已扣除输入延迟）"""
+        if self._base_time is None:
+            return time.monotonic()
+        return self._base_time + sample_pos / self.rate
+
+
+def get_capture_service():
+    return AudioCaptureService()
@@ -0,0 +1,275 @@
+import threading
+import time
+import numpy as np
+from app.utils.audio import AudioUtils
+
+
+class PlaybackReference:
+    """TTS播放参考信号
+
+    播放端按"声音实际从扬声器发出的时间"发布16kHz单声道样本，
+    回声抑制按麦克风帧的采集时间取出对齐的参考信号；没有播放的时间段读出为0。
+    """
+
+    def __init__(self, rate=16000, buffer_seconds=10):
+        self.rate = rate
+        self._capacity = rate * buffer_seconds
+        self._buffer = np.zeros(self._capacity, dtype=np.float32)
+        self._origin = time.monotonic()
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def _index(self, timestamp):
+        return int(round((timestamp - self._origin) * self.rate))
+
+    def publish(self, samples, timestamp):
+        """发布一段播放样本（[-1, 1]浮点或int16），timestamp为第一个样本的发声时间"""
+        samples = AudioUtils.to_float32(samples)[-self._capacity:]
+        start = self._index(timestamp)
+        with self._lock:
+            # 与上一段之间的空隙清零，避免读到上一轮播放残留的数据
+            if start > self._end:
+                gap = np.arange(self._end, min(start, self._end + self._capacity))
+                self._buffer[gap % self._capacity] = 0.0
+            positions = np.arange(start, start + len(samples))
+            self._buffer[positions % self._capacity] = samples
+            self._end = max(self._end, start + len(samples))
+
+    def read(self, timestamp, count):
+        """读取从timestamp开始的count个参考样本"""
+        start = self._index(timestamp)
+        positions = np.arange(start, start + count)
+        with self._lock:
+            valid = (positions < self._end) & (positions >= self._end - self._capacity)
+            out = np.zeros(count, dtype=np.float32)
+            out[valid] = self._buffer[positions[valid] % self._capacity]
+        return out
+
+    def is_active(self, timestamp=None, tail=0.5):
+        """timestamp前tail秒内是否有播放数据"""
+        timestamp = timestamp or time.monotonic()
+        return self._index(timestamp - tail) < self._end
+
+
+class NLMSFilter:
+    """分块NLMS自适应滤波器
+
+    每块先用当前系数估计回声并相减，再用整块的归一化梯度一次性更新系数，
+    块内运算均为矩阵运算（滑动窗口视图 + 矩阵向量乘），适合在音频线程中实时运行。
+    """
+
+    def __init__(self, taps=512, step=0.5, eps=1e-6):
+        self.taps = taps
+        self.step = step
+        self.eps = eps
+        self.reset()
+
+    def reset(self):
+        self.weights = np.zeros(self.taps, dtype=np.float32)
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+
+    def is_idle(self):
+        """滤波器历史中没有任何参考信号"""
+        return not np.any(self._history)
+
+    def filter(self, reference):
+        """返回回声估计和本块的参考矩阵（每行为当前及之前taps-1个参考样本，按时间倒序）"""
+        x = np.concatenate((self._history, reference))
+        self._history = x[len(reference):]
+        matrix = np.lib.stride_tricks.sliding_window_view(x, self.taps)[:, ::-1]
+        return matrix @ self.weights, matrix
+
+    def adapt(self, matrix, error):
+        power = float(np.mean(matrix[:, 0] ** 2)) * self.taps
+        self.weights += (self.step / len(error)) * (error @ matrix) / (power + self.eps)
+
+
+class DelayEstimator:
+    """扬声器到麦克风的整体延迟估计
+
+    播放期间累计最近window_ms的麦克风信号，定期与同一时间段（向前多取max_delay_ms）的参考信号做
+    GCC-PHAT互相关，取峰值位置为延迟；峰值明显高于其余延迟（peak_ratio）且连续两次估计一致时才采用。
+    """
+
+    def __init__(self, rate=16000, max_delay_ms=250, window_ms=1000, interval_ms=300, peak_ratio=6.0):
+        self.rate = rate
+        self.max_delay = int(rate * max_delay_ms / 1000)
+        self.window = int(rate * window_ms / 1000)
+        self.interval = int(rate * interval_ms / 1000)
+        self.peak_ratio = peak_ratio
+        self.reset()
+
+    def reset(self):
+        self._mic = np.zeros(0, dtype=np.float32)
+        self._start = None
+        self._next = None
+        self._since_update = 0
+        self._candidate = None
+        self.delay_samples = None
+
+    def push(self, mic, timestamp, reference):
+        """追加一帧麦克风信号（timestamp为首样本采集时间），有新的稳定估计时返回延迟样本数"""
+        # 采集时间不连续（丢帧、停止后重新开始）时重新累计
+        if self._next is None or abs(timestamp - self._next) * self.rate > len(mic):
+            self._mic = np.zeros(0, dtype=np.float32)
+            self._start = timestamp
+        self._mic = np.concatenate((self._mic, mic))[-self.window:]
+        self._next = timestamp + len(mic) / self.rate
+        self._start = self._next - len(self._mic) / self.rate
+        self._since_update += len(mic)
+
+        if len(self._mic) < self.window or self._since_update < self.interval:
+            return None
+        self._since_update = 0
+
+        ref = reference.read(self._start - self.max_delay / self.rate, self.window + self.max_delay)
+        if float(np.mean(ref * ref)) < 1e-6 or float(np.mean(self._mic * self._mic)) < 1e-8:
+            return None
+
+        lag = self._estimate(self._mic, ref)
+        if lag is None:
+            self._candidate = None
+            return None
+        if self._candidate is not None and abs(lag - self._candidate) <= 2:
+            self.delay_samples = lag
+            return lag
+        self._candidate = lag
+        return None
+
+    def _estimate(self, mic, ref):
+        n = len(mic) + len(ref)
+        nfft = 1 << (n - 1).bit_length()
+        cross = np.conj(np.fft.rfft(mic, nfft)) * np.fft.rfft(ref, nfft)
+        cross /= np.abs(cross) + 1e-12
+        # corr[j] = sum(mic[k] * ref[k + j])，ref比mic早max_delay个样本开始，延迟 = max_delay - j
+        corr = np.abs(np.fft.irfft(cross, nfft)[:self.max_delay + 1])
+        peak = int(np.argmax(corr))
+        if corr[peak] < self.peak_ratio * float(np.mean(corr)):
+            return None
+        return self.max_delay - peak
+
+
+class EchoSuppressor:
+    """基于TTS参考信号的回声抑制
+
+    从麦克风帧中减去NLMS估计的扬声器回声，再送入VAD和打断检测。
+    NLMS只覆盖taps个样本（512点为32ms），扬声器到麦克风的整体延迟由DelayEstimator估计后
+    先对齐参考信号，滤波器只需建模房间冲激响应；延迟变化时重新收敛。
+    双讲（用户与TTS同时说话）时残差能量突增，此时冻结系数更新，避免滤波器发散；
+    双讲期间残差基线仍缓慢跟随，且连续判为双讲超过double_talk_hold_ms时视为回声路径变化（音量、位置改变），
+    以当前残差为新基线恢复自适应，不会一直冻结；
+    残差能量高于麦克风能量（未收敛或失配，ERLE < 0）时直接输出原始麦克风信号，不放大回声。
+    """
+
+    def __init__(self, rate=16000, taps=512, step=0.5, delay_ms=0, reference=None, auto_delay=True,
+                 max_delay_ms=250, delay_margin_ms=2, double_talk_hold_ms=600):
+        self.rate = rate
+        self.delay = delay_ms / 1000
+        self.reference = reference or get_playback_reference()
+        self.filter = NLMSFilter(taps=taps, step=step)
+        self.delay_estimator = DelayEstimator(rate, max_delay_ms=max_delay_ms) if auto_delay else None
+        # 对齐时留出一点提前量，使冲激响应的起点落在滤波器窗口内
+        self.delay_margin = delay_margin_ms / 1000
+        self.last_reference = None
+        self._mic_energy = 0.0
+        self._residual_energy = 0.0
+        self.erle_db = 0.0
+        self.double_talk = False
+        self.double_talk_hold = int(rate * double_talk_hold_ms / 1000)
+        self._double_talk_samples = 0
+        self._reset_pending = False
+        self.bypassed_frames = 0
+
+    def reset(self):
+        """清空滤波器和能量统计（每次播放开始、延迟变化时调用），已估计的延迟保留"""
+        self.filter.reset()
+        self._mic_energy = 0.0
+        self._residual_energy = 0.0
+        self.erle_db = 0.0
+        self.double_talk = False
+        self._double_talk_samples = 0
+
+    def schedule_reset(self):
+        """其他线程（如TTS播放开始时）请求重置，在处理下一帧时于音频线程中执行"""
+        self._reset_pending = True
+
+    def _update_delay(self, mic, timestamp):
+        lag = self.delay_estimator.push(mic, timestamp, self.reference)
+        if lag is None:
+            return
+        delay = max(0.0, lag / self.rate - self.delay_margin)
+        # 延迟变化超过1ms才重新对齐，对齐后滤波器系数作废
+        if abs(delay - self.delay) * 1000 > 1.0:
+            self.delay = delay
+            self.reset()
+
+    def process(self, frame, timestamp=None):
+        """处理一帧int16麦克风音频，返回抑制回声后的int16数组"""
+        timestamp = timestamp or time.monotonic()
+        mic = AudioUtils.to_float32(frame)
+        if self._reset_pending:
+            self._reset_pending = False
+            self.reset()
+        if self.delay_estimator is not None and not self.double_talk:
+            self._update_delay(mic, timestamp)
+        reference = self.reference.read(timestamp - self.delay, len(mic))
+        self.last_reference = reference
+
+        if not np.any(reference) and self.filter.is_idle():
+            return AudioUtils.to_int16(frame)
+
+        echo, matrix = self.filter.filter(reference)
+        error = mic - echo
+
+        mic_energy = float(np.mean(mic * mic))
+        residual_energy = float(np.mean(error * error))
+        converged = self.erle_db > 6.0
+        # 已收敛后本帧的回声抑制量比平均值低6dB以上，认为近端有人说话（双讲）；
+        # 按本帧麦克风能量归一化，不受TTS音节起伏影响，音节间隙（能量很低的帧）不参与判断
+        frame_erle = 10 * np.log10(max(mic_energy, 1e-12) / max(residual_energy, 1e-12))
+        self.double_talk = (converged and mic_energy > 0.1 * self._mic_energy
+                            and frame_erle < self.erle_db - 6.0)
+        if self.double_talk:
+            self._double_talk_samples += len(mic)
+            if self._double_talk_samples > self.double_talk_hold:
+                # 持续时间远超一次插话，按回声路径变化处理：以当前残差为基线重新自适应
+                self.double_talk = False
+                self._double_talk_samples = 0
+                self._residual_energy = residual_energy
+        else:
+            self._double_talk_samples = 0
+        if not self.double_talk and np.any(reference):
+            self.filter.adapt(matrix, error)
+
+        self._mic_energy += 0.1 * (mic_energy - self._mic_energy)
+        # 双讲期间基线只缓慢跟随，避免近端语音把基线抬高，又不至于永远停留在旧值
+        self._residual_energy += (0.01 if self.double_talk else 0.1) * (residual_energy - self._residual_energy)
+        if self._mic_energy > 0 and self._residual_energy > 0:
+            self.erle_db = 10 * np.log10(self._mic_energy / self._residual_energy)
+
+        if residual_energy > mic_energy:
+            self.bypassed_frames += 1
+            return AudioUtils.to_int16(frame)
+        return AudioUtils.to_int16(error)
+
+    def get_stats(self):
+        return {
+            "erle_db": float(self.erle_db),
+            "double_talk": self.double_talk,
+            "taps": self.filter.taps,
+            "delay_ms": self.delay * 1000,
+            "bypassed_frames": self.bypassed_frames
+        }
+
+
+_playback_reference = None
+_playback_reference_lock = threading.Lock()
+
+
+def get_playback_reference():
+    global _playback_reference
+    if _playback_reference is None:
+        with _playback_reference_lock:
+            if _playback_reference is None:
+                _playback_reference = PlaybackReference()
+    return _playback_reference
@@ -1,9 +1,10 @@
-import librosa
-import numpy as np
+import logging
 from app.utils.logger import emotion_logger
+from app.core.emotion_features import extract_emotion_features, StreamingEmotionAccumulator
+from app.core.emotion_classifier import load_classifier
 
 class EmotionAnalyzer:
-    def __init__(self):
+    def __init__(self, classifier=None):
         # 情感分类映射
         self.emotions = {
             "happy": "开心",
@@ -13,41 +14,26 @@ class EmotionAnalyzer:
             "calm": "平静",
             "surprised": "惊讶"
         }
-        emotion_logger.info("情感分析器初始化成功")
+        # 文本情感关键词
+        self.text_keywords = {
+            "happy": ["开心", "高兴", "快乐", "兴奋", "喜悦", "满意", "喜欢"],
+            "sad": ["难过", "伤心", "悲伤"],
+            "angry": ["愤怒", "生气"],
+            "anxious": ["焦虑", "担心", "害怕"],
+            "surprised": ["惊讶", "震惊", "意外", "没想到"]
+        }
+        # 可插拔的分类器：默认加载训练好的numpy模型，没有模型文件时使用阈值规则
+        self.classifier = classifier or load_classifier()
+        emotion_logger.info(f"情感分析器初始化成功，分类器: {self.classifier.name}")
     
     def extract_features(self, audio_data, sample_rate):
         """提取音频情感特征"""
         try:
-            # 计算基频
-            f0, _ = librosa.piptrack(y=audio_data, sr=sample_rate)
-            f0 = f0[f0 > 0]
-            
-            # 计算能量
-            energy = librosa.feature.rms(y=audio_data)[0]
-            
-            # 提取频谱特征
-            spectral_centroid = librosa.feature.spectral_centroid(y=audio_data, sr=sample_rate)[0]
-            spectral_bandwidth = librosa.feature.spectral_bandwidth(y=audio_data, sr=sample_rate)[0]
-            
-            # 提取语速特征（简化处理）
-            speech_rate = len(audio_data) / sample_rate
-            
-            # 提取零交叉率
-            zero_crossing_rate = librosa.feature.zero_crossing_rate(y=audio_data)[0]
-            
-            features = {
-                'f0_mean': np.mean(f0) if len(f0) > 0 else 0,
-                'f0_std': np.std(f0) if len(f0) > 0 else 0,
-                'f0_max': np.max(f0) if len(f0) > 0 else 0,
-                'f0_min': np.min(f0) if len(f0) > 0 else 0,
-                'energy_mean': np.mean(energy),
-                'energy_std': np.std(energy),
-                'energy_max': np.max(energy),
-                'spectral_centroid': np.mean(spectral_centroid),
-                'spectral_bandwidth': np.mean(spectral_bandwidth),
-                'zero_crossing_rate': np.mean(zero_crossing_rate),
-                'speech_rate': speech_rate
-            }
+            # 一次STFT同时得到基频、能量、频谱质心/带宽和过零率
+            features = extract_emotion_features(audio_data, sample_rate)
+            if not features:
+                emotion_logger.warning("音频为空，无法提取情感特征")
+                return {}
             
             emotion_logger.info("成功提取音频情感特征")
             return features
@@ -55,6 +41,14 @@ class EmotionAnalyzer:
             emotion_logger.error(f"提取音频情感特征失败: {e}")
             return {}
     
+    def _classify(self, features):
+        return self.classifier.predict(features)
+    
+    def set_classifier(self, classifier):
+        """替换情感分类器（需实现EmotionClassifier接口）"""
+        self.classifier = classifier
+        emotion_logger.info(f"情感分类器已切换为: {classifier.name}")
+    
     def recognize_emotion(self, features):
         """识别情感"""
         try:
@@ -62,33 +56,36 @@ class EmotionAnalyzer:
                 emotion_logger.warning("特征为空，返回默认情感")
                 return "calm"
             
-            # 基于特征的简单情感分类（实际应用中应使用机器学习模型）
-            
-            # 开心：高基频，高能量，快速语速
-            if features['energy_mean'] > 0.1 and features['f0_std'] > 50 and features['speech_rate'] > 0.5:
-                emotion = "happy"
-            # 难过：低基频，低能量，慢速语速
-            elif features['energy_mean'] < 0.05 and features['f0_mean'] < 150 and features['speech_rate'] < 0.3:
-                emotion = "sad"
-            # 愤怒：高基频，高能量，快速语速
-            elif features['energy_mean'] > 0.15 and features['f0_mean'] > 200 and features['speech_rate'] > 0.6:
-                emotion = "angry"
-            # 焦虑：高基频变化，中等能量
-            elif features['f0_std'] > 80 and features['energy_mean'] > 0.08 and features['energy_std'] > 0.05:
-                emotion = "anxious"
-            # 惊讶：高基频，能量突然增加
-            elif features['f0_max'] > 250 and features['energy_max'] > 0.2:
-                emotion = "surprised"
-            # 平静：中等基频，稳定能量
-            else:
-                emotion = "calm"
+            emotion = self._classify(features)
             
-            emotion_logger.info(f"识别到情感: {self.emotions.get(emotion, emotion)}")
+            emotion_logger.info("识别到情感: %s", self.emotions.get(emotion, emotion))
             return emotion
         except Exception as e:
             emotion_logger.error(f"识别情感失败: {e}")
             return "calm"
     
+    def create_stream_accumulator(self, sample_rate=16000, window_seconds=3.0, trend_interval=1.0):
+        """创建录音过程中逐帧累计特征的累加器，走势点按滑动窗口分类"""
+        return StreamingEmotionAccumulator(
+            sample_rate,
+            window_seconds=window_seconds,
+            trend_interval=trend_interval,
+            classify=lambda features: self._classify(features) if features else "calm"
+        )
+    
+    def finish_stream(self, accumulator):
+        """读取累加器中已就绪的特征并识别情感，返回(情感, 特征)"""
+        try:
+            features = accumulator.features()
+            emotion = self.recognize_emotion(features)
+            if len(accumulator.trend) > 1 and emotion_logger.isEnabledFor(logging.INFO):
+                trend = " -> ".join(self.emotions.get(e, e) for _, e in accumulator.trend)
+                emotion_logger.info("情感走势: %s", trend)
+            return emotion, features
+        except Exception as e:
+            emotion_logger.error(f"流式情感分析失败: {e}")
+            return "calm", {}
+    
     def analyze_audio(self, audio_data, sample_rate):
         """分析音频情感"""
         try:
@@ -103,17 +100,34 @@ class EmotionAnalyzer:
             emotion_logger.error(f"分析音频情感失败: {e}")
             return "calm", {}
     
+    def analyze_batch(self, audio_list, sample_rate):
+        """批量分析多段音频，特征逐段提取后一次性分类，返回[(情感, 特征), ...]"""
+        try:
+            features_list = [extract_emotion_features(audio, sample_rate) for audio in audio_list]
+            emotions = self.classifier.predict_many(features_list)
+            return [(emotion if features else "calm", features)
+                    for emotion, features in zip(emotions, features_list)]
+        except Exception as e:
+            emotion_logger.error(f"批量分析音频情感失败: {e}")
+            return [("calm", {}) for _ in audio_list]
+    
+    def text_scores(self, text):
+        """统计文本中各情感关键词的命中次数，返回{情感: 次数}（只包含命中的情感）"""
+        scores = {}
+        for emotion, words in self.text_keywords.items():
+            count = sum(1 for word in words if word in text)
+            if count:
+                scores[emotion] = count
+        return scores
+    
     def analyze_text(self, text):
         """分析文本情感（简化版）"""
         try:
             # 关键词匹配
-            positive_words = ["开心", "高兴", "快乐", "兴奋", "喜悦", "满意", "喜欢"]
-            negative_words = ["难过", "伤心", "悲伤", "愤怒", "生气", "焦虑", "担心", "害怕"]
-            surprised_words = ["惊讶", "震惊", "意外", "没想到"]
-            
-            positive_count = sum(1 for word in positive_words if word in text)
-            negative_count = sum(1 for word in negative_words if word in text)
-            surprised_count = sum(1 for word in surprised_words if word in text)
+            scores = self.text_scores(text)
+            positive_count = scores.get("happy", 0)
+            negative_count = scores.get("sad", 0) + scores.get("angry", 0) + scores.get("anxious", 0)
+            surprised_count = scores.get("surprised", 0)
             
             if surprised_count > 0:
                 emotion = "surprised"
@@ -121,16 +135,14 @@ class EmotionAnalyzer:
                 emotion = "happy"
             elif negative_count > positive_count:
                 # 根据具体词语判断是难过还是愤怒
-                angry_words = ["愤怒", "生气"]
-                angry_count = sum(1 for word in angry_words if word in text)
-                if angry_count > 0:
+                if scores.get("angry", 0) > 0:
                     emotion = "angry"
                 else:
                     emotion = "sad"
             else:
                 emotion = "calm"
             
-            emotion_logger.info(f"文本情感分析结果: {self.emotions.get(emotion, emotion)}")
+            emotion_logger.info("文本情感分析结果: %s", self.emotions.get(emotion, emotion))
             return emotion
         except Exception as e:
             emotion_logger.error(f"分析文本情感失败: {e}")
@@ -0,0 +1,218 @@
+import os
+from abc import ABC, abstractmethod
+import numpy as np
+from app.utils.logger import emotion_logger
+from app.core.emotion_features import FEATURE_KEYS
+
+EMOTION_LABELS = ("happy", "sad", "angry", "anxious", "calm", "surprised")
+
+DEFAULT_MODEL_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))),
+    "model_cache", "emotion_classifier.npz"
+)
+
+
+def features_to_matrix(features_list, feature_keys=FEATURE_KEYS):
+    """特征字典列表 -> (n, len(feature_keys))的float32矩阵，缺失的键按0处理"""
+    matrix = np.zeros((len(features_list), len(feature_keys)), dtype=np.float32)
+    for i, features in enumerate(features_list):
+        if features:
+            matrix[i] = [features.get(key, 0.0) for key in feature_keys]
+    return matrix
+
+
+class EmotionClassifier(ABC):
+    """情感分类器接口
+
+    子类实现predict_batch（特征矩阵 -> 标签列表）；predict为单条特征字典的便捷封装。
+    """
+    name = "base"
+    labels = EMOTION_LABELS
+    feature_keys = FEATURE_KEYS
+
+    @abstractmethod
+    def predict_batch(self, matrix):
+        """(n, len(feature_keys))的特征矩阵 -> n个情感标签"""
+
+    def predict(self, features):
+        if not features:
+            return "calm"
+        return self.predict_batch(features_to_matrix([features], self.feature_keys))[0]
+
+    def predict_many(self, features_list):
+        """批量分类多条音频的特征字典"""
+        if not features_list:
+            return []
+        return self.predict_batch(features_to_matrix(features_list, self.feature_keys))
+
+
+class ThresholdEmotionClassifier(EmotionClassifier):
+    """基于人工阈值的规则分类（没有训练好的模型时使用）"""
+    name = "threshold"
+
+    def predict_batch(self, matrix):
+        column = {key: matrix[:, i] for i, key in enumerate(self.feature_keys)}
+        energy_mean, energy_std, energy_max = column['energy_mean'], column['energy_std'], column['energy_max']
+        f0_mean, f0_std, f0_max = column['f0_mean'], column['f0_std'], column['f0_max']
+        speech_rate = column['speech_rate']
+
+        # 条件按优先级排列，与逐条if判断的结果一致
+        conditions = [
+            # 开心：高基频，高能量，快速语速
+            (energy_mean > 0.1) & (f0_std > 50) & (speech_rate > 0.5),
+            # 难过：低基频，低能量，慢速语速
+            (energy_mean < 0.05) & (f0_mean < 150) & (speech_rate < 0.3),
+            # 愤怒：高基频，高能量，快速语速
+            (energy_mean > 0.15) & (f0_mean > 200) & (speech_rate > 0.6),
+            # 焦虑：高基频变化，中等能量
+            (f0_std > 80) & (energy_mean > 0.08) & (energy_std > 0.05),
+            # 惊讶：高基频，能量突然增加
+            (f0_max > 250) & (energy_max > 0.2),
+        ]
+        # 平静：中等基频，稳定能量
+        labels = np.select(conditions, ["happy", "sad", "angry", "anxious", "surprised"], default="calm")
+        return labels.tolist()
+
+
+class NumpyEmotionClassifier(EmotionClassifier):
+    """纯numpy的小型分类器：标准化 + 若干ReLU隐层 + softmax
+
+    没有隐层时即多分类逻辑回归。参数保存在一个.npz文件中（float32，通常只有几KB），
+    推理只有几次矩阵乘法，单条音频远低于1毫秒。
+    """
+    name = "numpy"
+
+    def __init__(self, labels, feature_keys, mean, scale, layers):
+        self.labels = tuple(labels)
+        self.feature_keys = tuple(feature_keys)
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.scale = np.asarray(scale, dtype=np.float32)
+        self.layers = [(np.asarray(w, dtype=np.float32), np.asarray(b, dtype=np.float32)) for w, b in layers]
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            num_layers = int(data["num_layers"])
+            layers = [(data[f"w{i}"], data[f"b{i}"]) for i in range(num_layers)]
+            return cls(data["labels"].tolist(), data["feature_keys"].tolist(),
+                       data["mean"], data["scale"], layers)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        arrays = {f"w{i}": w for i, (w, _) in enumerate(self.layers)}
+        arrays.update({f"b{i}": b for i, (_, b) in enumerate(self.layers)})
+        np.savez_compressed(
+            path,
+            labels=np.array(self.labels),
+            feature_keys=np.array(self.feature_keys),
+            mean=self.mean,
+            scale=self.scale,
+            num_layers=np.array(len(self.layers)),
+            **arrays
+        )
+
+    def _forward(self, matrix):
+        """返回每层的激活值，最后一项为logits"""
+        activations = [(matrix - self.mean) / self.scale]
+        for i, (weight, bias) in enumerate(self.layers):
+            out = activations[-1] @ weight + bias
+            if i < len(self.layers) - 1:
+                out = np.maximum(out, 0.0)
+            activations.append(out)
+        return activations
+
+    def predict_proba_batch(self, matrix):
+        logits = self._forward(np.asarray(matrix, dtype=np.float32))[-1]
+        logits = logits - logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def predict_batch(self, matrix):
+        logits = self._forward(np.asarray(matrix, dtype=np.float32))[-1]
+        return [self.labels[i] for i in np.argmax(logits, axis=1)]
+
+    @classmethod
+    def fit(cls, matrix, labels, hidden_sizes=(), epochs=500, learning_rate=0.01, l2=1e-4,
+            label_set=None, feature_keys=FEATURE_KEYS, seed=0):
+        """全批量Adam训练，返回训练好的分类器
+
+        hidden_sizes为空时训练逻辑回归，如(16,)为一个16单元隐层的MLP；类别按样本数加权以缓解不均衡。
+        """
+        rng = np.random.default_rng(seed)
+        matrix = np.asarray(matrix, dtype=np.float64)
+        label_set = tuple(label_set or sorted(set(labels)))
+        index = {label: i for i, label in enumerate(label_set)}
+        targets = np.array([index[label] for label in labels])
+        onehot = np.eye(len(label_set))[targets]
+        counts = np.maximum(np.bincount(targets, minlength=len(label_set)), 1)
+        sample_weight = (len(targets) / (len(label_set) * counts))[targets][:, None]
+
+        mean = matrix.mean(axis=0)
+        scale = matrix.std(axis=0)
+        scale[scale < 1e-8] = 1.0
+        x = (matrix - mean) / scale
+
+        sizes = [x.shape[1], *hidden_sizes, len(label_set)]
+        params = []
+        for fan_in, fan_out in zip(sizes[:-1], sizes[1:]):
+            params.append(rng.normal(0.0, np.sqrt(2.0 / fan_in), (fan_in, fan_out)))
+            params.append(np.zeros(fan_out))
+        moments = [np.zeros_like(p) for p in params]
+        velocities = [np.zeros_like(p) for p in params]
+        beta1, beta2 = 0.9, 0.999
+
+        for step in range(1, epochs + 1):
+            activations = [x]
+            for i in range(0, len(params), 2):
+                out = activations[-1] @ params[i] + params[i + 1]
+                if i < len(params) - 2:
+                    out = np.maximum(out, 0.0)
+                activations.append(out)
+
+            logits = activations[-1] - activations[-1].max(axis=1, keepdims=True)
+            probs = np.exp(logits)
+            probs /= probs.sum(axis=1, keepdims=True)
+            delta = (probs - onehot) * sample_weight / len(x)
+
+            grads = [None] * len(params)
+            for i in range(len(params) - 2, -1, -2):
+                grads[i] = activations[i // 2].T @ delta + l2 * params[i]
+                grads[i + 1] = delta.sum(axis=0)
+                if i > 0:
+                    delta = (delta @ params[i].T) * (activations[i // 2] > 0)
+
+            for i, grad in enumerate(grads):
+                moments[i] = beta1 * moments[i] + (1 - beta1) * grad
+                velocities[i] = beta2 * velocities[i] + (1 - beta2) * grad * grad
+                m_hat = moments[i] / (1 - beta1 ** step)
+                v_hat = velocities[i] / (1 - beta2 ** step)
+                params[i] -= learning_rate * m_hat / (np.sqrt(v_hat) + 1e-8)
+
+        layers = [(params[i], params[i + 1]) for i in range(0, len(params), 2)]
+        return cls(label_set, feature_keys, mean, scale, layers)
+
+
+def evaluate(classifier, matrix, labels):
+    """返回准确率和混淆矩阵（行为真实标签，列为预测标签，顺序同classifier.labels）"""
+    predictions = classifier.predict_batch(matrix)
+    label_set = list(classifier.labels)
+    index = {label: i for i, label in enumerate(label_set)}
+    confusion = np.zeros((len(label_set), len(label_set)), dtype=np.int64)
+    for truth, pred in zip(labels, predictions):
+        if truth in index and pred in index:
+            confusion[index[truth], index[pred]] += 1
+    accuracy = float(np.mean([t == p for t, p in zip(labels, predictions)])) if len(labels) else 0.0
+    return accuracy, confusion
+
+
+def load_classifier(path=None):
+    """加载情感分类器：模型文件存在时使用numpy模型，否则回退到阈值规则"""
+    path = path or DEFAULT_MODEL_PATH
+    if os.path.exists(path):
+        try:
+            classifier = NumpyEmotionClassifier.load(path)
+            emotion_logger.info(f"已加载情感分类模型: {path}")
+            return classifier
+        except Exception as e:
+            emotion_logger.error(f"加载情感分类模型失败，使用阈值规则: {e}")
+    return ThresholdEmotionClassifier()
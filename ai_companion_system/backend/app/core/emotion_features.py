@@ -0,0 +1,321 @@
+from collections import deque
+from functools import lru_cache
+import numpy as np
+from app.utils.audio import AudioUtils
+
+FEATURE_KEYS = (
+    'f0_mean', 'f0_std', 'f0_max', 'f0_min',
+    'energy_mean', 'energy_std', 'energy_max',
+    'spectral_centroid', 'spectral_bandwidth',
+    'zero_crossing_rate', 'speech_rate', 'syllable_rate'
+)
+
+
+# 基频只需要低频段：自相关只用0~sample_rate/(2*PITCH_DECIMATION)的功率谱计算，
+# 相当于在低通、降采样后的信号上求自相关，反变换长度缩短为n_fft/PITCH_DECIMATION
+PITCH_DECIMATION = 4
+
+
+@lru_cache(maxsize=8)
+def _get_analysis_window(frame_length, n_fft):
+    """汉宁窗及其（降采样后的）归一化自相关，用于消除加窗对自相关的衰减"""
+    window = np.hanning(frame_length).astype(np.float32)
+    band = n_fft // (2 * PITCH_DECIMATION)
+    power = np.abs(np.fft.rfft(window, n=n_fft)[:band + 1]) ** 2
+    window_acf = np.fft.irfft(power, n=2 * band)
+    window_acf = (window_acf / window_acf[0]).astype(np.float32)
+    window.flags.writeable = False
+    window_acf.flags.writeable = False
+    return window, window_acf
+
+
+def frame_signal(audio, frame_length, hop_length):
+    """居中补零后分帧，返回(n_frames, frame_length)的零拷贝视图"""
+    pad = frame_length // 2
+    padded = np.pad(audio, (pad, pad))
+    if len(padded) < frame_length:
+        padded = np.pad(padded, (0, frame_length - len(padded)))
+    return np.lib.stride_tricks.sliding_window_view(padded, frame_length)[::hop_length]
+
+
+def track_pitch(power, sample_rate, frame_energy, n_fft, frame_length, fmin=70.0, fmax=500.0,
+                voicing_threshold=0.45, silence_ratio=0.05, octave_ratio=0.85, energy_ref=None):
+    """由功率谱逐帧计算自相关（维纳-辛钦），在[fmin, fmax]对应的延迟范围内找峰值估计基频
+
+    能量低于energy_ref（默认为这些帧的最大能量）silence_ratio倍的帧视为静音；返回每帧基频，清音/静音帧为0
+    """
+    _, window_acf = _get_analysis_window(frame_length, n_fft)
+    band = n_fft // (2 * PITCH_DECIMATION)
+    acf_rate = sample_rate / PITCH_DECIMATION
+    min_lag = max(2, int(acf_rate / fmax))
+    max_lag = min(band - 2, int(acf_rate / fmin))
+
+    acf = np.fft.irfft(power[:, :band + 1], n=2 * band, axis=1)[:, :max_lag + 2]
+    energy0 = acf[:, :1]
+    acf = acf / np.maximum(energy0, 1e-12) / np.maximum(window_acf[:max_lag + 2], 1e-3)
+
+    # 取不低于最大峰值octave_ratio倍的第一个局部峰，避免选中周期整数倍处的峰（倍频程错误）
+    search = acf[:, min_lag:max_lag + 1]
+    is_peak = (search >= acf[:, min_lag - 1:max_lag]) & (search >= acf[:, min_lag + 1:max_lag + 2])
+    candidates = is_peak & (search >= octave_ratio * np.max(search, axis=1, keepdims=True))
+    lag = np.where(candidates.any(axis=1), np.argmax(candidates, axis=1), np.argmax(search, axis=1)) + min_lag
+    rows = np.arange(len(acf))
+    peak = acf[rows, lag]
+
+    # 抛物线插值得到亚样本精度的延迟
+    left, right = acf[rows, lag - 1], acf[rows, lag + 1]
+    denom = left - 2 * peak + right
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shift = np.where(np.abs(denom) > 1e-9, 0.5 * (left - right) / denom, 0.0)
+    refined = lag + np.clip(shift, -0.5, 0.5)
+
+    if energy_ref is None:
+        energy_ref = np.max(frame_energy)
+    voiced = (peak > voicing_threshold) & (frame_energy > silence_ratio * energy_ref)
+    return np.where(voiced, acf_rate / refined, 0.0)
+
+
+def _analyze_frames(frames, sample_rate, n_fft, energy_ref=None):
+    """逐帧计算(基频, 能量, 频谱质心, 频谱带宽, 过零率)，返回(n_frames, 5)数组
+
+    energy_ref为清音/静音判定的能量参考（默认取这些帧的最大能量），基频为0表示该帧无声。
+    """
+    frame_length = frames.shape[1]
+    window, _ = _get_analysis_window(frame_length, n_fft)
+
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    zcr = np.count_nonzero(np.diff(np.signbit(frames), axis=1), axis=1) / frame_length
+
+    spectrum = np.fft.rfft(frames * window, n=n_fft, axis=1)
+    power = spectrum.real ** 2 + spectrum.imag ** 2
+    magnitude = np.sqrt(power)
+    freqs = np.fft.rfftfreq(n_fft, 1.0 / sample_rate)
+
+    weight = np.maximum(magnitude.sum(axis=1), 1e-10)
+    centroid = magnitude @ freqs / weight
+    bandwidth = np.sqrt(np.sum(magnitude * (freqs[None, :] - centroid[:, None]) ** 2, axis=1) / weight)
+
+    f0 = track_pitch(power, sample_rate, rms, n_fft, frame_length, energy_ref=energy_ref)
+    return np.column_stack((f0, rms, centroid, bandwidth, zcr))
+
+
+def _count_onsets(voiced, previous=False):
+    """清音/静音 -> 有声的跳变次数，近似为音节数"""
+    if len(voiced) == 0:
+        return 0
+    return int(np.count_nonzero(voiced[1:] & ~voiced[:-1])) + int(voiced[0] and not previous)
+
+
+def _summarize(rows, duration):
+    """由逐帧特征行汇总成与extract_emotion_features相同的特征字典"""
+    f0 = rows[:, 0][rows[:, 0] > 0]
+    energy = rows[:, 1]
+    return {
+        'f0_mean': float(np.mean(f0)) if len(f0) > 0 else 0,
+        'f0_std': float(np.std(f0)) if len(f0) > 0 else 0,
+        'f0_max': float(np.max(f0)) if len(f0) > 0 else 0,
+        'f0_min': float(np.min(f0)) if len(f0) > 0 else 0,
+        'energy_mean': float(np.mean(energy)),
+        'energy_std': float(np.std(energy)),
+        'energy_max': float(np.max(energy)),
+        'spectral_centroid': float(np.mean(rows[:, 2])),
+        'spectral_bandwidth': float(np.mean(rows[:, 3])),
+        'zero_crossing_rate': float(np.mean(rows[:, 4])),
+        # 语速特征（简化处理，与原实现一致为音频时长）
+        'speech_rate': duration,
+        # 每秒有声段起始次数，作为与内容无关的语速估计
+        'syllable_rate': _count_onsets(rows[:, 0] > 0) / duration if duration > 0 else 0
+    }
+
+
+def extract_emotion_features(audio_data, sample_rate, frame_length=1024, hop_length=512, n_fft=2048):
+    """单次STFT提取情感特征
+
+    一次分帧、一次rfft（帧长frame_length，补零到n_fft使自相关不发生循环混叠），
+    由同一份频谱得到频谱质心/带宽，并由功率谱反变换得到自相关用于基频估计；
+    能量（RMS）和过零率直接在同一组时域帧上计算。返回的键与原librosa实现一致。
+    """
+    audio = AudioUtils.to_float32(audio_data)
+    if len(audio) == 0:
+        return {}
+
+    frames = frame_signal(audio, frame_length, hop_length)
+    rows = _analyze_frames(frames, sample_rate, n_fft)
+    return _summarize(rows, len(audio) / sample_rate)
+
+
+def _window_summaries(rows, sample_rate, hop_length, window_seconds, step_seconds):
+    """每隔step_seconds对最近window_seconds的帧汇总一次，返回[(结束时间, 特征字典), ...]"""
+    frame_rate = sample_rate / hop_length
+    window = max(1, int(round(window_seconds * frame_rate)))
+    step = max(1, int(round(step_seconds * frame_rate)))
+    return [
+        (end * hop_length / sample_rate, _summarize(rows[max(0, end - window):end],
+                                                    min(end, window) * hop_length / sample_rate))
+        for end in range(step, len(rows) + 1, step)
+    ]
+
+
+def extract_emotion_features_batch(audio_list, sample_rate, frame_length=1024, hop_length=512, n_fft=2048,
+                                   window_seconds=None, step_seconds=1.0):
+    """批量提取多段音频的情感特征，空音频对应空字典
+
+    每段内部已按帧矩阵化计算；把多段的帧拼成一个大矩阵并不会更快（中间结果超出缓存），因此逐段处理。
+    指定window_seconds时同时返回每段按滑动窗口汇总的走势，返回(特征列表, 走势列表)。
+    """
+    features_list, windows_list = [], []
+    for audio_data in audio_list:
+        audio = AudioUtils.to_float32(audio_data)
+        if len(audio) == 0:
+            features_list.append({})
+            windows_list.append([])
+            continue
+        rows = _analyze_frames(frame_signal(audio, frame_length, hop_length), sample_rate, n_fft)
+        features_list.append(_summarize(rows, len(audio) / sample_rate))
+        if window_seconds:
+            windows_list.append(_window_summaries(rows, sample_rate, hop_length, window_seconds, step_seconds))
+
+    if window_seconds:
+        return features_list, windows_list
+    return features_list
+
+
+class RunningStats:
+    """按列累计的均值/方差/极值（Welford算法，按批合并）"""
+
+    def __init__(self, width):
+        self.count = np.zeros(width)
+        self.mean = np.zeros(width)
+        self._m2 = np.zeros(width)
+        self.min = np.full(width, np.inf)
+        self.max = np.full(width, -np.inf)
+
+    def update(self, values, mask=None):
+        """合并一批样本（行为样本、列为统计量），mask为False的元素不计入"""
+        if mask is None:
+            mask = np.ones(values.shape, dtype=bool)
+        count = mask.sum(axis=0)
+        if not count.any():
+            return
+        safe = np.maximum(count, 1)
+        masked = np.where(mask, values, 0.0)
+        batch_mean = masked.sum(axis=0) / safe
+        batch_m2 = np.where(mask, (values - batch_mean) ** 2, 0.0).sum(axis=0)
+
+        total = self.count + count
+        delta = batch_mean - self.mean
+        ratio = np.divide(count, total, out=np.zeros_like(self.mean), where=total > 0)
+        self.mean = self.mean + delta * ratio
+        self._m2 = self._m2 + batch_m2 + delta ** 2 * self.count * ratio
+        self.count = total
+        self.min = np.minimum(self.min, np.where(mask, values, np.inf).min(axis=0))
+        self.max = np.maximum(self.max, np.where(mask, values, -np.inf).max(axis=0))
+
+    @property
+    def std(self):
+        return np.sqrt(np.divide(self._m2, self.count, out=np.zeros_like(self._m2), where=self.count > 0))
+
+
+class StreamingEmotionAccumulator:
+    """录音过程中逐帧累计情感特征
+
+    采集到的音频按任意长度push进来，凑满分析帧（frame_length，帧移hop_length）就立即计算该帧的
+    基频、能量和频谱特征并用Welford算法累计均值/方差，端点检测结束时特征已经就绪，无需再整体提取一遍。
+    同时保留最近window_seconds秒的逐帧特征，每隔trend_interval秒对窗口分类一次，得到长语句的情感走势。
+
+    与extract_emotion_features的差异：静音判定使用迄今为止的最大能量而不是整段的最大能量；
+    末尾不足一个帧移的音频不参与统计。
+    """
+
+    def __init__(self, sample_rate=16000, frame_length=1024, hop_length=512, n_fft=2048,
+                 window_seconds=3.0, trend_interval=1.0, classify=None):
+        self.sample_rate = sample_rate
+        self.frame_length = frame_length
+        self.hop_length = hop_length
+        self.n_fft = n_fft
+        self.classify = classify
+        frame_rate = sample_rate / hop_length
+        self._window = deque(maxlen=max(1, int(round(window_seconds * frame_rate))))
+        self._trend_frames = max(1, int(round(trend_interval * frame_rate)))
+        self.reset()
+
+    def reset(self):
+        # 与批量提取一致，开头补半帧零（居中分帧）
+        self._pending = np.zeros(self.frame_length // 2, dtype=np.float32)
+        self._stats = RunningStats(5)
+        self._energy_ref = 0.0
+        self._window.clear()
+        self._since_trend = 0
+        self.num_samples = 0
+        self.num_frames = 0
+        self._onsets = 0
+        self._last_voiced = False
+        self.trend = []
+
+    def push(self, audio_data):
+        """追加一段音频（int16字节串/数组或[-1, 1]浮点），返回本次新产生的走势点列表"""
+        samples = AudioUtils.to_float32(audio_data)
+        if len(samples) == 0:
+            return []
+        self.num_samples += len(samples)
+        self._pending = np.concatenate((self._pending, samples))
+        if len(self._pending) < self.frame_length:
+            return []
+
+        frames = np.lib.stride_tricks.sliding_window_view(self._pending, self.frame_length)[::self.hop_length]
+        self._pending = self._pending[len(frames) * self.hop_length:]
+        self._energy_ref = max(self._energy_ref, float(np.max(np.sqrt(np.mean(frames * frames, axis=1)))))
+        rows = _analyze_frames(frames, self.sample_rate, self.n_fft, self._energy_ref)
+
+        # 基频只统计有声帧，其余特征统计所有帧
+        mask = np.ones(rows.shape, dtype=bool)
+        mask[:, 0] = rows[:, 0] > 0
+        self._stats.update(rows, mask)
+        self.num_frames += len(rows)
+        self._onsets += _count_onsets(mask[:, 0], self._last_voiced)
+        self._last_voiced = bool(mask[-1, 0])
+
+        new_points = []
+        for row in rows:
+            self._window.append(row)
+            self._since_trend += 1
+            if self._since_trend >= self._trend_frames and self.classify is not None:
+                self._since_trend = 0
+                point = (self.duration, self.classify(self.window_features()))
+                self.trend.append(point)
+                new_points.append(point)
+        return new_points
+
+    @property
+    def duration(self):
+        """已处理音频的时长（秒）"""
+        return self.num_samples / self.sample_rate
+
+    def window_features(self):
+        """最近window_seconds秒的特征字典"""
+        if not self._window:
+            return {}
+        rows = np.array(self._window)
+        return _summarize(rows, len(rows) * self.hop_length / self.sample_rate)
+
+    def features(self):
+        """迄今为止整段音频的特征字典，键与extract_emotion_features一致"""
+        if self.num_frames == 0:
+            return {}
+        stats = self._stats
+        voiced = stats.count[0] > 0
+        mean, std = stats.mean, stats.std
+        return {
+            'f0_mean': float(mean[0]) if voiced else 0,
+            'f0_std': float(std[0]) if voiced else 0,
+            'f0_max': float(stats.max[0]) if voiced else 0,
+            'f0_min': float(stats.min[0]) if voiced else 0,
+            'energy_mean': float(mean[1]),
+            'energy_std': float(std[1]),
+            'energy_max': float(stats.max[1]),
+            'spectral_centroid': float(mean[2]),
+            'spectral_bandwidth': float(mean[3]),
+            'zero_crossing_rate': float(mean[4]),
+            'speech_rate': self.duration,
+            'syllable_rate': self._onsets / self.duration
+        }
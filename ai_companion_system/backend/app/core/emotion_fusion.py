@@ -0,0 +1,189 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict, deque
+import numpy as np
+from app.utils.logger import emotion_logger
+from app.core.emotion_classifier import EMOTION_LABELS, features_to_matrix
+
+EMOTION_NAMES = {
+    "happy": "开心",
+    "sad": "难过",
+    "angry": "愤怒",
+    "anxious": "焦虑",
+    "calm": "平静",
+    "surprised": "惊讶"
+}
+
+
+class EmotionEstimate:
+    """一轮对话融合后的情感估计，界面、声音调节和LLM提示词共用同一个结果"""
+
+    def __init__(self, turn_id, emotion, confidence, scores, sources, speech_rate=None, text=""):
+        self.turn_id = turn_id
+        self.emotion = emotion
+        self.confidence = confidence
+        self.scores = scores
+        self.sources = sources
+        self.speech_rate = speech_rate
+        self.text = text
+        self.timestamp = time.time()
+
+    @property
+    def name(self):
+        return EMOTION_NAMES.get(self.emotion, self.emotion)
+
+    def to_dict(self):
+        return {
+            "turn_id": self.turn_id,
+            "emotion": self.emotion,
+            "confidence": self.confidence,
+            "scores": self.scores,
+            "sources": self.sources,
+            "speech_rate": self.speech_rate
+        }
+
+
+class EmotionFusion:
+    """声学特征、文本关键词与近几轮历史的情感融合
+
+    各来源分别给出情感概率分布，按权重加权平均：
+    声学分类器有概率输出时直接使用，只有标签（阈值规则）时按rule_confidence平滑成分布；
+    文本关键词命中越多权重越高；历史为最近几轮融合结果的指数衰减平均，用于平滑单轮的误判；
+    另有一个偏向"平静"的弱先验，证据不足时结果回落到平静而不是沿用上一轮。
+    每轮结果按turn_id缓存，同一轮的重复查询不会重新计算。
+    """
+
+    def __init__(self, analyzer=None, acoustic_weight=0.5, text_weight=0.35, history_weight=0.15,
+                 prior_weight=0.2, history_turns=5, history_decay=0.5, rule_confidence=0.6, cache_size=32):
+        self.analyzer = analyzer
+        self.labels = EMOTION_LABELS
+        self.acoustic_weight = acoustic_weight
+        self.text_weight = text_weight
+        self.history_weight = history_weight
+        self.prior_weight = prior_weight
+        self.history_decay = history_decay
+        self.rule_confidence = rule_confidence
+        self._index = {label: i for i, label in enumerate(self.labels)}
+        self._history = deque(maxlen=history_turns)
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._turn_ids = itertools.count(1)
+        self._current = None
+        self._lock = threading.Lock()
+
+    def begin_turn(self):
+        """分配新一轮对话的turn_id"""
+        return next(self._turn_ids)
+
+    def _one_hot(self, emotion, confidence):
+        dist = np.full(len(self.labels), (1.0 - confidence) / (len(self.labels) - 1))
+        dist[self._index.get(emotion, self._index["calm"])] = confidence
+        return dist
+
+    def acoustic_distribution(self, features, emotion=None):
+        """声学特征 -> 情感分布；没有特征时返回None"""
+        if not features:
+            return None
+        classifier = getattr(self.analyzer, "classifier", None)
+        if classifier is not None and hasattr(classifier, "predict_proba_batch"):
+            probs = classifier.predict_proba_batch(features_to_matrix([features], classifier.feature_keys))[0]
+            dist = np.zeros(len(self.labels))
+            for label, prob in zip(classifier.labels, probs):
+                if label in self._index:
+                    dist[self._index[label]] = prob
+            if dist.sum() > 0:
+                return dist / dist.sum()
+        if emotion is None and classifier is not None:
+            emotion = classifier.predict(features)
+        return self._one_hot(emotion or "calm", self.rule_confidence)
+
+    def text_distribution(self, text=None, scores=None):
+        """文本关键词 -> (情感分布, 命中次数)；没有命中时分布为None"""
+        if scores is None:
+            scores = self.analyzer.text_scores(text) if (self.analyzer and text) else {}
+        hits = sum(scores.values())
+        if hits == 0:
+            return None, 0
+        counts = np.array([scores.get(label, 0) for label in self.labels], dtype=float)
+        dist = counts + 0.1
+        return dist / dist.sum(), hits
+
+    def _history_distribution(self):
+        if not self._history:
+            return None
+        weights = self.history_decay ** np.arange(len(self._history))[::-1]
+        return np.average(np.array(self._history), axis=0, weights=weights)
+
+    def fuse(self, turn_id, features=None, acoustic_emotion=None, text=None, text_scores=None, speech_rate=None):
+        """融合本轮的各个来源得到情感估计；turn_id已有结果时直接返回缓存"""
+        with self._lock:
+            cached = self._cache.get(turn_id)
+            if cached is not None:
+                return cached
+
+            sources = {}
+            total = self.prior_weight * self._one_hot("calm", self.rule_confidence)
+            weight_sum = self.prior_weight
+            has_evidence = False
+
+            acoustic = self.acoustic_distribution(features, acoustic_emotion)
+            if acoustic is not None:
+                total += self.acoustic_weight * acoustic
+                weight_sum += self.acoustic_weight
+                has_evidence = True
+                sources["acoustic"] = self.labels[int(np.argmax(acoustic))]
+
+            textual, hits = self.text_distribution(text, text_scores)
+            if textual is not None:
+                # 命中一个关键词时给3/4权重，两个及以上给满权重
+                weight = self.text_weight * min(1.0, 0.5 + 0.25 * hits)
+                total += weight * textual
+                weight_sum += weight
+                has_evidence = True
+                sources["text"] = self.labels[int(np.argmax(textual))]
+
+            history = self._history_distribution()
+            if history is not None:
+                total += self.history_weight * history
+                weight_sum += self.history_weight
+                sources["history"] = self.labels[int(np.argmax(history))]
+
+            dist = total / weight_sum
+            best = int(np.argmax(dist))
+            estimate = EmotionEstimate(
+                turn_id,
+                self.labels[best],
+                float(dist[best]),
+                {label: round(float(p), 4) for label, p in zip(self.labels, dist)},
+                sources,
+                speech_rate=speech_rate,
+                text=text or ""
+            )
+
+            # 只有本轮有声学或文本证据时才计入历史，避免历史自我强化
+            if has_evidence:
+                self._history.append(dist)
+            self._cache[turn_id] = estimate
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+            self._current = estimate
+
+        emotion_logger.info("融合情感: %s（置信度 %.2f，来源 %s）", estimate.name, estimate.confidence, sources)
+        return estimate
+
+    def get(self, turn_id):
+        with self._lock:
+            return self._cache.get(turn_id)
+
+    @property
+    def current(self):
+        """最近一轮的融合结果，尚无结果时为None"""
+        return self._current
+
+    def reset(self):
+        """清空历史和缓存（如清空对话时）"""
+        with self._lock:
+            self._history.clear()
+            self._cache.clear()
+            self._current = None
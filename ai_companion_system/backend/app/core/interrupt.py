@@ -1,8 +1,170 @@
-import webrtcvad
+import threading
+import time
+from collections import deque
 import numpy as np
-import pyaudio
 from app.utils.logger import audio_logger
-from app.utils.audio import AudioUtils
+from app.utils.audio import AudioUtils, StreamResampler
+from app.core.capture import get_capture_service
+from app.core.echo import EchoSuppressor
+
+
+class BargeInDetector:
+    """打断（barge-in）检测引擎
+
+    逐帧判断：能量高于自适应噪声底、VAD判定为语音且能量高于回声门限时，该帧记为候选；
+    最近window_frames帧中有confirm_frames帧为候选时确认打断（N-of-M），避免单帧误触发。
+    噪声底在非候选帧上按指数平均跟踪（下降快、上升慢）；
+    每次播放开始的echo_learn_frames帧只学习不触发：有TTS参考信号时用这些帧的麦克风/参考能量比的中位数
+    作为耦合系数，之后回声门限为参考能量乘以耦合系数，耦合系数继续在非候选帧上跟踪；
+    没有参考信号时取播放期间麦克风能量的滑动中位数。扬声器漏进麦克风的TTS声音不会触发打断。
+    """
+
+    def __init__(self, rate=16000, frame_duration=30, vad_mode=3, confirm_frames=3, window_frames=4,
+                 snr_ratio=6.0, echo_ratio=4.0, min_energy=2e4, noise_alpha=0.05, echo_learn_frames=5):
+        self.rate = rate
+        self.frame_duration = frame_duration
+        self.frame_size = int(rate * frame_duration / 1000)
+        self.confirm_frames = confirm_frames
+        self.window_frames = window_frames
+        self.snr_ratio = snr_ratio
+        self.echo_ratio = echo_ratio
+        self.min_energy = min_energy
+        self.noise_alpha = noise_alpha
+        self.echo_learn_frames = echo_learn_frames
+
+        try:
+            import webrtcvad
+            self.vad = webrtcvad.Vad(vad_mode)
+        except Exception as e:
+            audio_logger.warning(f"webrtcvad不可用，打断检测仅使用能量判断: {e}")
+            self.vad = None
+
+        self.noise_floor = None
+        self.active = False
+        self._reference_energy = None
+        self._reference_time = 0.0
+        self._echo_coupling = 0.1
+        self._coupling_samples = []
+        self._playback_frames = 0
+        self._playback_energies = deque(maxlen=max(1, 1000 // frame_duration))
+        self._window = deque(maxlen=window_frames)
+        self._events = []
+        self.last_event = None
+        self.gated_frames = 0
+
+    def set_active(self, active):
+        """TTS开始/结束播放时调用，只有播放期间才会触发打断"""
+        self.active = active
+        self._window.clear()
+        self._playback_energies.clear()
+        self._coupling_samples = []
+        self._playback_frames = 0
+        if not active:
+            self._reference_energy = None
+
+    def update_reference(self, samples, timestamp=None):
+        """发布当前正在播放的TTS信号（int16或float32），用于回声门限"""
+        audio = AudioUtils.to_int16(samples).astype(np.float32)
+        if len(audio):
+            self._reference_energy = float(np.mean(audio * audio))
+            self._reference_time = timestamp or time.monotonic()
+
+    def _reference_fresh(self, now):
+        # 参考信号超过0.5秒未更新视为已失效
+        return self._reference_energy is not None and now - self._reference_time < 0.5
+
+    def _echo_threshold(self, now):
+        if self._playback_frames <= self.echo_learn_frames:
+            return float("inf")
+        if self._reference_fresh(now):
+            return self._reference_energy * self._echo_coupling * self.echo_ratio
+        if len(self._playback_energies) < self.echo_learn_frames:
+            return float("inf")
+        return float(np.median(self._playback_energies)) * self.echo_ratio
+
+    def _learn_echo(self, energy, now):
+        """用一帧播放期间的非打断帧更新回声估计"""
+        self._playback_energies.append(energy)
+        learning = self._playback_frames <= self.echo_learn_frames
+        if self._reference_fresh(now):
+            coupling = min(energy / max(self._reference_energy, 1.0), 1.0)
+            if learning:
+                self._coupling_samples.append(coupling)
+            else:
+                self._echo_coupling += 0.05 * (coupling - self._echo_coupling)
+        # 学习期内所有帧都视为回声，结束时直接取中位数，不从初始值缓慢逼近
+        if self._playback_frames == self.echo_learn_frames and self._coupling_samples:
+            self._echo_coupling = float(np.median(self._coupling_samples))
+
+    def process_frame(self, frame, timestamp=None):
+        """输入一帧int16音频（字节串或数组）及其采集时间戳，确认打断时返回事件字典，否则返回None"""
+        now = time.monotonic()
+        timestamp = timestamp or now
+        samples = AudioUtils.to_int16(frame)
+        energy = float(np.mean(samples.astype(np.float32) ** 2)) if len(samples) else 0.0
+
+        if self.noise_floor is None:
+            self.noise_floor = energy
+        noise_threshold = max(self.min_energy, self.noise_floor * self.snr_ratio)
+        if self.active:
+            self._playback_frames += 1
+        echo_threshold = self._echo_threshold(now) if self.active else 0.0
+
+        is_voice = energy > noise_threshold
+        if is_voice and self.vad is not None and len(samples) == self.frame_size:
+            is_voice = self.vad.is_speech(samples.tobytes(), self.rate)
+        candidate = is_voice and energy > echo_threshold
+        if is_voice and not candidate:
+            self.gated_frames += 1
+
+        # 噪声底只在非语音帧上跟踪：能量低于当前值时快速下降，否则缓慢上升；
+        # 非播放期间的语音帧以极小步长参与，以便适应持续的环境变化
+        if not is_voice:
+            alpha = 0.5 if energy < self.noise_floor else self.noise_alpha
+            self.noise_floor += alpha * (energy - self.noise_floor)
+        elif not self.active:
+            self.noise_floor += 0.005 * (energy - self.noise_floor)
+
+        if self.active and not candidate:
+            self._learn_echo(energy, now)
+
+        if not self.active:
+            return None
+
+        self._window.append((candidate, timestamp))
+        if sum(1 for c, _ in self._window if c) < self.confirm_frames:
+            return None
+
+        onset = next(ts for c, ts in self._window if c)
+        event = {
+            "onset_time": onset,
+            "detected_time": now,
+            "frame_time": timestamp,
+            # 从用户开口（首个候选帧）到确认打断的总延迟，以及最后一帧采集完成到判定的处理延迟
+            "latency_ms": (now - onset) * 1000,
+            "processing_ms": (now - timestamp - self.frame_duration / 1000) * 1000,
+            "energy": energy,
+            "noise_floor": self.noise_floor,
+            "echo_threshold": echo_threshold
+        }
+        self._window.clear()
+        self.last_event = event
+        self._events.append(event)
+        if len(self._events) > 100:
+            self._events.pop(0)
+        return event
+
+    def get_stats(self):
+        latencies = [e["latency_ms"] for e in self._events]
+        return {
+            "events": len(self._events),
+            "gated_frames": self.gated_frames,
+            "noise_floor": self.noise_floor,
+            "echo_coupling": self._echo_coupling,
+            "mean_latency_ms": float(np.mean(latencies)) if latencies else None,
+            "last_event": self.last_event
+        }
+
 
 class InterruptDetector:
     def __init__(self, rate=16000, mode=3):
@@ -12,99 +174,153 @@ class InterruptDetector:
         mode: 检测模式，0-3，数字越大检测越敏感
         """
         try:
-            self.vad = webrtcvad.Vad(mode)
+            self.engine = BargeInDetector(rate=rate, vad_mode=mode)
             self.rate = rate
-            self.frame_duration = 30  # 30ms
-            self.frame_size = int(rate * self.frame_duration / 1000)
+            self.frame_duration = self.engine.frame_duration
+            self.frame_size = self.engine.frame_size
             self.channels = 1
-            self.format = pyaudio.paInt16
             
-            # 音频流
-            self.p = pyaudio.PyAudio()
-            self.stream = None
+            # VAD和打断判断之前先减去扬声器回声（TTS参考信号为16kHz）
+            self.echo_suppressor = EchoSuppressor(rate=rate) if rate == 16000 else None
+            
+            # 从共享采集服务读取音频，不再单独打开麦克风
+            self.subscription = None
+            self._reader_thread = None
+            self._stop_event = threading.Event()
             
             # 打断状态
             self.is_interrupting = False
             self.tts_playing = False
             
-            # 能量阈值
-            self.energy_threshold = 10000
-            
             audio_logger.info(f"打断检测器初始化成功，采样率: {rate}, 帧大小: {self.frame_size}")
         except Exception as e:
             audio_logger.error(f"打断检测器初始化失败: {e}")
-            self.vad = None
-            self.p = None
+            self.engine = None
     
     def start_detection(self, callback):
-        """开始打断检测"""
-        if not self.vad or not self.p:
+        """开始打断检测（检测线程常驻运行，非播放期间只用于跟踪噪声底）"""
+        if not self.engine:
             audio_logger.error("打断检测器未初始化")
             return False
+        if self._reader_thread is not None and self._reader_thread.is_alive():
+            return True
         
         try:
-            # 打开音频流
-            self.stream = self.p.open(
-                format=self.format,
-                channels=self.channels,
-                rate=self.rate,
-                input=True,
-                output=False,
-                frames_per_buffer=self.frame_size,
-                stream_callback=lambda in_data, frame_count, time_info, status: self._stream_callback(in_data, frame_count, time_info, status, callback)
-            )
+            self.subscription = get_capture_service().subscribe()
+            if self.subscription is None:
+                audio_logger.error("启动打断检测失败: 麦克风采集服务不可用")
+                return False
             
-            self.stream.start_stream()
+            self._stop_event.clear()
+            self._reader_thread = threading.Thread(target=self._reader_loop, args=(callback,), name="interrupt-detector")
+            self._reader_thread.daemon = True
+            self._reader_thread.start()
             audio_logger.info("打断检测已启动")
             return True
         except Exception as e:
             audio_logger.error(f"启动打断检测失败: {e}")
+            if self.subscription is not None and (self._reader_thread is None or not self._reader_thread.is_alive()):
+                self.subscription.close()
+                self.subscription = None
             return False
     
     def stop_detection(self):
         """停止打断检测"""
         try:
-            if self.stream:
-                self.stream.stop_stream()
-                self.stream.close()
-            if self.p:
-                self.p.terminate()
+            self._stop_event.set()
+            if self.subscription:
+                self.subscription.close()
+            if self._reader_thread is not None and self._reader_thread is not threading.current_thread():
+                self._reader_thread.join(timeout=1.0)
+            self.subscription = None
+            self._reader_thread = None
             audio_logger.info("打断检测已停止")
             return True
         except Exception as e:
             audio_logger.error(f"停止打断检测失败: {e}")
             return False
     
-    def _stream_callback(self, in_data, frame_count, time_info, status, callback):
-        """音频流回调函数"""
+    def _reader_loop(self, callback):
+        """逐帧读取共享采集数据并检测打断"""
+        subscription = self.subscription
+        # 线程因采集停止或异常退出时也要注销读者
         try:
-            if not self.tts_playing:
-                return (in_data, pyaudio.paContinue)
-            
-            # 检测语音活动
-            is_voice = self.vad.is_speech(in_data, self.rate)
+            # 采集采样率与检测采样率不同时流式重采样后再重新分帧
+            resampler = None
+            read_size = self.frame_size
+            if subscription.rate != self.rate:
+                resampler = StreamResampler(subscription.rate, self.rate)
+                read_size = int(self.frame_size * subscription.rate / self.rate)
+                audio_logger.info(f"打断检测重采样: {subscription.rate} -> {self.rate}")
+            pending = np.zeros(0, dtype=np.int16)
             
-            # 计算音频能量
-            energy = AudioUtils.calculate_energy(in_data)
+            while not self._stop_event.is_set():
+                samples, timestamp = subscription.read(read_size, timeout=0.5)
+                if samples is None:
+                    if not get_capture_service().is_running():
+                        break
+                    continue
+                if resampler is None:
+                    self._process_frame(samples, callback, timestamp)
+                    continue
+                
+                converted = np.clip(np.round(resampler.process(samples)), -32768, 32767).astype(np.int16)
+                pending = np.concatenate((pending, converted))
+                while len(pending) >= self.frame_size:
+                    self._process_frame(pending[:self.frame_size], callback, timestamp)
+                    pending = pending[self.frame_size:]
+        finally:
+            subscription.close()
+    
+    def _process_frame(self, in_data, callback, timestamp=None):
+        """处理一帧音频"""
+        try:
+            if self.echo_suppressor is not None:
+                in_data = self.echo_suppressor.process(in_data, timestamp)
+                reference = self.echo_suppressor.last_reference
+                if reference is not None and np.any(reference):
+                    self.engine.update_reference(reference, timestamp)
             
-            # 检测打断
-            if is_voice and energy > self.energy_threshold:
-                audio_logger.info(f"检测到打断，能量: {energy}")
-                self.is_interrupting = True
-                if callback:
-                    callback()
+            event = self.engine.process_frame(in_data, timestamp)
+            if event is None or self.is_interrupting:
+                return
             
-            return (in_data, pyaudio.paContinue)
+            audio_logger.info("检测到打断，延迟: %.0fms，能量: %.0f，噪声底: %.0f",
+                              event['latency_ms'], event['energy'], event['noise_floor'])
+            self.is_interrupting = True
+            if callback:
+                callback()
         except Exception as e:
-            audio_logger.error(f"音频流回调失败: {e}")
-            return (in_data, pyaudio.paContinue)
+            audio_logger.error(f"打断检测处理音频帧失败: {e}")
+    
+    def update_reference(self, samples, timestamp=None):
+        """发布正在播放的TTS音频，用于回声门限"""
+        if self.engine:
+            self.engine.update_reference(samples, timestamp)
+    
+    def get_last_event(self):
+        """最近一次打断事件（含延迟时间戳）"""
+        return self.engine.last_event if self.engine else None
+    
+    def get_stats(self):
+        if not self.engine:
+            return {}
+        stats = self.engine.get_stats()
+        if self.echo_suppressor is not None:
+            stats["echo"] = self.echo_suppressor.get_stats()
+        return stats
     
     def set_tts_playing(self, playing):
         """设置TTS播放状态"""
         self.tts_playing = playing
+        if self.engine:
+            self.engine.set_active(playing)
+        if playing and self.echo_suppressor is not None:
+            # 每次播放重新收敛，上一轮遗留的双讲状态和能量基线不带入本轮
+            self.echo_suppressor.schedule_reset()
         if not playing:
             self.is_interrupting = False
-        audio_logger.info(f"设置TTS播放状态: {playing}")
+        audio_logger.info("设置TTS播放状态: %s", playing)
     
     def get_interrupt_status(self):
         """获取打断状态"""
@@ -116,13 +332,16 @@ class InterruptDetector:
         audio_logger.info("打断状态已重置")
 
 class InterruptHandler:
-    def __init__(self, tts_module):
+    def __init__(self, tts_module, interrupt_detector=None):
         """
         初始化打断处理器
         tts_module: TTS模块实例
+        interrupt_detector: 复用已有的打断检测器，不传时新建
         """
         self.tts = tts_module
-        self.interrupt_detector = InterruptDetector()
+        self.interrupt_detector = interrupt_detector or InterruptDetector()
+        # 被打断的回复：已播放部分、未播放部分及打断位置（字符偏移）
+        self.spoken_text = ""
         self.interrupted_text = ""
         self.interrupt_position = 0
         audio_logger.info("打断处理器初始化成功")
@@ -145,8 +364,8 @@ class InterruptHandler:
                 self.tts.stop()
                 audio_logger.info("已停止TTS播放")
             
-            # 记录打断位置
-            # 这里可以根据实际情况记录打断时的文本位置
+            # 记录打断位置（播放线程退出后进度才最终确定，调用方可在播放结束后再调用handle_interrupted_speech更新）
+            self._record_position()
             
             # 触发打断回调
             if hasattr(self, 'interrupt_callback') and self.interrupt_callback:
@@ -171,18 +390,35 @@ class InterruptHandler:
     def reset_interrupt_status(self):
         """重置打断状态"""
         self.interrupt_detector.reset_interrupt_status()
+        self.spoken_text = ""
         self.interrupted_text = ""
         self.interrupt_position = 0
         audio_logger.info("打断状态已重置")
     
+    def _record_position(self, text=None):
+        """根据TTS播放进度拆分已播放/未播放部分"""
+        progress = self.tts.get_playback_progress() if self.tts and hasattr(self.tts, "get_playback_progress") else None
+        if text is None:
+            text = progress["text"] if progress else ""
+        position = len(text)
+        if progress and progress["text"] == text and not progress["completed"]:
+            position = min(progress["position"], len(text))
+        
+        self.interrupt_position = position
+        self.spoken_text = text[:position]
+        self.interrupted_text = text[position:]
+        return position
+    
     def handle_interrupted_speech(self, text):
-        """处理被打断的 speech"""
+        """处理被打断的回复，返回用户实际听到的部分"""
         try:
-            # 这里可以根据打断位置处理被打断的文本
-            # 例如，记录被打断的文本，以便后续处理
-            self.interrupted_text = text
-            audio_logger.info(f"记录被打断的文本: {text[:50]}...")
-            return text
+            position = self._record_position(text)
+            audio_logger.info("回复在第%d/%d个字符处被打断，未播放: %.50s...", position, len(text), self.interrupted_text)
+            return self.spoken_text
         except Exception as e:
             audio_logger.error(f"处理被打断的 speech 失败: {e}")
             return text
+    
+    def get_resume_text(self):
+        """被打断时未播放的剩余部分，用于"继续"时接着播放"""
+        return self.interrupted_text
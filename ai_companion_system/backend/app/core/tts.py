@@ -1,5 +1,14 @@
 import pyttsx3
+import logging
 import threading
+import os
+import re
+import time
+import wave
+import tempfile
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+import numpy as np
 
 class SimpleLogger:
     def info(self, message):
@@ -11,11 +20,23 @@ class SimpleLogger:
 
 try:
     from app.utils.logger import audio_logger
+    from app.utils.events import emit_event
 except Exception:
     audio_logger = SimpleLogger()
 
+    def emit_event(*args, **kwargs):
+        return False
+
 _tts_lock = threading.Lock()
 
+
+class EngineProperties(NamedTuple):
+    """实际设置到pyttsx3引擎上的属性，渲染结果只由它决定，也作为渲染缓存键的一部分"""
+    rate: int
+    volume: float
+    voice: Optional[str] = None
+
+
 class TextToSpeech:
     _instance = None
     _instance_lock = threading.Lock()
@@ -43,6 +64,20 @@ class TextToSpeech:
         self._voice_id = 0
         self._engine_pool = []
         self._engine_pool_lock = threading.Lock()
+        # 缓冲播放：先渲染为wav再由pyaudio输出，播放的同时发布回声参考信号，且可随时停止
+        self._buffered_playback = True
+        self._pyaudio = None
+        self._stop_event = threading.Event()
+        self._render_executor = None
+        # 渲染结果缓存：键为(句子, EngineProperties)，只包含实际影响渲染的属性，相同的句子和声音直接复用
+        self._render_cache = OrderedDict()
+        self._render_cache_lock = threading.Lock()
+        self._render_cache_samples = 0
+        self._render_cache_limit = 8 * 1024 * 1024
+        # 播放进度：当前文本及已播放（用户已听到）的字符位置
+        self._progress = {"text": "", "position": 0, "completed": False}
+        self._progress_lock = threading.Lock()
+        self._progress_callback = None
         self._init_voices()
     
     def _init_voices(self):
@@ -59,20 +94,18 @@ class TextToSpeech:
     def _get_or_create_engine(self):
         """获取或创建引擎实例"""
         try:
-            print("[TTS] _get_or_create_engine")
             with self._engine_pool_lock:
                 if self._engine_pool:
-                    print(f"[TTS] 从池中获取引擎: {len(self._engine_pool)}个")
+                    emit_event("tts.engine", logging.DEBUG, logger=audio_logger,
+                               source="pool", pool_size=len(self._engine_pool))
                     return self._engine_pool.pop()
             
-            print("[TTS] 初始化新引擎")
+            start = time.perf_counter()
             engine = pyttsx3.init()
-            print(f"[TTS] 引擎初始化成功: {engine}")
+            emit_event("tts.engine", logging.DEBUG, time.perf_counter() - start, audio_logger, source="new")
             return engine
         except Exception as e:
-            print(f"[TTS] 引擎初始化失败: {e}")
-            import traceback
-            traceback.print_exc()
+            emit_event("tts.engine", logging.ERROR, logger=audio_logger, exc_info=True, error=e)
             return None
     
     def _return_engine(self, engine):
@@ -103,54 +136,230 @@ class TextToSpeech:
         except Exception:
             return False
     
-    def _apply_parameters(self, engine):
+    def _engine_properties(self):
+        """由保存的参数得到引擎属性（pitch不被pyttsx3支持，不参与）"""
+        voice = None
+        if self._voice_id is not None and self.voices and 0 <= self._voice_id < len(self.voices):
+            voice = self.voices[self._voice_id].id
+        return EngineProperties(
+            rate=int(self.rate * self._speed),
+            volume=round(max(0.0, min(1.0, self.volume * self._volume)), 3),
+            voice=voice
+        )
+    
+    def _apply_parameters(self, engine, properties=None):
         """将保存的参数应用到引擎"""
         if not engine:
             return
         
         try:
-            speed = getattr(self, '_speed', 1.0)
-            volume = getattr(self, '_volume', 1.0)
-            voice_id = getattr(self, '_voice_id', None)
+            properties = properties or self._engine_properties()
+            engine.setProperty('rate', properties.rate)
+            engine.setProperty('volume', properties.volume)
+            if properties.voice is not None:
+                engine.setProperty('voice', properties.voice)
+        except Exception:
+            pass
+    
+    def set_buffered_playback(self, enabled):
+        """开启/关闭缓冲播放（关闭时由pyttsx3直接播放，没有回声参考信号）"""
+        self._buffered_playback = enabled
+    
+    def _render_to_array(self, text, properties=None):
+        """渲染文本，返回(int16交错样本, 采样率, 声道数)，失败时返回None"""
+        fd, file_path = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        try:
+            if not self.save_to_file(text, file_path, properties) or os.path.getsize(file_path) == 0:
+                return None
+            with wave.open(file_path, 'rb') as wf:
+                if wf.getsampwidth() != 2:
+                    return None
+                data = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+                return data, wf.getframerate(), wf.getnchannels()
+        except Exception as e:
+            emit_event("tts.render_failed", logging.WARNING, logger=audio_logger, error=e)
+            return None
+        finally:
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
+    
+    def _render_cached(self, text):
+        """带缓存的_render_to_array，缓存按样本总数做LRU淘汰"""
+        # 键和渲染使用同一份属性，渲染期间参数被修改也不会缓存到错误的键下
+        properties = self._engine_properties()
+        key = (text, properties)
+        with self._render_cache_lock:
+            rendered = self._render_cache.get(key)
+            if rendered is not None:
+                self._render_cache.move_to_end(key)
+                return rendered
+        
+        rendered = self._render_to_array(text, properties)
+        if rendered is None or len(rendered[0]) > self._render_cache_limit:
+            return rendered
+        
+        with self._render_cache_lock:
+            if key not in self._render_cache:
+                self._render_cache[key] = rendered
+                self._render_cache_samples += len(rendered[0])
+            while self._render_cache_samples > self._render_cache_limit:
+                _, evicted = self._render_cache.popitem(last=False)
+                self._render_cache_samples -= len(evicted[0])
+        return rendered
+    
+    def clear_render_cache(self):
+        with self._render_cache_lock:
+            self._render_cache.clear()
+            self._render_cache_samples = 0
+    
+    @staticmethod
+    def _split_sentences(text):
+        """按句末标点切分，返回每句在原文中的(start, end)"""
+        return [m.span() for m in re.finditer(r'.+?(?:[。！？!?；;…~\n]+|$)', text, re.S) if m.end() > m.start()]
+    
+    def _set_progress(self, position, completed=False):
+        with self._progress_lock:
+            self._progress["position"] = max(self._progress["position"], position)
+            self._progress["completed"] = completed
+            text = self._progress["text"]
+        if self._progress_callback:
+            try:
+                self._progress_callback(position, text)
+            except Exception:
+                pass
+    
+    def get_playback_progress(self):
+        """最近一次播放的进度：{"text", "position"（已播放字符数）, "completed"}"""
+        with self._progress_lock:
+            return dict(self._progress)
+    
+    def _play_buffered(self, data, rate, channels, on_progress=None):
+        """通过pyaudio输出播放，按发声时间发布16kHz单声道参考信号；被stop打断时返回False
+
+        on_progress(fraction)在每块写入后以已发声比例（扣除输出延迟）回调
+        """
+        import pyaudio
+        from app.core.echo import get_playback_reference
+        from app.utils.audio import AudioUtils, StreamResampler
+        
+        if self._pyaudio is None:
+            self._pyaudio = pyaudio.PyAudio()
+        reference = get_playback_reference()
+        resampler = StreamResampler(rate, reference.rate) if rate != reference.rate else None
+        
+        chunk = rate // 50  # 20ms
+        stream = self._pyaudio.open(format=pyaudio.paInt16, channels=channels, rate=rate, output=True,
+                                    frames_per_buffer=chunk)
+        try:
+            # 以第一次写入的时间加输出延迟作为播放时钟起点，第k块的发声时间按样本数推算
+            latency = stream.get_output_latency()
+            start_time = time.monotonic() + latency
+            ref_pos = 0
+            for i in range(0, len(data), chunk * channels):
+                if self._stop_event.is_set():
+                    # stop_stream会播完设备缓冲区，已写入的部分都会被听到
+                    if on_progress:
+                        on_progress(i / len(data))
+                    return False
+                block = data[i:i + chunk * channels]
+                mono = AudioUtils.to_float32(AudioUtils.convert_channels(block, channels, 1))
+                if resampler is not None:
+                    mono = resampler.process(mono)
+                reference.publish(mono, start_time + ref_pos / reference.rate)
+                ref_pos += len(mono)
+                stream.write(block.tobytes())
+                if on_progress:
+                    heard = i + len(block) - int(latency * rate) * channels
+                    on_progress(max(0, heard) / len(data))
+            return True
+        finally:
+            stream.stop_stream()
+            stream.close()
+    
+    def _speak_buffered(self, text):
+        """逐句渲染并缓冲播放，播放当前句时后台渲染下一句，同时按句内发声比例更新播放进度
+
+        第一句就无法渲染或输出设备不可用时返回None（由调用方回退为直接播放），被stop打断时返回False
+        """
+        if self._render_executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._render_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tts-render")
+        
+        sentences = [span for span in self._split_sentences(text) if text[span[0]:span[1]].strip()]
+        if not sentences:
+            self._set_progress(len(text), completed=True)
+            return True
+        
+        pending = self._render_executor.submit(self._render_cached, text[sentences[0][0]:sentences[0][1]])
+        for index, (start, end) in enumerate(sentences):
+            rendered = pending.result()
+            if index + 1 < len(sentences):
+                next_start, next_end = sentences[index + 1]
+                pending = self._render_executor.submit(self._render_cached, text[next_start:next_end])
             
-            new_rate = int(self.rate * speed)
-            engine.setProperty('rate', new_rate)
+            if rendered is None:
+                if index == 0:
+                    return None
+                emit_event("tts.sentence_skipped", logging.WARNING, logger=audio_logger,
+                           start=start, end=end)
+                continue
             
-            new_volume = max(0.0, min(1.0, self.volume * volume))
-            engine.setProperty('volume', new_volume)
+            try:
+                finished = self._play_buffered(
+                    *rendered,
+                    on_progress=lambda fraction, s=start, e=end: self._set_progress(s + int((e - s) * fraction))
+                )
+            except Exception as e:
+                emit_event("tts.playback_failed", logging.ERROR, logger=audio_logger, error=e)
+                return None if index == 0 else False
             
-            if voice_id is not None and self.voices and 0 <= voice_id < len(self.voices):
-                engine.setProperty('voice', self.voices[voice_id].id)
-        except Exception:
-            pass
+            if not finished:
+                pending.cancel()
+                return False
+            self._set_progress(end)
+        
+        self._set_progress(len(text), completed=True)
+        return True
     
-    def speak(self, text, callback=None):
-        """播放语音"""
-        print(f"[TTS] 播放语音: {text}")
+    def speak(self, text, callback=None, progress_callback=None):
+        """播放语音
+
+        progress_callback(position, text)在播放进度（已播放的字符位置）更新时回调
+        """
+        start = time.perf_counter()
+        with self._progress_lock:
+            self._progress = {"text": text or "", "position": 0, "completed": False}
+        self._progress_callback = progress_callback
         if not text:
-            print("[TTS] 文本为空")
+            emit_event("tts.speak", logging.DEBUG, logger=audio_logger, chars=0)
             return True
         
+        self._stop_event.clear()
+        if self._buffered_playback:
+            result = self._speak_buffered(text)
+            if result is not None:
+                if callback:
+                    try:
+                        callback()
+                    except Exception:
+                        pass
+                emit_event("tts.speak", duration=time.perf_counter() - start, logger=audio_logger,
+                           mode="buffered", chars=len(text), completed=result)
+                return result
+        
         try:
-            print("[TTS] 直接初始化引擎")
             engine = pyttsx3.init()
-            print(f"[TTS] 引擎初始化成功: {engine}")
-            
-            print("[TTS] 设置属性")
-            engine.setProperty('rate', int(self.rate * self._speed))
-            engine.setProperty('volume', min(1.0, self.volume * self._volume))
-            
-            if self.voices and self._voice_id is not None and 0 <= self._voice_id < len(self.voices):
-                print(f"[TTS] 设置语音: {self._voice_id}")
-                engine.setProperty('voice', self.voices[self._voice_id].id)
-            
-            print("[TTS] 播放语音")
+            self._apply_parameters(engine)
             engine.say(text)
             engine.runAndWait()
-            print("[TTS] 播放完成")
             
             engine.stop()
             del engine
+            # 直接播放无法获知句内进度，只在播放结束时更新
+            self._set_progress(len(text), completed=True)
             
             if callback:
                 try:
@@ -158,17 +367,18 @@ class TextToSpeech:
                 except Exception:
                     pass
             
-            print("[TTS] 返回True")
+            emit_event("tts.speak", duration=time.perf_counter() - start, logger=audio_logger,
+                       mode="direct", chars=len(text), voice=self._voice_id)
             return True
         except Exception as e:
-            print(f"[TTS] 异常: {e}")
-            import traceback
-            traceback.print_exc()
+            emit_event("tts.speak", logging.ERROR, time.perf_counter() - start, audio_logger,
+                       exc_info=True, mode="direct", chars=len(text), error=e)
             return False
     
     def stop(self):
         """停止播放"""
         try:
+            self._stop_event.set()
             with self._current_engine_lock:
                 if self._current_engine:
                     try:
@@ -182,7 +392,7 @@ class TextToSpeech:
         except Exception:
             return False
     
-    def save_to_file(self, text, file_path):
+    def save_to_file(self, text, file_path, properties=None):
         """保存语音到文件"""
         if not text:
             return False
@@ -194,7 +404,7 @@ class TextToSpeech:
                 if not engine:
                     return False
                     
-                self._apply_parameters(engine)
+                self._apply_parameters(engine, properties)
                 engine.save_to_file(text, file_path)
                 engine.runAndWait()
                 return True
@@ -203,3 +413,18 @@ class TextToSpeech:
             finally:
                 if engine:
                     self._return_engine(engine)
+    
+    def warmup(self, text="你好"):
+        """渲染一段简短文本到临时文件，提前完成引擎初始化和语音数据加载，返回耗时（秒）"""
+        start = time.perf_counter()
+        fd, file_path = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        try:
+            if not self.save_to_file(text, file_path):
+                return -1
+            return time.perf_counter() - start
+        finally:
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
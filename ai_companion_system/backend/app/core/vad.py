@@ -1,26 +1,134 @@
-import webrtcvad
+from collections import deque
 import numpy as np
-import pyaudio
 from app.utils.logger import audio_logger
+from app.utils.audio import AudioUtils
+
+# webrtcvad只接受10/20/30ms的帧
+VALID_FRAME_DURATIONS = (10, 20, 30)
+
+# 批量检测的能量预筛（帧均方值，int16刻度）：
+# 只用明显安静（低于NOISE_FRAME_CEILING）的帧估计噪声底，阈值限制在[MIN, MAX]之间，
+# 这样语音密集、没有静音段的音频不会把语音本身当成噪声底
+ENERGY_THRESHOLD_MIN = 1e4
+ENERGY_THRESHOLD_MAX = 1e5
+NOISE_FRAME_CEILING = 1e5
+NOISE_MIN_FRAMES = 5
+
+
+class VADFramer:
+    """把任意长度的音频块切分为固定大小的VAD帧
+
+    不足一帧的尾部保留到下一次push，与后续数据拼接，保证所有采集到的音频都被逐帧检测。
+    """
+
+    def __init__(self, frame_bytes):
+        self.frame_bytes = frame_bytes
+        self._carry = b""
+
+    @property
+    def pending(self):
+        """尚未凑满一帧的字节数"""
+        return len(self._carry)
+
+    def push(self, data):
+        """输入一段int16字节串，返回切分出的完整帧列表"""
+        if self._carry:
+            data = self._carry + data
+        end = len(data) - len(data) % self.frame_bytes
+        self._carry = data[end:]
+        return [data[i:i + self.frame_bytes] for i in range(0, end, self.frame_bytes)]
+
+    def reset(self):
+        self._carry = b""
+
+
+class SpeechEndpointer:
+    """基于逐帧VAD结果的语音端点检测状态机
+
+    silence -> speech: 连续start_ms的语音帧后触发，同时带上之前pre-roll时长的音频，避免截掉开头；
+    speech -> ended: 语音后连续end_silence_ms（hangover）的非语音帧后结束，短暂停顿不会切断语句。
+    """
+
+    def __init__(self, frame_duration=30, end_silence_ms=800, preroll_ms=300, start_ms=60):
+        self.frame_duration = frame_duration
+        self.end_silence_ms = end_silence_ms
+        self.preroll_ms = preroll_ms
+        self.start_ms = start_ms
+        self.reset()
+
+    def reset(self):
+        self.state = "silence"
+        self.frames = []
+        # 预录缓冲同时容纳触发所需的语音帧和其之前preroll_ms的音频
+        self._preroll = deque(maxlen=max(1, (self.preroll_ms + self.start_ms) // self.frame_duration))
+        self._voiced_run = 0
+        self._silence_run = 0
+        self.speech_ms = 0
+
+    @property
+    def triggered(self):
+        return self.state != "silence"
+
+    def process(self, frame, is_speech):
+        """输入一帧及其VAD结果，返回事件：'start'、'end'或None"""
+        if self.state == "ended":
+            return None
+
+        if self.state == "silence":
+            self._preroll.append(frame)
+            self._voiced_run = self._voiced_run + 1 if is_speech else 0
+            if self._voiced_run * self.frame_duration >= self.start_ms:
+                self.state = "speech"
+                self.frames = list(self._preroll)
+                self._preroll.clear()
+                self.speech_ms = self._voiced_run * self.frame_duration
+                return "start"
+            return None
+
+        self.frames.append(frame)
+        if is_speech:
+            self._silence_run = 0
+            self.speech_ms += self.frame_duration
+        else:
+            self._silence_run += 1
+            if self._silence_run * self.frame_duration >= self.end_silence_ms:
+                self.state = "ended"
+                return "end"
+        return None
+
 
 class VoiceActivityDetector:
-    def __init__(self, rate=16000, mode=3):
+    def __init__(self, rate=16000, mode=3, frame_duration=30):
         """
         初始化语音活动检测器
         rate: 采样率，必须是8000, 16000, 32000, 48000之一
         mode: 检测模式，0-3，数字越大检测越敏感
+        frame_duration: 帧长（毫秒），必须是10, 20, 30之一
         """
+        self.rate = rate
+        if frame_duration not in VALID_FRAME_DURATIONS:
+            audio_logger.warning(f"不支持的VAD帧长: {frame_duration}ms，使用30ms")
+            frame_duration = 30
+        self.frame_duration = frame_duration
+        self.frame_samples = int(rate * self.frame_duration / 1000)  # 样本数
+        self.frame_bytes = self.frame_samples * 2  # 字节数（16位音频）
         try:
+            # webrtcvad不可用时仍可使用分帧器和端点检测（配合能量判断）
+            import webrtcvad
             self.vad = webrtcvad.Vad(mode)
-            self.rate = rate
-            self.frame_duration = 30  # 30ms
-            self.frame_samples = int(rate * self.frame_duration / 1000)  # 样本数
-            self.frame_bytes = self.frame_samples * 2  # 字节数（16位音频）
             audio_logger.info(f"VAD初始化成功，采样率: {rate}, 帧样本数: {self.frame_samples}, 帧字节数: {self.frame_bytes}")
         except Exception as e:
             audio_logger.error(f"VAD初始化失败: {e}")
             self.vad = None
 
+    def create_framer(self):
+        """创建与当前帧长对齐的分帧器"""
+        return VADFramer(self.frame_bytes)
+
+    def create_endpointer(self, end_silence_ms=800, preroll_ms=300, start_ms=60):
+        """创建端点检测状态机"""
+        return SpeechEndpointer(self.frame_duration, end_silence_ms, preroll_ms, start_ms)
+
     def is_voice(self, audio_frame):
         """检测音频帧是否包含语音"""
         if not self.vad:
@@ -41,37 +149,116 @@ class VoiceActivityDetector:
             audio_logger.error(f"语音活动检测失败: {e}")
             return False
     
+    def detect_segments(self, audio_data, sample_rate=None, merge_gap_ms=0, min_speech_ms=0,
+                        energy_threshold=None, zcr_threshold=0.35):
+        """批量检测整段音频中的语音片段
+
+        audio_data: int16数组/字节串或[-1, 1]浮点数组（单声道），采样率与VAD不同时自动重采样
+        merge_gap_ms: 间隔不超过该时长的相邻片段合并
+        min_speech_ms: 丢弃短于该时长的片段
+        energy_threshold: 帧能量（均方值）预筛阈值，默认按噪声底自适应
+        zcr_threshold: 低能量帧过零率高于该值时视为噪声
+
+        返回形如(n, 2)的int64数组，每行为片段在输入采样率下的[起始样本, 结束样本)
+        """
+        empty = np.empty((0, 2), dtype=np.int64)
+        sample_rate = sample_rate or self.rate
+        voiced = self._classify_frames(audio_data, sample_rate, energy_threshold, zcr_threshold)
+        if len(voiced) == 0:
+            return empty
+
+        # 由逐帧结果求连续语音段的起止帧
+        edges = np.diff(np.concatenate(([0], voiced.view(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        if len(starts) == 0:
+            return empty
+
+        merge_frames = merge_gap_ms // self.frame_duration
+        if merge_frames > 0 and len(starts) > 1:
+            keep = np.concatenate(([True], starts[1:] - ends[:-1] > merge_frames))
+            starts = starts[keep]
+            ends = ends[np.concatenate((keep[1:], [True]))]
+
+        min_frames = min_speech_ms // self.frame_duration
+        if min_frames > 0:
+            long_enough = ends - starts >= min_frames
+            starts, ends = starts[long_enough], ends[long_enough]
+
+        segments = np.column_stack((starts, ends)).astype(np.int64) * self.frame_samples
+        if sample_rate != self.rate:
+            segments = segments * sample_rate // self.rate
+        return segments
+
+    def _classify_frames(self, audio_data, sample_rate, energy_threshold=None, zcr_threshold=0.35):
+        """对整段音频逐帧判定是否为语音，返回长度为帧数的布尔数组"""
+        audio = AudioUtils.to_int16(audio_data)
+        if sample_rate != self.rate:
+            audio = AudioUtils.resample(audio, sample_rate, self.rate)
+        audio = np.ascontiguousarray(audio)
+        num_frames = len(audio) // self.frame_samples
+        if num_frames == 0:
+            return np.zeros(0, dtype=bool)
+
+        # 连续数组reshape得到零拷贝的分帧视图
+        frames = audio[:num_frames * self.frame_samples].reshape(num_frames, self.frame_samples)
+
+        # 向量化能量/过零率预筛：明显静音或低能量高过零率（噪声）的帧不再送入webrtcvad
+        samples = frames.astype(np.float32)
+        energy = np.mean(samples * samples, axis=1)
+        zcr = np.count_nonzero(np.diff(np.signbit(frames), axis=1), axis=1) / self.frame_samples
+        if energy_threshold is None:
+            energy_threshold = self._energy_threshold(energy)
+        candidates = (energy >= energy_threshold) & ~((zcr > zcr_threshold) & (energy < energy_threshold * 4))
+
+        voiced = np.zeros(num_frames, dtype=bool)
+        if self.vad:
+            for i in np.flatnonzero(candidates):
+                voiced[i] = self.vad.is_speech(frames[i].tobytes(), self.rate)
+        else:
+            voiced = candidates
+        return voiced
+
+    @staticmethod
+    def _energy_threshold(energy):
+        """由帧能量估计预筛阈值：安静帧不足时使用默认下限"""
+        quiet = energy[energy < NOISE_FRAME_CEILING]
+        if len(quiet) < NOISE_MIN_FRAMES:
+            return ENERGY_THRESHOLD_MIN
+        noise_floor = np.median(quiet)
+        return float(np.clip(noise_floor * 4, ENERGY_THRESHOLD_MIN, ENERGY_THRESHOLD_MAX))
+
     def process_audio_stream(self, audio_data, sample_rate):
-        """处理音频流，返回语音活动片段"""
+        """处理音频流，返回逐帧的语音活动片段列表[(起始毫秒, 结束毫秒)]，每个元素对应一个语音帧"""
         if not self.vad:
             audio_logger.error("VAD未初始化")
             return []
         
         try:
-            # 如果采样率不匹配，需要重采样
-            if sample_rate != self.rate:
-                audio_logger.warning(f"采样率不匹配: {sample_rate} != {self.rate}")
-                # 这里可以添加重采样逻辑
-                return []
-            
-            # 分割音频为帧
-            frames = []
-            for i in range(0, len(audio_data), self.frame_bytes):
-                frame = audio_data[i:i+self.frame_bytes]
-                if len(frame) == self.frame_bytes:
-                    frames.append(frame)
-            
-            # 检测每个帧是否包含语音
-            voice_frames = []
-            for i, frame in enumerate(frames):
-                if self.is_voice(frame):
-                    voice_frames.append((i * self.frame_duration, (i+1) * self.frame_duration))
-            
+            voiced = self._classify_frames(audio_data, sample_rate)
+            voice_frames = [(int(i) * self.frame_duration, (int(i) + 1) * self.frame_duration)
+                            for i in np.flatnonzero(voiced)]
             audio_logger.info(f"检测到 {len(voice_frames)} 个语音活动片段")
             return voice_frames
         except Exception as e:
             audio_logger.error(f"处理音频流失败: {e}")
             return []
+
+    def process_audio_segments(self, audio_data, sample_rate, merge_gap_ms=0, min_speech_ms=0):
+        """处理音频流，返回合并后的连续语音片段列表[(起始毫秒, 结束毫秒)]"""
+        if not self.vad:
+            audio_logger.error("VAD未初始化")
+            return []
+
+        try:
+            segments = self.detect_segments(audio_data, sample_rate, merge_gap_ms, min_speech_ms)
+            voice_segments = [(int(start) * 1000 // sample_rate, int(end) * 1000 // sample_rate)
+                              for start, end in segments]
+            audio_logger.info(f"检测到 {len(voice_segments)} 个连续语音片段")
+            return voice_segments
+        except Exception as e:
+            audio_logger.error(f"处理音频流失败: {e}")
+            return []
     
     def detect_speech_start(self, audio_data, sample_rate):
         """检测语音开始位置"""
@@ -80,24 +267,11 @@ class VoiceActivityDetector:
             return -1
         
         try:
-            # 如果采样率不匹配，需要重采样
-            if sample_rate != self.rate:
-                audio_logger.warning(f"采样率不匹配: {sample_rate} != {self.rate}")
-                return -1
-            
-            # 分割音频为帧
-            frames = []
-            for i in range(0, len(audio_data), self.frame_bytes):
-                frame = audio_data[i:i+self.frame_bytes]
-                if len(frame) == self.frame_bytes:
-                    frames.append(frame)
-            
-            # 检测语音开始
-            for i, frame in enumerate(frames):
-                if self.is_voice(frame):
-                    start_time = i * self.frame_duration / 1000.0  # 转换为秒
-                    audio_logger.info(f"检测到语音开始于: {start_time:.3f}秒")
-                    return start_time
+            segments = self.detect_segments(audio_data, sample_rate)
+            if len(segments):
+                start_time = segments[0, 0] / sample_rate  # 转换为秒
+                audio_logger.info(f"检测到语音开始于: {start_time:.3f}秒")
+                return start_time
             
             audio_logger.info("未检测到语音")
             return -1
@@ -1,7 +1,41 @@
+from typing import NamedTuple
+import numpy as np
 from app.utils.logger import audio_logger
 
+# 参数量化步长：插值/平滑后的数值对齐到固定网格，保证同样的声音得到同样的缓存键
+PARAM_STEP = 0.05
+# 语速表的分桶：0~6字符/秒，每0.25字符/秒一档
+RATE_STEP = 0.25
+RATE_BUCKETS = 25
+# 置信度分档：0、0.25、0.5、0.75、1
+CONFIDENCE_LEVELS = 5
+
+
+def _quantize(value):
+    return round(round(value / PARAM_STEP) * PARAM_STEP, 2)
+
+
+class VoiceParams(NamedTuple):
+    """不可变的声音参数，可直接作为TTS渲染缓存的键"""
+    speed: float = 1.0
+    pitch: float = 1.0
+    volume: float = 1.0
+    style: str = "friendly"
+
+    def get(self, key, default=None):
+        """兼容原来的字典用法：params.get("speed", 1.0)"""
+        return getattr(self, key, default)
+
+    def to_dict(self):
+        return dict(self._asdict())
+
+    @classmethod
+    def quantized(cls, speed, pitch, volume, style):
+        return cls(_quantize(speed), _quantize(pitch), _quantize(volume), style)
+
+
 class VoiceAdjuster:
-    def __init__(self):
+    def __init__(self, smoothing=0.5):
         # 情感对应的声音参数
         self.emotion_voice_params = {
             "happy": {
@@ -48,66 +82,118 @@ class VoiceAdjuster:
             "normal": 1.0,
             "fast": 1.2
         }
+        # 语速映射的插值锚点（字符/秒）：原来<2为慢、>3为快，改为在各档中点之间线性过渡
+        self.speech_rate_anchors = (1.5, 2.5, 3.5)
         
+        # 跨轮平滑系数：每轮向目标参数移动的比例，1为不平滑
+        self.smoothing = smoothing
+        self._smoothed = None
+        # 每轮对话的声音参数缓存：(turn_id, 参数)
+        self._turn_params = (None, None)
+        
+        self._build_table()
         audio_logger.info("声音调节器初始化成功")
     
+    def _rate_to_speed(self, speech_rate):
+        anchors = [self.speech_rate_mapping[name] for name in ("slow", "normal", "fast")]
+        return float(np.interp(speech_rate, self.speech_rate_anchors, anchors))
+    
+    def _build_table(self):
+        """预计算 情感 × 置信度档 × 语速桶 的参数表，以及不考虑语速的情感参数
+        
+        数值参数按置信度在"平静"和目标情感之间线性插值，语速由用户语速分段线性插值得到。
+        """
+        calm = self.emotion_voice_params["calm"]
+        rates = np.arange(RATE_BUCKETS) * RATE_STEP
+        speeds = [self._rate_to_speed(rate) for rate in rates]
+        
+        self._emotion_table = {}
+        self._combined_table = {}
+        for emotion, preset in self.emotion_voice_params.items():
+            by_confidence = []
+            combined_rows = []
+            for level in range(CONFIDENCE_LEVELS):
+                weight = level / (CONFIDENCE_LEVELS - 1)
+                mix = {key: calm[key] + weight * (preset[key] - calm[key]) for key in ("speed", "pitch", "volume")}
+                style = preset["style"] if weight >= 0.5 else calm["style"]
+                by_confidence.append(VoiceParams.quantized(mix["speed"], mix["pitch"], mix["volume"], style))
+                # 与原综合调整一致：语速只由用户语速决定，音调/音量/风格来自情感
+                combined_rows.append(tuple(
+                    VoiceParams.quantized(speed, mix["pitch"], mix["volume"], style) for speed in speeds
+                ))
+            self._emotion_table[emotion] = tuple(by_confidence)
+            self._combined_table[emotion] = tuple(combined_rows)
+        self._rate_table = tuple(VoiceParams.quantized(speed, 1.0, 1.0, "friendly") for speed in speeds)
+    
+    @staticmethod
+    def _rate_bucket(speech_rate):
+        return int(min(RATE_BUCKETS - 1, max(0, round(speech_rate / RATE_STEP))))
+    
+    @staticmethod
+    def _confidence_level(confidence):
+        return int(min(CONFIDENCE_LEVELS - 1, max(0, round(confidence * (CONFIDENCE_LEVELS - 1)))))
+    
+    def lookup(self, emotion, speech_rate=None, confidence=1.0):
+        """查表得到声音参数（未知情感按平静处理），不做平滑"""
+        emotion = emotion if emotion in self._emotion_table else "calm"
+        level = self._confidence_level(confidence)
+        if speech_rate is None:
+            return self._emotion_table[emotion][level]
+        return self._combined_table[emotion][level][self._rate_bucket(speech_rate)]
+    
+    def smooth(self, target):
+        """对数值参数做跨轮指数平滑，避免相邻两轮之间声音突变；风格直接切换"""
+        previous = self._smoothed
+        if previous is None or self.smoothing >= 1:
+            self._smoothed = target
+            return target
+        
+        values = []
+        for key in ("speed", "pitch", "volume"):
+            goal = getattr(target, key)
+            value = getattr(previous, key) + self.smoothing * (goal - getattr(previous, key))
+            # 距离目标不足一个量化步长时直接到位，避免量化后停在中途
+            if abs(goal - value) <= PARAM_STEP:
+                value = goal
+            values.append(value)
+        self._smoothed = VoiceParams.quantized(*values, target.style)
+        return self._smoothed
+    
+    def reset_smoothing(self):
+        self._smoothed = None
+        self._turn_params = (None, None)
+    
     def adjust_voice_by_emotion(self, emotion):
         """根据情感调整声音参数"""
-        try:
-            # 获取对应情感的参数，如果没有则使用默认参数
-            params = self.emotion_voice_params.get(emotion, self.emotion_voice_params["calm"])
-            audio_logger.info(f"根据情感 {emotion} 调整声音参数: {params}")
-            return params
-        except Exception as e:
-            audio_logger.error(f"根据情感调整声音参数失败: {e}")
-            return self.emotion_voice_params["calm"]
+        params = self.lookup(emotion)
+        audio_logger.debug("根据情感 %s 调整声音参数: %s", emotion, params)
+        return params
     
     def adjust_voice_by_speech_rate(self, user_speech_rate):
         """根据用户语速调整声音参数"""
-        try:
-            # 根据用户语速选择合适的AI语速
-            if user_speech_rate < 2:
-                speed = self.speech_rate_mapping["slow"]
-            elif user_speech_rate > 3:
-                speed = self.speech_rate_mapping["fast"]
-            else:
-                speed = self.speech_rate_mapping["normal"]
-            
-            params = {
-                "speed": speed,
-                "pitch": 1.0,
-                "volume": 1.0,
-                "style": "friendly"
-            }
-            
-            audio_logger.info(f"根据用户语速 {user_speech_rate:.2f} 字符/秒 调整声音参数: {params}")
-            return params
-        except Exception as e:
-            audio_logger.error(f"根据语速调整声音参数失败: {e}")
-            return {"speed": 1.0, "pitch": 1.0, "volume": 1.0, "style": "friendly"}
+        params = self._rate_table[self._rate_bucket(user_speech_rate)]
+        audio_logger.debug("根据用户语速 %.2f 字符/秒 调整声音参数: %s", user_speech_rate, params)
+        return params
     
     def adjust_voice_combined(self, emotion, user_speech_rate):
         """综合情感和语速调整声音参数"""
-        try:
-            # 获取情感对应的参数
-            emotion_params = self.adjust_voice_by_emotion(emotion)
-            
-            # 获取语速对应的参数
-            speech_rate_params = self.adjust_voice_by_speech_rate(user_speech_rate)
-            
-            # 综合调整，优先考虑情感，然后调整语速
-            combined_params = {
-                "speed": speech_rate_params["speed"],
-                "pitch": emotion_params["pitch"],
-                "volume": emotion_params["volume"],
-                "style": emotion_params["style"]
-            }
-            
-            audio_logger.info(f"综合调整声音参数: {combined_params}")
-            return combined_params
-        except Exception as e:
-            audio_logger.error(f"综合调整声音参数失败: {e}")
-            return {"speed": 1.0, "pitch": 1.0, "volume": 1.0, "style": "friendly"}
+        params = self.lookup(emotion, user_speech_rate)
+        audio_logger.debug("综合调整声音参数: %s", params)
+        return params
+    
+    def adjust_voice_for_estimate(self, estimate):
+        """根据融合后的情感估计（EmotionEstimate）调整声音参数
+        
+        按置信度在平静与目标情感之间插值，再与上一轮平滑；同一轮对话只计算一次。
+        """
+        turn_id, params = self._turn_params
+        if estimate.turn_id == turn_id and params is not None:
+            return params
+        
+        params = self.smooth(self.lookup(estimate.emotion, estimate.speech_rate, estimate.confidence))
+        self._turn_params = (estimate.turn_id, params)
+        audio_logger.info("根据融合情感 %s（置信度 %.2f）调整声音参数: %s", estimate.emotion, estimate.confidence, params)
+        return params
     
     def set_voice_parameters(self, tts_engine, params):
         """设置TTS引擎的声音参数"""
@@ -125,7 +211,7 @@ class VoiceAdjuster:
             )
             
             if success:
-                audio_logger.info(f"成功设置声音参数: {params}")
+                audio_logger.info("成功设置声音参数: %s", params)
             else:
                 audio_logger.error("设置声音参数失败")
             
@@ -1,13 +1,11 @@
-from .config import Settings, settings
-from .model_manager import ModelManager, model_manager
-from .asr_model import QwenASRModel
-from .qwen_llm import QwenLLMModel
+# 模型相关模块依赖torch、transformers、pydantic，按需延迟导入
+from app.utils.lazy import lazy_module
 
-__all__ = [
-    "Settings", 
-    "settings",
-    "ModelManager",
-    "model_manager",
-    "QwenASRModel",
-    "QwenLLMModel"
-]
+__getattr__, __dir__, __all__ = lazy_module(__name__, {
+    "Settings": ".config",
+    "settings": ".config",
+    "ModelManager": ".model_manager",
+    "model_manager": ".model_manager",
+    "QwenASRModel": ".asr_model",
+    "QwenLLMModel": ".qwen_llm"
+})
@@ -2,22 +2,37 @@ import torch
 import threading
 import gc
 import os
+import time
+import logging
 from typing import Optional, Dict, Any
 import numpy as np
+from .snapshot import snapshot_manager
+from app.utils.events import emit_event
+from .optimization import (
+    ENCODER_MODES, configure_threads, get_optimized_path,
+    quantize_dynamic_int8, save_optimized_model, load_optimized_model, get_model_size_mb
+)
 
 os.environ["HF_ENDPOINT"] = "https://hf-mirror.com"
 os.environ["TRANSFORMERS_CACHE"] = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), "model_cache")
 os.environ["HF_HOME"] = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), "model_cache")
 
 class QwenASRModel:
-    def __init__(self, device: str = "cuda", max_memory: Dict = None):
+    def __init__(self, device: str = "cuda", max_memory: Dict = None, quantization: str = "none",
+                 encoder_mode: str = "eager", num_threads: int = None):
         self._device = device
         self._max_memory = max_memory or {}
+        self._quantization = quantization if quantization in ("none", "int8") else "none"
+        self._encoder_mode = encoder_mode if encoder_mode in ENCODER_MODES else "eager"
+        self._num_threads = num_threads
         self._model = None
         self._processor = None
         self._tokenizer = None
-        self._lock = threading.Lock()
+        self._encoder = None
+        # 可重入锁：unload可能在持有锁的方法内被调用
+        self._lock = threading.RLock()
         self._initialized = False
+        self._offloaded = False
         self._model_name = "openai/whisper-tiny"
         
     def initialize(self):
@@ -28,35 +43,128 @@ class QwenASRModel:
             if self._initialized:
                 return True
             
+            start = time.perf_counter()
             try:
-                print(f"[Info] 正在加载ASR模型: {self._model_name}")
-                print(f"[Info] 使用镜像站点: {os.environ.get('HF_ENDPOINT', 'default')}")
-                
                 from transformers import WhisperProcessor, WhisperForConditionalGeneration
                 
-                print("[Info] 加载processor...")
-                self._processor = WhisperProcessor.from_pretrained(self._model_name)
+                source, load_kwargs = self._resolve_source(WhisperForConditionalGeneration, [WhisperProcessor])
                 
-                print("[Info] 加载模型权重...")
-                self._model = WhisperForConditionalGeneration.from_pretrained(
-                    self._model_name,
-                    torch_dtype=torch.float32  # 保持为float32类型，避免类型不匹配
+                self._processor = WhisperProcessor.from_pretrained(
+                    source,
+                    local_files_only=load_kwargs.get("local_files_only", False)
                 )
                 
-                print(f"[Info] 将模型移动到{self._device}...")
+                threads = configure_threads(self._num_threads) if self._device == "cpu" else None
+                
+                self._model = self._load_model(WhisperForConditionalGeneration, source, load_kwargs)
                 self._model = self._model.to(self._device)
                 self._model.eval()
+                self._prepare_encoder()
                 self._initialized = True
-                print(f"[Info] ASR模型加载完成")
+                emit_event("asr.initialize", duration=time.perf_counter() - start, model=self._model_name,
+                           device=self._device, quantization=self._quantization, encoder=self._encoder_mode,
+                           threads=threads)
                 return True
                 
             except Exception as e:
-                print(f"[Error] ASR模型初始化失败: {e}")
-                import traceback
-                traceback.print_exc()
+                emit_event("asr.initialize", logging.ERROR, time.perf_counter() - start, exc_info=True,
+                           model=self._model_name, endpoint=os.environ.get('HF_ENDPOINT', 'default'), error=e)
                 self._initialized = False
                 return False
     
+    def _resolve_source(self, model_cls, processor_classes):
+        """优先使用本地safetensors快照（离线、mmap加载），失败时回退到hub"""
+        try:
+            snapshot_dir = snapshot_manager.resolve(self._model_name, model_cls, processor_classes)
+            emit_event("asr.source", snapshot=snapshot_dir)
+            return snapshot_dir, snapshot_manager.get_load_kwargs()
+        except Exception as e:
+            emit_event("asr.source", logging.WARNING, fallback="hub",
+                       endpoint=os.environ.get('HF_ENDPOINT', 'default'), error=e)
+            return self._model_name, {}
+    
+    def _load_model(self, model_cls, source: str = None, source_kwargs: Dict = None):
+        source = source or self._model_name
+        source_kwargs = source_kwargs or {}
+        if self._device != "cpu" or self._quantization != "int8":
+            return model_cls.from_pretrained(
+                source,
+                torch_dtype=torch.float32,  # 保持为float32类型，避免类型不匹配
+                **source_kwargs
+            )
+        
+        # int8动态量化只作用于Linear层，卷积前端保持float32；量化结果缓存到磁盘
+        cache_path = get_optimized_path(self._model_name, "int8")
+        model = load_optimized_model(cache_path)
+        if model is not None:
+            return model
+        
+        start = time.perf_counter()
+        model = model_cls.from_pretrained(source, torch_dtype=torch.float32, **source_kwargs)
+        model.eval()
+        model = quantize_dynamic_int8(model)
+        emit_event("asr.quantize", duration=time.perf_counter() - start, mode="int8")
+        save_optimized_model(model, cache_path)
+        return model
+    
+    def _prepare_encoder(self):
+        """按encoder_mode准备编码器：torch.compile或TorchScript导出（失败时回退到eager）"""
+        self._encoder = None
+        if self._encoder_mode == "eager":
+            return
+        
+        encoder = self._model.get_encoder()
+        try:
+            if self._encoder_mode == "compile":
+                self._encoder = torch.compile(encoder)
+                emit_event("asr.encoder", mode="compile")
+                return
+            
+            cache_path = get_optimized_path(self._model_name, f"encoder-{self._quantization}-{self._device}")
+            if os.path.exists(cache_path):
+                self._encoder = torch.jit.load(cache_path, map_location=self._device)
+                emit_event("asr.encoder", mode="torchscript", cached=True, path=cache_path)
+                return
+            
+            # Whisper输入固定填充到30秒（3000帧），用该形状追踪一次即可
+            num_mel_bins = self._model.config.num_mel_bins
+            example = torch.zeros(1, num_mel_bins, 3000, device=self._device)
+            with torch.no_grad():
+                traced = torch.jit.trace(_EncoderWrapper(encoder), example, check_trace=False)
+            traced = torch.jit.freeze(traced.eval()) if self._quantization == "none" else traced
+            
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            torch.jit.save(traced, cache_path)
+            self._encoder = traced
+            emit_event("asr.encoder", mode="torchscript", cached=False, path=cache_path)
+        except Exception as e:
+            emit_event("asr.encoder", logging.WARNING, mode=self._encoder_mode, fallback="eager", error=e)
+            self._encoder = None
+    
+    def _generate(self, inputs: Dict[str, Any]):
+        if self._encoder is not None:
+            try:
+                from transformers.modeling_outputs import BaseModelOutput
+                hidden = self._encoder(inputs["input_features"])
+                if not isinstance(hidden, torch.Tensor):
+                    hidden = hidden.last_hidden_state
+                return self._model.generate(
+                    encoder_outputs=BaseModelOutput(last_hidden_state=hidden),
+                    language="chinese",
+                    task="transcribe"
+                )
+            except Exception as e:
+                emit_event("asr.encoder_failed", logging.WARNING, mode=self._encoder_mode, fallback="eager", error=e)
+                self._encoder = None
+        
+        # 对于Whisper模型，使用language和task参数而不是forced_decoder_ids
+        # 避免重复创建ForceTokensLogitsProcessor
+        return self._model.generate(
+            **inputs,
+            language="chinese",
+            task="transcribe"
+        )
+    
     def transcribe(self, audio_data: np.ndarray, sample_rate: int = 16000) -> str:
         if not self._initialized:
             if not self.initialize():
@@ -64,6 +172,8 @@ class QwenASRModel:
         
         with self._lock:
             try:
+                self._restore_device_locked()
+                
                 if isinstance(audio_data, np.ndarray):
                     if audio_data.dtype == np.int16:
                         audio_data = audio_data.astype(np.float32) / 32768.0
@@ -83,13 +193,7 @@ class QwenASRModel:
                     inputs = {k: v.to(self._device) for k, v in inputs.items()}
                 
                 with torch.no_grad():
-                    # 对于Whisper模型，使用language和task参数而不是forced_decoder_ids
-                    # 避免重复创建ForceTokensLogitsProcessor
-                    predicted_ids = self._model.generate(
-                        **inputs,
-                        language="chinese",
-                        task="transcribe"
-                    )
+                    predicted_ids = self._generate(inputs)
                 
                 result = self._processor.batch_decode(
                     predicted_ids,
@@ -99,21 +203,73 @@ class QwenASRModel:
                 return result.strip()
                 
             except Exception as e:
-                print(f"[Error] 语音识别失败: {e}")
+                emit_event("asr.transcribe_failed", logging.ERROR, exc_info=True, error=e)
                 return ""
     
+    def warmup(self, duration: float = 1.0, sample_rate: int = 16000) -> float:
+        """对一段静音音频做一次识别，触发特征提取、编码器和解码器的首次初始化
+
+        返回耗时（秒），失败时返回-1。
+        """
+        if not self._initialized:
+            return -1
+        
+        start = time.perf_counter()
+        self.transcribe(np.zeros(int(duration * sample_rate), dtype=np.float32), sample_rate)
+        return time.perf_counter() - start
+    
     def transcribe_file(self, audio_file: str) -> str:
         try:
             import librosa
             audio_data, sample_rate = librosa.load(audio_file, sr=16000)
             return self.transcribe(audio_data, sample_rate)
         except Exception as e:
-            print(f"[Error] 音频文件识别失败: {e}")
+            emit_event("asr.transcribe_failed", logging.ERROR, file=audio_file, error=e)
             return ""
     
+    def get_optimization_info(self) -> Dict[str, Any]:
+        return {
+            "quantization": self._quantization,
+            "encoder_mode": self._encoder_mode,
+            "encoder_optimized": self._encoder is not None,
+            "num_threads": torch.get_num_threads()
+        }
+    
     def is_initialized(self) -> bool:
         return self._initialized
     
+    def get_model_name(self) -> str:
+        return self._model_name
+    
+    def is_offloaded(self) -> bool:
+        return self._offloaded
+    
+    def get_memory_footprint_mb(self) -> float:
+        if self._model is None:
+            return 0.0
+        return get_model_size_mb(self._model)
+    
+    def offload(self) -> bool:
+        """将GPU上的模型权重转移到CPU内存，释放显存"""
+        with self._lock:
+            if self._model is None or self._device == "cpu" or self._offloaded:
+                return False
+            self._model = self._model.to("cpu")
+            self._encoder = None
+            self._offloaded = True
+        self.clear_cache()
+        return True
+    
+    def restore_device(self):
+        with self._lock:
+            self._restore_device_locked()
+    
+    def _restore_device_locked(self):
+        if self._offloaded and self._model is not None:
+            self._model = self._model.to(self._device)
+            self._offloaded = False
+            self._prepare_encoder()
+    
     def get_device(self) -> str:
         return self._device
     
@@ -123,18 +279,31 @@ class QwenASRModel:
         gc.collect()
     
     def unload(self, cleanup: bool = True):
-        if self._model is not None:
-            del self._model
-            self._model = None
-        if self._processor is not None:
-            del self._processor
-            self._processor = None
-        if self._tokenizer is not None:
-            del self._tokenizer
-            self._tokenizer = None
+        with self._lock:
+            if self._model is not None:
+                del self._model
+                self._model = None
+            if self._processor is not None:
+                del self._processor
+                self._processor = None
+            if self._tokenizer is not None:
+                del self._tokenizer
+                self._tokenizer = None
+            self._encoder = None
+            self._offloaded = False
+            self._initialized = False
         if cleanup:
             self.clear_cache()
-        self._initialized = False
     
     def __del__(self):
         self.unload(cleanup=True)
+
+
+class _EncoderWrapper(torch.nn.Module):
+    """只返回last_hidden_state的编码器包装，便于TorchScript追踪"""
+    def __init__(self, encoder):
+        super().__init__()
+        self.encoder = encoder
+    
+    def forward(self, input_features):
+        return self.encoder(input_features, return_dict=False)[0]
@@ -0,0 +1,237 @@
+import os
+import logging
+import threading
+import time
+from typing import Optional, Dict, Any, Callable
+
+from app.utils.events import emit_event
+
+
+def get_process_rss_mb() -> float:
+    """当前进程常驻内存（MB）"""
+    try:
+        import psutil
+        return psutil.Process(os.getpid()).memory_info().rss / (1024 * 1024)
+    except ImportError:
+        pass
+
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    try:
+        import resource
+        # Linux下ru_maxrss单位为KB（峰值，仅作近似）
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except Exception:
+        return 0.0
+
+
+def get_vram_mb() -> float:
+    """当前进程已分配的显存（MB），无CUDA时为0"""
+    try:
+        import torch
+        if torch.cuda.is_available():
+            return torch.cuda.memory_allocated(0) / (1024 * 1024)
+    except Exception:
+        pass
+    return 0.0
+
+
+class MemoryGovernor:
+    """模型内存管理
+
+    记录每个模型的内存占用（权重大小、加载前后RSS/显存变化）和最近使用时间，
+    空闲超过idle_timeout秒的模型由后台线程回调evict_callback卸载（或转移到CPU），
+    acquire/release之间（正在推理）的模型不算空闲，不会被回收；
+    加载前按memory_budget_mb检查预估占用，超出预算时拒绝加载。
+    """
+
+    EVICTION_POLICIES = ("unload", "offload")
+
+    def __init__(self, idle_timeout: float = 0, memory_budget_mb: float = None,
+                 eviction_policy: str = "unload", check_interval: float = 30.0):
+        self._idle_timeout = idle_timeout
+        self._memory_budget_mb = memory_budget_mb
+        self._eviction_policy = eviction_policy if eviction_policy in self.EVICTION_POLICIES else "unload"
+        self._check_interval = check_interval
+        self._models: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._evict_callback: Optional[Callable[[str, str], None]] = None
+        self._monitor_thread = None
+        self._stop_event = threading.Event()
+
+    def _get_entry(self, name: str) -> Dict[str, Any]:
+        entry = self._models.get(name)
+        if entry is None:
+            entry = {
+                "state": "unloaded",
+                "last_used": 0.0,
+                "weights_mb": 0.0,
+                "rss_delta_mb": 0.0,
+                "vram_delta_mb": 0.0,
+                "load_count": 0,
+                "evict_count": 0,
+                "in_use": 0
+            }
+            self._models[name] = entry
+        return entry
+
+    def set_evict_callback(self, callback: Callable[[str, str], None]):
+        """callback(name, policy)，由监控线程在模型空闲超时时调用"""
+        self._evict_callback = callback
+
+    def configure(self, idle_timeout: float = None, memory_budget_mb: float = None,
+                  eviction_policy: str = None, check_interval: float = None) -> bool:
+        if eviction_policy is not None and eviction_policy not in self.EVICTION_POLICIES:
+            return False
+        with self._lock:
+            if idle_timeout is not None:
+                self._idle_timeout = idle_timeout
+            if memory_budget_mb is not None:
+                self._memory_budget_mb = memory_budget_mb if memory_budget_mb > 0 else None
+            if eviction_policy is not None:
+                self._eviction_policy = eviction_policy
+            if check_interval is not None:
+                self._check_interval = check_interval
+        self._ensure_monitor()
+        return True
+
+    def snapshot_usage(self) -> Dict[str, float]:
+        return {"rss_mb": get_process_rss_mb(), "vram_mb": get_vram_mb()}
+
+    def estimate_mb(self, name: str, default_mb: float = 0.0) -> float:
+        """预估加载模型所需内存：优先使用上次加载时记录的占用"""
+        with self._lock:
+            entry = self._models.get(name)
+            if entry and entry["weights_mb"] > 0:
+                return max(entry["weights_mb"], entry["rss_delta_mb"] + entry["vram_delta_mb"])
+        return default_mb
+
+    def resident_mb(self, exclude: str = None) -> float:
+        with self._lock:
+            return sum(
+                entry["weights_mb"] for name, entry in self._models.items()
+                if entry["state"] in ("loaded", "offloaded") and name != exclude
+            )
+
+    def can_load(self, name: str, default_mb: float = 0.0) -> bool:
+        if not self._memory_budget_mb:
+            return True
+        required = self.estimate_mb(name, default_mb)
+        resident = self.resident_mb(exclude=name)
+        if resident + required > self._memory_budget_mb:
+            emit_event("model.budget_exceeded", logging.ERROR, model=name, resident_mb=round(resident),
+                       required_mb=round(required), budget_mb=round(self._memory_budget_mb))
+            return False
+        return True
+
+    def record_loaded(self, name: str, weights_mb: float, before: Dict[str, float] = None):
+        after = self.snapshot_usage()
+        with self._lock:
+            entry = self._get_entry(name)
+            entry["state"] = "loaded"
+            entry["last_used"] = time.monotonic()
+            entry["weights_mb"] = weights_mb
+            entry["load_count"] += 1
+            if before:
+                entry["rss_delta_mb"] = max(0.0, after["rss_mb"] - before["rss_mb"])
+                entry["vram_delta_mb"] = max(0.0, after["vram_mb"] - before["vram_mb"])
+        self._ensure_monitor()
+
+    def record_evicted(self, name: str, state: str = "unloaded"):
+        with self._lock:
+            entry = self._get_entry(name)
+            entry["state"] = state
+            entry["evict_count"] += 1
+
+    def record_restored(self, name: str):
+        with self._lock:
+            entry = self._get_entry(name)
+            entry["state"] = "loaded"
+            entry["last_used"] = time.monotonic()
+
+    def record_unloaded(self, name: str):
+        with self._lock:
+            self._get_entry(name)["state"] = "unloaded"
+
+    def touch(self, name: str):
+        with self._lock:
+            entry = self._models.get(name)
+            if entry is not None:
+                entry["last_used"] = time.monotonic()
+
+    def acquire(self, name: str):
+        """标记模型正在使用，release之前不会被回收"""
+        with self._lock:
+            entry = self._get_entry(name)
+            entry["in_use"] += 1
+            entry["last_used"] = time.monotonic()
+
+    def release(self, name: str):
+        with self._lock:
+            entry = self._get_entry(name)
+            entry["in_use"] = max(0, entry["in_use"] - 1)
+            entry["last_used"] = time.monotonic()
+
+    def is_in_use(self, name: str) -> bool:
+        with self._lock:
+            entry = self._models.get(name)
+            return entry is not None and entry["in_use"] > 0
+
+    def get_idle_models(self, now: float = None):
+        if not self._idle_timeout or self._idle_timeout <= 0:
+            return []
+        now = now or time.monotonic()
+        with self._lock:
+            return [
+                name for name, entry in self._models.items()
+                if entry["state"] == "loaded" and not entry["in_use"]
+                and now - entry["last_used"] > self._idle_timeout
+            ]
+
+    def _ensure_monitor(self):
+        if not self._idle_timeout or self._idle_timeout <= 0:
+            return
+        with self._lock:
+            if self._monitor_thread is not None and self._monitor_thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._monitor_thread = threading.Thread(target=self._monitor_loop, name="memory-governor")
+            self._monitor_thread.daemon = True
+            self._monitor_thread.start()
+
+    def _monitor_loop(self):
+        while not self._stop_event.wait(self._check_interval):
+            for name in self.get_idle_models():
+                if not self._evict_callback:
+                    continue
+                try:
+                    emit_event("model.evict", model=name, idle_timeout=self._idle_timeout,
+                               policy=self._eviction_policy)
+                    self._evict_callback(name, self._eviction_policy)
+                except Exception as e:
+                    emit_event("model.evict", logging.ERROR, exc_info=True, model=name,
+                               policy=self._eviction_policy, error=e)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            models = {name: dict(entry) for name, entry in self._models.items()}
+        now = time.monotonic()
+        for entry in models.values():
+            last_used = entry.pop("last_used")
+            entry["idle_seconds"] = now - last_used if last_used else None
+        return {
+            "process_rss_mb": get_process_rss_mb(),
+            "idle_timeout": self._idle_timeout,
+            "memory_budget_mb": self._memory_budget_mb,
+            "eviction_policy": self._eviction_policy,
+            "models": models
+        }
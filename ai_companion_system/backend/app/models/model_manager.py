@@ -1,8 +1,13 @@
-import torch
 import threading
 import gc
-from typing import Optional, Dict, Any
+import logging
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Optional, Dict, Any, Callable
 import os
+from app.models.memory_governor import MemoryGovernor
+from app.utils.events import emit_event
 
 os.environ["CUDA_VISIBLE_DEVICES"] = "0"
 
@@ -26,16 +31,24 @@ class ModelManager:
         self._llm_model = None
         self._asr_lock = threading.Lock()
         self._llm_lock = threading.Lock()
-        self._device = self._get_device()
-        self._max_memory = self._get_max_memory()
+        # 设备探测（导入torch、查询CUDA）推迟到第一次使用时
+        self._device = None
+        self._max_memory = None
+        self._device_lock = threading.Lock()
         self._log_path = None
         self._prompt = "你是一个智能AI助手，帮助用户回答问题"
         self._ai_name = "L"
-        
-        print(f"[Info] 设备检测: {self._device}")
-        if self._device == "cuda":
-            print(f"[Info] GPU: {torch.cuda.get_device_name(0)}")
-            print(f"[Info] 显存: {torch.cuda.get_device_properties(0).total_memory / (1024**3):.2f}GB")
+        self._llm_quantization = "none"
+        self._asr_options = {"quantization": "none", "encoder_mode": "eager", "num_threads": None}
+        self._executor = None
+        self._futures: Dict[str, Future] = {}
+        self._futures_lock = threading.Lock()
+        # 卸载时已经回收过内存，只有加载失败残留了部分对象时才需要在下次加载前回收
+        self._cache_dirty = False
+        self._governor = MemoryGovernor()
+        self._governor.set_evict_callback(self._evict_model)
+        self._warmup_enabled = True
+        self._warmup_report: Dict[str, Dict[str, Any]] = {}
     
     def set_log_path(self, log_path: str):
         self._log_path = log_path
@@ -53,84 +66,203 @@ class ModelManager:
         if self._llm_model:
             self._llm_model.set_ai_name(ai_name)
     
+    def set_llm_quantization(self, mode: str) -> bool:
+        from app.models.optimization import QUANTIZATION_MODES
+        if mode not in QUANTIZATION_MODES:
+            emit_event("model.config_rejected", logging.ERROR, option="llm_quantization", value=mode)
+            return False
+        self._llm_quantization = mode
+        return True
+    
+    def set_asr_optimization(self, quantization: str = None, encoder_mode: str = None, num_threads: int = None) -> bool:
+        from app.models.optimization import ENCODER_MODES
+        if quantization is not None and quantization not in ("none", "int8"):
+            emit_event("model.config_rejected", logging.ERROR, option="asr_quantization", value=quantization)
+            return False
+        if encoder_mode is not None and encoder_mode not in ENCODER_MODES:
+            emit_event("model.config_rejected", logging.ERROR, option="asr_encoder_mode", value=encoder_mode)
+            return False
+        if quantization is not None:
+            self._asr_options["quantization"] = quantization
+        if encoder_mode is not None:
+            self._asr_options["encoder_mode"] = encoder_mode
+        if num_threads is not None:
+            self._asr_options["num_threads"] = num_threads
+        return True
+    
+    def _ensure_device(self) -> str:
+        if self._device is not None:
+            return self._device
+        
+        with self._device_lock:
+            if self._device is None:
+                import torch
+                device = self._get_device()
+                fields = {}
+                if device == "cuda":
+                    fields["gpu"] = torch.cuda.get_device_name(0)
+                    fields["memory_gb"] = round(torch.cuda.get_device_properties(0).total_memory / (1024**3), 2)
+                emit_event("model.device", device=device, **fields)
+                self._max_memory = self._get_max_memory(device)
+                self._device = device
+        return self._device
+    
+    def set_memory_policy(self, idle_timeout: float = None, memory_budget_mb: float = None,
+                          eviction_policy: str = None) -> bool:
+        """配置空闲回收和内存预算
+
+        idle_timeout: 模型空闲多少秒后回收，0表示不回收
+        memory_budget_mb: 所有模型的内存预算，超出时拒绝加载，0表示不限制
+        eviction_policy: "unload"释放权重，"offload"将GPU权重转移到CPU
+        """
+        return self._governor.configure(
+            idle_timeout=idle_timeout,
+            memory_budget_mb=memory_budget_mb,
+            eviction_policy=eviction_policy
+        )
+    
     def _get_device(self) -> str:
+        import torch
         if torch.cuda.is_available():
-            print("[Info] CUDA可用，使用GPU")
             return "cuda"
         elif hasattr(torch.backends, 'mps') and torch.backends.mps.is_available():
-            print("[Info] MPS可用，使用Apple GPU")
             return "mps"
-        print("[Info] 使用CPU")
         return "cpu"
     
-    def _get_max_memory(self) -> Dict[str, str]:
-        if self._device == "cuda":
+    def _get_max_memory(self, device: str) -> Dict[str, str]:
+        if device == "cuda":
+            import torch
             total_memory = torch.cuda.get_device_properties(0).total_memory
             safe_memory = int(total_memory * 0.7)
             max_mem_gb = safe_memory // (1024**3)
-            print(f"[Info] 最大显存限制: {max_mem_gb}GB")
+            emit_event("model.memory_limit", max_memory_gb=max_mem_gb)
             return {0: f"{max_mem_gb}GB"}
         return {}
     
     def get_device(self) -> str:
-        return self._device
+        return self._ensure_device()
     
     def clear_cache(self):
         if self._device == "cuda":
+            import torch
             torch.cuda.empty_cache()
         gc.collect()
     
-    def load_asr_model(self, model_path: str = None):
+    def _clear_cache_if_dirty(self):
+        if self._cache_dirty:
+            self._cache_dirty = False
+            self.clear_cache()
+    
+    def _initialize_tracked(self, name: str, model) -> bool:
+        """在内存预算内初始化模型，并记录其内存占用"""
+        from app.models.snapshot import snapshot_manager
+        default_mb = snapshot_manager.get_weights_size_mb(model.get_model_name())
+        if not self._governor.can_load(name, default_mb):
+            return False
+        
+        before = self._governor.snapshot_usage()
+        if not model.initialize():
+            return False
+        self._governor.record_loaded(name, model.get_memory_footprint_mb(), before)
+        return True
+    
+    def _ensure_resident(self, name: str, model) -> bool:
+        """被回收的模型在使用时重新加载（快照/量化缓存使重载很快）"""
+        if not model.is_initialized():
+            emit_event("model.reload", model=name)
+            if not self._initialize_tracked(name, model):
+                return False
+        elif model.is_offloaded():
+            model.restore_device()
+            self._governor.record_restored(name)
+        self._governor.touch(name)
+        return True
+    
+    def _evict_model(self, name: str, policy: str):
+        lock = self._asr_lock if name == "asr" else self._llm_lock
+        with lock:
+            model = self._asr_model if name == "asr" else self._llm_model
+            # 监控线程取得空闲列表之后模型可能又被use_model持有
+            if model is None or not model.is_initialized() or self._governor.is_in_use(name):
+                return
+            
+            if policy == "offload" and model.offload():
+                self._governor.record_evicted(name, "offloaded")
+                emit_event("model.evicted", model=name, policy="offloaded")
+            else:
+                model.unload()
+                self._governor.record_evicted(name, "unloaded")
+                emit_event("model.evicted", model=name, policy="unloaded")
+    
+    @staticmethod
+    def _notify(progress_callback: Optional[Callable[[str], None]], stage: str):
+        if progress_callback:
+            try:
+                progress_callback(stage)
+            except Exception as e:
+                emit_event("model.progress_callback_failed", logging.ERROR, stage=stage, error=e)
+    
+    def load_asr_model(self, model_path: str = None, progress_callback: Callable[[str], None] = None):
         with self._asr_lock:
             if self._asr_model is not None:
-                print("[Info] ASR模型已存在，返回现有实例")
+                emit_event("model.load", logging.DEBUG, model="asr", cached=True)
+                self._notify(progress_callback, "loaded")
                 return self._asr_model
             
+            start = time.perf_counter()
             try:
-                print("[Info] 开始加载ASR模型...")
-                self.clear_cache()
+                self._notify(progress_callback, "creating")
+                self._clear_cache_if_dirty()
                 from app.models.asr_model import QwenASRModel
-                print("[Info] 创建ASR模型实例...")
                 self._asr_model = QwenASRModel(
-                    device=self._device,
-                    max_memory=self._max_memory
+                    device=self.get_device(),
+                    max_memory=self._max_memory,
+                    **self._asr_options
                 )
-                print("[Info] 初始化ASR模型...")
-                self._asr_model.initialize()
-                print("[Info] ASR模型加载完成")
+                self._notify(progress_callback, "initializing")
+                if self._initialize_tracked("asr", self._asr_model):
+                    emit_event("model.load", duration=time.perf_counter() - start, model="asr", **self._asr_options)
+                    self._notify(progress_callback, "loaded")
+                else:
+                    emit_event("model.load", logging.WARNING, time.perf_counter() - start, model="asr", success=False)
+                    self._cache_dirty = True
+                    self._notify(progress_callback, "failed")
                 return self._asr_model
             except Exception as e:
-                print(f"[Error] 创建ASR模型失败: {e}")
-                import traceback
-                traceback.print_exc()
+                emit_event("model.load", logging.ERROR, time.perf_counter() - start,
+                           exc_info=True, model="asr", error=e)
+                self._cache_dirty = True
+                self._notify(progress_callback, "failed")
                 return None
     
     def initialize_asr_model(self):
         with self._asr_lock:
             if self._asr_model is None:
-                print("[Error] ASR模型未创建，请先调用load_asr_model")
+                emit_event("model.not_created", logging.ERROR, model="asr")
                 return False
             
             try:
                 return self._asr_model.initialize()
             except Exception as e:
-                print(f"[Error] 初始化ASR模型失败: {e}")
+                emit_event("model.initialize_failed", logging.ERROR, model="asr", error=e)
                 return False
     
-    def load_llm_model(self, model_path: str = None):
+    def load_llm_model(self, model_path: str = None, progress_callback: Callable[[str], None] = None):
         with self._llm_lock:
             if self._llm_model is not None:
-                print("[Info] LLM模型已存在，返回现有实例")
+                emit_event("model.load", logging.DEBUG, model="llm", cached=True)
+                self._notify(progress_callback, "loaded")
                 return self._llm_model
             
+            start = time.perf_counter()
             try:
-                print("[Info] 开始加载LLM模型...")
-                self.clear_cache()
+                self._notify(progress_callback, "creating")
+                self._clear_cache_if_dirty()
                 from app.models.qwen_llm import QwenLLMModel
-                print("[Info] 创建LLM模型实例...")
                 self._llm_model = QwenLLMModel(
-                    device=self._device,
-                    max_memory=self._max_memory
+                    device=self.get_device(),
+                    max_memory=self._max_memory,
+                    quantization=self._llm_quantization
                 )
                 
                 if self._log_path:
@@ -140,41 +272,187 @@ class ModelManager:
                 self._llm_model.set_ai_name(self._ai_name)
                 self._llm_model.set_system_prompt(self._prompt)
                 
-                print("[Info] 初始化LLM模型...")
-                self._llm_model.initialize()
-                print("[Info] LLM模型加载完成")
+                self._notify(progress_callback, "initializing")
+                if self._initialize_tracked("llm", self._llm_model):
+                    emit_event("model.load", duration=time.perf_counter() - start, model="llm",
+                               quantization=self._llm_quantization)
+                    self._notify(progress_callback, "loaded")
+                else:
+                    emit_event("model.load", logging.WARNING, time.perf_counter() - start, model="llm", success=False)
+                    self._cache_dirty = True
+                    self._notify(progress_callback, "failed")
                 return self._llm_model
             except Exception as e:
-                print(f"[Error] 创建LLM模型失败: {e}")
-                import traceback
-                traceback.print_exc()
+                emit_event("model.load", logging.ERROR, time.perf_counter() - start,
+                           exc_info=True, model="llm", error=e)
+                self._cache_dirty = True
+                self._notify(progress_callback, "failed")
                 return None
     
     def initialize_llm_model(self):
         with self._llm_lock:
             if self._llm_model is None:
-                print("[Error] LLM模型未创建，请先调用load_llm_model")
+                emit_event("model.not_created", logging.ERROR, model="llm")
                 return False
             
             try:
                 return self._llm_model.initialize()
             except Exception as e:
-                print(f"[Error] 初始化LLM模型失败: {e}")
+                emit_event("model.initialize_failed", logging.ERROR, model="llm", error=e)
                 return False
     
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._futures_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="model-loader")
+            return self._executor
+    
+    def set_warmup_enabled(self, enabled: bool):
+        self._warmup_enabled = enabled
+    
+    def _warmup_model(self, name: str, model, progress_callback: Callable[[str], None] = None):
+        """模型加载后在后台跑一次预热，使首轮对话的延迟与稳态一致"""
+        self._notify(progress_callback, "warming")
+        elapsed = model.warmup()
+        self._warmup_report[name] = {
+            "seconds": elapsed,
+            "success": elapsed >= 0,
+            "finished_at": time.time()
+        }
+        if elapsed >= 0:
+            emit_event("model.warmup", duration=elapsed, model=name)
+            self._notify(progress_callback, "ready")
+        else:
+            emit_event("model.warmup", logging.WARNING, model=name, success=False)
+            self._notify(progress_callback, "loaded")
+        return elapsed
+    
+    def schedule_warmup(self, name: str, model, progress_callback: Callable[[str], None] = None) -> Optional[Future]:
+        if not self._warmup_enabled or model is None:
+            return None
+        return self._get_executor().submit(self._warmup_model, name, model, progress_callback)
+    
+    def get_warmup_report(self) -> Dict[str, Dict[str, Any]]:
+        return dict(self._warmup_report)
+    
+    @staticmethod
+    def _is_reusable(future: Optional[Future]) -> bool:
+        """正在加载或已成功加载的任务可以复用；失败（返回None或抛出异常）的任务需要重新提交"""
+        if future is None:
+            return False
+        if not future.done():
+            return True
+        return not future.cancelled() and future.exception() is None and future.result() is not None
+    
+    def _submit_load(self, name: str, load_func, progress_callback) -> Future:
+        callback = (lambda stage: progress_callback(name, stage)) if progress_callback else None
+        
+        def task():
+            model = load_func(progress_callback=callback)
+            if model is None or not model.is_initialized():
+                return None
+            self.schedule_warmup(name, model, callback)
+            return model
+        
+        executor = self._get_executor()
+        # 检查与提交在同一把锁内完成，并发调用只会提交一次加载
+        with self._futures_lock:
+            future = self._futures.get(name)
+            if self._is_reusable(future):
+                return future
+            future = executor.submit(task)
+            self._futures[name] = future
+        return future
+    
+    def load_models_async(self, progress_callback: Callable[[str, str], None] = None,
+                          load_asr: bool = True, load_llm: bool = True) -> Dict[str, Future]:
+        """在后台线程池中并行加载ASR和LLM模型
+
+        progress_callback(model_type, stage): model_type为"asr"/"llm"，
+        stage依次为"creating"、"initializing"、"loaded"或"failed"，
+        加载成功后还会在后台预热，依次报告"warming"、"ready"。
+        返回{model_type: Future}，Future的结果为加载成功的模型实例，失败时为None。
+        """
+        futures = {}
+        if load_asr:
+            futures["asr"] = self._submit_load("asr", self.load_asr_model, progress_callback)
+        if load_llm:
+            futures["llm"] = self._submit_load("llm", self.load_llm_model, progress_callback)
+        return futures
+    
+    def get_model_future(self, name: str) -> Optional[Future]:
+        with self._futures_lock:
+            return self._futures.get(name)
+    
+    def _wait_for_model(self, name: str, getter, timeout: float = None):
+        future = self.get_model_future(name)
+        if future is not None and not future.done():
+            try:
+                return future.result(timeout=timeout)
+            except Exception as e:
+                emit_event("model.wait_failed", logging.ERROR, model=name, error=e)
+                return None
+        return getter()
+    
+    def wait_for_asr_model(self, timeout: float = None):
+        """获取ASR模型，若正在后台加载则等待加载完成"""
+        return self._wait_for_model("asr", self.get_asr_model, timeout)
+    
+    def wait_for_llm_model(self, timeout: float = None):
+        """获取LLM模型，若正在后台加载则等待加载完成"""
+        return self._wait_for_model("llm", self.get_llm_model, timeout)
+    
+    def is_model_loading(self, name: str) -> bool:
+        future = self.get_model_future(name)
+        return future is not None and not future.done()
+    
     def get_asr_model(self):
         with self._asr_lock:
+            if self._asr_model is not None and not self._ensure_resident("asr", self._asr_model):
+                return None
             return self._asr_model
     
     def get_llm_model(self):
         with self._llm_lock:
+            if self._llm_model is not None and not self._ensure_resident("llm", self._llm_model):
+                return None
             return self._llm_model
     
+    @contextmanager
+    def use_model(self, name: str, timeout: float = None):
+        """在with块内使用模型：正在后台加载时等待，被回收时重新加载，并标记为使用中
+
+        使用期间空闲回收不会卸载或转移该模型；模型不可用时得到None。
+        """
+        if self.is_model_loading(name):
+            self._wait_for_model(name, lambda: None, timeout)
+        
+        lock = self._asr_lock if name == "asr" else self._llm_lock
+        with lock:
+            model = self._asr_model if name == "asr" else self._llm_model
+            if model is not None and not self._ensure_resident(name, model):
+                model = None
+            if model is not None:
+                self._governor.acquire(name)
+        try:
+            yield model
+        finally:
+            if model is not None:
+                self._governor.release(name)
+    
+    def use_asr_model(self, timeout: float = None):
+        return self.use_model("asr", timeout)
+    
+    def use_llm_model(self, timeout: float = None):
+        return self.use_model("llm", timeout)
+    
     def unload_asr_model(self):
         with self._asr_lock:
             if self._asr_model is not None:
                 del self._asr_model
                 self._asr_model = None
+                self._forget_future("asr")
+                self._governor.record_unloaded("asr")
                 self.clear_cache()
     
     def unload_llm_model(self):
@@ -182,26 +460,42 @@ class ModelManager:
             if self._llm_model is not None:
                 del self._llm_model
                 self._llm_model = None
+                self._forget_future("llm")
+                self._governor.record_unloaded("llm")
                 self.clear_cache()
     
+    def _forget_future(self, name: str):
+        with self._futures_lock:
+            future = self._futures.get(name)
+            if future is not None and future.done():
+                del self._futures[name]
+    
     def unload_all_models(self):
         self.unload_asr_model()
         self.unload_llm_model()
     
     def get_memory_usage(self) -> Dict[str, Any]:
         result = {
-            "device": self._device,
+            "device": self.get_device(),
             "asr_loaded": self._asr_model is not None,
             "llm_loaded": self._llm_model is not None
         }
         
         if self._device == "cuda":
+            import torch
             result["gpu_memory_allocated"] = torch.cuda.memory_allocated(0) / (1024**3)
             result["gpu_memory_reserved"] = torch.cuda.memory_reserved(0) / (1024**3)
             result["gpu_memory_total"] = torch.cuda.get_device_properties(0).total_memory / (1024**3)
         
+        result["memory"] = self._governor.get_stats()
+        
+        if self._asr_model:
+            result["asr_optimization"] = self._asr_model.get_optimization_info()
+        
         if self._llm_model:
             result["llm_history"] = self._llm_model.get_history_stats()
+            result["llm_cache"] = self._llm_model.get_cache_stats()
+            result["llm_quantization"] = self._llm_model.get_quantization()
         
         return result
 
@@ -0,0 +1,82 @@
+import os
+import re
+import logging
+import torch
+
+from app.utils.events import emit_event
+
+MODEL_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), "model_cache")
+OPTIMIZED_CACHE_DIR = os.path.join(MODEL_CACHE_DIR, "optimized")
+
+QUANTIZATION_MODES = ("none", "int8", "bf16")
+ENCODER_MODES = ("eager", "compile", "torchscript")
+
+
+def get_safe_model_name(model_name: str) -> str:
+    """将模型名转换为可用作目录名的形式，如 Qwen/Qwen2.5-0.5B-Instruct -> Qwen--Qwen2.5-0.5B-Instruct"""
+    return re.sub(r"[^\w.-]+", "--", model_name)
+
+
+def get_optimized_path(model_name: str, variant: str) -> str:
+    """优化后模型的缓存路径，文件名包含torch版本，版本变化时自动失效"""
+    safe_name = get_safe_model_name(model_name)
+    torch_version = torch.__version__.split("+")[0]
+    return os.path.join(OPTIMIZED_CACHE_DIR, safe_name, f"{variant}-torch{torch_version}.pt")
+
+
+def quantize_dynamic_int8(model):
+    """对所有Linear层做int8动态量化（无需校准数据，仅支持CPU）"""
+    return torch.ao.quantization.quantize_dynamic(
+        model,
+        {torch.nn.Linear},
+        dtype=torch.qint8
+    )
+
+
+def save_optimized_model(model, path: str) -> bool:
+    """整体序列化优化后的模型，先写临时文件再替换，避免留下不完整的缓存"""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        torch.save(model, tmp_path)
+        os.replace(tmp_path, path)
+        emit_event("model.optimized_cache", action="save", path=path)
+        return True
+    except Exception as e:
+        emit_event("model.optimized_cache", logging.ERROR, action="save", path=path, error=e)
+        return False
+
+
+def load_optimized_model(path: str):
+    """加载缓存的优化模型，不存在或加载失败时返回None"""
+    if not os.path.exists(path):
+        return None
+    try:
+        model = torch.load(path, map_location="cpu", weights_only=False)
+        emit_event("model.optimized_cache", action="load", path=path)
+        return model
+    except Exception as e:
+        emit_event("model.optimized_cache", logging.ERROR, action="load", path=path, fallback="rebuild", error=e)
+        return None
+
+
+def get_model_size_mb(model) -> float:
+    """估算模型参数和缓冲区占用的内存（MB），包含量化Linear层的打包权重"""
+    total = 0
+    for tensor in list(model.parameters()) + list(model.buffers()):
+        total += tensor.numel() * tensor.element_size()
+    for module in model.modules():
+        packed = getattr(module, "_packed_params", None)
+        if packed is not None and hasattr(packed, "_weight_bias"):
+            weight, bias = packed._weight_bias()
+            total += weight.numel() * weight.element_size()
+            if bias is not None:
+                total += bias.numel() * bias.element_size()
+    return total / (1024 * 1024)
+
+
+def configure_threads(num_threads: int = None) -> int:
+    """设置torch线程数（进程全局），返回实际生效的线程数"""
+    if num_threads and num_threads > 0:
+        torch.set_num_threads(int(num_threads))
+    return torch.get_num_threads()
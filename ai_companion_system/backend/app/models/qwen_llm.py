@@ -2,22 +2,34 @@ import torch
 import threading
 import gc
 import os
+import time
 import json
+import atexit
+import logging
 from typing import Optional, List, Dict, Any
 from datetime import datetime
+from .response_cache import ResponseCache
+from .snapshot import snapshot_manager
+from app.utils.events import emit_event
+from .optimization import (
+    QUANTIZATION_MODES, get_optimized_path, quantize_dynamic_int8,
+    save_optimized_model, load_optimized_model, get_model_size_mb
+)
 
 os.environ["HF_ENDPOINT"] = "https://hf-mirror.com"
 os.environ["TRANSFORMERS_CACHE"] = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), "model_cache")
 os.environ["HF_HOME"] = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), "model_cache")
 
 class QwenLLMModel:
-    def __init__(self, device: str = "cuda", max_memory: Dict = None):
+    def __init__(self, device: str = "cuda", max_memory: Dict = None, quantization: str = "none"):
         self._device = device
         self._max_memory = max_memory or {}
+        self._quantization = quantization if quantization in QUANTIZATION_MODES else "none"
         self._model = None
         self._tokenizer = None
         self._lock = threading.Lock()
         self._initialized = False
+        self._offloaded = False
         self._model_name = "Qwen/Qwen2.5-0.5B-Instruct"
         self._history = []
         self._max_history = 50
@@ -28,6 +40,15 @@ class QwenLLMModel:
         self._max_history_size = 1 * 1024 * 1024 * 1024
         self._cleanup_size = 512 * 1024 * 1024
         self._ai_name = "L"
+        self._response_cache = ResponseCache()
+        
+        # 历史由后台线程写盘：对话路径只提交快照，连续多次保存合并为一次写入
+        self._pending_history = None
+        self._save_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._save_event = threading.Event()
+        self._writer_thread = None
+        atexit.register(self.flush_history)
         
     def set_history_file(self, file_path: str):
         self._history_file = file_path
@@ -62,38 +83,62 @@ class QwenLLMModel:
                             "timestamp": item.get("timestamp", datetime.now().isoformat())
                         })
                 
-                print(f"[Info] 从chat_history.json加载历史记录: {len(self._history)}条")
+                emit_event("llm.history_loaded", source="chat_history.json", turns=len(self._history))
                 return
                 
             except Exception as e:
-                print(f"[Error] 从chat_history.json加载历史记录失败: {e}")
+                emit_event("llm.history_load_failed", logging.ERROR, source="chat_history.json", error=e)
         
         if self._history_file and os.path.exists(self._history_file):
             try:
                 with open(self._history_file, 'r', encoding='utf-8') as f:
                     data = json.load(f)
                     self._history = data.get("history", [])
-                    print(f"[Info] 从llm_history.json加载历史记录: {len(self._history)}条")
+                    emit_event("llm.history_loaded", source="llm_history.json", turns=len(self._history))
             except Exception as e:
-                print(f"[Error] 加载历史聊天记录失败: {e}")
+                emit_event("llm.history_load_failed", logging.ERROR, source="llm_history.json", error=e)
                 self._history = []
     
     def _save_history(self):
+        """提交当前历史的快照给后台写线程，不等待文件I/O"""
         if not self._history_file:
             return
         
+        with self._save_lock:
+            self._pending_history = [dict(item) for item in self._history]
+            if self._writer_thread is None:
+                self._writer_thread = threading.Thread(target=self._history_writer, name="llm-history-writer")
+                self._writer_thread.daemon = True
+                self._writer_thread.start()
+        self._save_event.set()
+    
+    def _history_writer(self):
+        while True:
+            self._save_event.wait()
+            self._save_event.clear()
+            self.flush_history()
+    
+    def flush_history(self):
+        """立即写出尚未写盘的历史（后台写线程、历史清理和程序退出时调用）"""
+        with self._write_lock:
+            with self._save_lock:
+                history, self._pending_history = self._pending_history, None
+            if history is not None:
+                self._write_history(history)
+    
+    def _write_history(self, history: List[Dict[str, Any]]):
         try:
             os.makedirs(os.path.dirname(self._history_file), exist_ok=True)
             
             data = {
-                "history": self._history,
+                "history": history,
                 "last_updated": datetime.now().isoformat()
             }
             
             with open(self._history_file, 'w', encoding='utf-8') as f:
                 json.dump(data, f, ensure_ascii=False, indent=2)
         except Exception as e:
-            print(f"[Error] 保存历史聊天记录失败: {e}")
+            emit_event("llm.history_save_failed", logging.ERROR, error=e)
     
     def _get_history_file_size(self) -> int:
         total_size = 0
@@ -116,8 +161,10 @@ class QwenLLMModel:
         file_size = self._get_history_file_size()
         
         if file_size > self._max_history_size:
-            print(f"[Info] 历史记录文件大小: {file_size / (1024*1024):.2f}MB，超过1GB，开始清理...")
+            start = time.perf_counter()
             self._cleanup_old_history()
+            emit_event("llm.history_cleanup", duration=time.perf_counter() - start,
+                       size_mb=round(file_size / (1024 * 1024), 2), turns=len(self._history))
     
     def _cleanup_old_history(self):
         try:
@@ -130,12 +177,12 @@ class QwenLLMModel:
                 else:
                     break
                 
+                # 需要根据写盘后的文件大小判断是否继续清理，这里同步写出
                 self._save_history()
-            
-            print(f"[Info] 清理完成，当前历史记录: {len(self._history)}条")
+                self.flush_history()
             
         except Exception as e:
-            print(f"[Error] 清理历史记录失败: {e}")
+            emit_event("llm.history_cleanup_failed", logging.ERROR, error=e)
         
     def initialize(self):
         if self._initialized:
@@ -145,56 +192,129 @@ class QwenLLMModel:
             if self._initialized:
                 return True
             
+            start = time.perf_counter()
             try:
-                print(f"[Info] 正在加载LLM模型: {self._model_name}")
-                print(f"[Info] 使用镜像站点: {os.environ.get('HF_ENDPOINT', 'default')}")
-                
                 from transformers import AutoModelForCausalLM, AutoTokenizer
                 
-                print("[Info] 加载tokenizer...")
+                source, load_kwargs = self._resolve_source(AutoModelForCausalLM, [AutoTokenizer])
+                
                 self._tokenizer = AutoTokenizer.from_pretrained(
-                    self._model_name,
+                    source,
                     trust_remote_code=True,
-                    use_fast=True
-                )
-                
-                print("[Info] 加载模型权重...")
-                load_kwargs = {
-                    "trust_remote_code": True,
-                }
-                
-                if self._device == "cuda":
-                    load_kwargs["torch_dtype"] = torch.float16
-                else:
-                    load_kwargs["torch_dtype"] = torch.float32
-                
-                self._model = AutoModelForCausalLM.from_pretrained(
-                    self._model_name,
-                    **load_kwargs
+                    use_fast=True,
+                    local_files_only=load_kwargs.get("local_files_only", False)
                 )
                 
-                print(f"[Info] 将模型移动到{self._device}...")
+                self._model = self._load_model(AutoModelForCausalLM, source, load_kwargs)
                 self._model = self._model.to(self._device)
                 
                 self._model.eval()
                 self._initialized = True
-                print(f"[Info] LLM模型加载完成")
+                emit_event("llm.initialize", duration=time.perf_counter() - start, model=self._model_name,
+                           device=self._device, quantization=self._quantization)
                 return True
                 
             except Exception as e:
-                print(f"[Error] LLM模型初始化失败: {e}")
-                import traceback
-                traceback.print_exc()
+                emit_event("llm.initialize", logging.ERROR, time.perf_counter() - start, exc_info=True,
+                           model=self._model_name, endpoint=os.environ.get('HF_ENDPOINT', 'default'), error=e)
                 self._initialized = False
                 return False
     
-    def get_response(self, user_input: str, emotion: str = None) -> str:
+    def _resolve_source(self, model_cls, processor_classes):
+        """优先使用本地safetensors快照（离线、mmap加载），失败时回退到hub"""
+        try:
+            snapshot_dir = snapshot_manager.resolve(self._model_name, model_cls, processor_classes)
+            emit_event("llm.source", snapshot=snapshot_dir)
+            return snapshot_dir, snapshot_manager.get_load_kwargs()
+        except Exception as e:
+            emit_event("llm.source", logging.WARNING, fallback="hub",
+                       endpoint=os.environ.get('HF_ENDPOINT', 'default'), error=e)
+            return self._model_name, {}
+    
+    def _load_model(self, model_cls, source: str = None, source_kwargs: Dict = None):
+        source = source or self._model_name
+        load_kwargs = {
+            "trust_remote_code": True,
+        }
+        load_kwargs.update(source_kwargs or {})
+        
+        if self._device == "cuda":
+            load_kwargs["torch_dtype"] = torch.float16
+            if self._quantization != "none":
+                emit_event("llm.quantization_ignored", logging.WARNING, mode=self._quantization, device="cuda")
+        elif self._device == "cpu" and self._quantization == "bf16":
+            load_kwargs["torch_dtype"] = torch.bfloat16
+        else:
+            load_kwargs["torch_dtype"] = torch.float32
+        
+        if self._device != "cpu" or self._quantization != "int8":
+            return model_cls.from_pretrained(source, **load_kwargs)
+        
+        # int8动态量化：优先从磁盘缓存加载已量化的模型，避免每次启动重复量化
+        cache_path = get_optimized_path(self._model_name, "int8")
+        model = load_optimized_model(cache_path)
+        if model is not None:
+            return model
+        
+        start = time.perf_counter()
+        model = model_cls.from_pretrained(source, **load_kwargs)
+        model.eval()
+        model = quantize_dynamic_int8(model)
+        emit_event("llm.quantize", duration=time.perf_counter() - start, mode="int8")
+        save_optimized_model(model, cache_path)
+        return model
+    
+    def get_quantization(self) -> str:
+        return self._quantization
+    
+    def warmup(self, max_new_tokens: int = 8) -> float:
+        """用一条简短的合成对话跑一次生成，触发内核初始化、内存分配和tokenizer缓存
+
+        不写入对话历史和回复缓存，返回耗时（秒），失败时返回-1。
+        """
+        if not self._initialized:
+            return -1
+        
+        with self._lock:
+            try:
+                start = time.perf_counter()
+                self._restore_device_locked()
+                messages = [
+                    {"role": "system", "content": self._system_prompt},
+                    {"role": "user", "content": "你好"}
+                ]
+                text = self._tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+                inputs = self._tokenizer([text], return_tensors="pt")
+                inputs = {k: v.to(self._device) for k, v in inputs.items()}
+                with torch.no_grad():
+                    self._model.generate(
+                        **inputs,
+                        max_new_tokens=max_new_tokens,
+                        do_sample=False,
+                        pad_token_id=self._tokenizer.eos_token_id
+                    )
+                return time.perf_counter() - start
+            except Exception as e:
+                emit_event("llm.warmup_failed", logging.ERROR, error=e)
+                return -1
+    
+    def get_response(self, user_input: str, emotion: str = None, emotion_confidence: float = None) -> str:
         if not self._initialized:
             if not self.initialize():
                 return "抱歉，模型暂时无法加载，请稍后再试。"
         
         with self._lock:
+            start = time.perf_counter()
             try:
+                cache_key = self._response_cache.make_key(user_input, emotion, self._history)
+                cached = self._response_cache.get(cache_key)
+                if cached is not None:
+                    self._append_turn(user_input, cached)
+                    emit_event("llm.generate", logging.DEBUG, time.perf_counter() - start, cached=True)
+                    return cached
+                
+                self._restore_device_locked()
+                
                 self._history.append({"role": "user", "content": user_input, "timestamp": datetime.now().isoformat()})
                 
                 messages = [{"role": "system", "content": self._system_prompt}]
@@ -208,6 +328,9 @@ class QwenLLMModel:
                         "calm": "平静",
                         "surprised": "惊讶"
                     }.get(emotion, emotion)
+                    # 置信度只分两档，避免提示词随数值频繁变化
+                    if emotion_confidence is not None and emotion_confidence < 0.4:
+                        emotion_desc = f"可能{emotion_desc}（不确定）"
                     messages[0]["content"] += f"\n用户当前情感状态: {emotion_desc}"
                 
                 for item in self._history:
@@ -236,11 +359,16 @@ class QwenLLMModel:
                         pad_token_id=self._tokenizer.eos_token_id
                     )
                 
+                prompt_tokens = inputs["input_ids"].shape[1]
                 response = self._tokenizer.decode(
-                    outputs[0][inputs["input_ids"].shape[1]:],
+                    outputs[0][prompt_tokens:],
                     skip_special_tokens=True
                 )
+                emit_event("llm.generate", duration=time.perf_counter() - start, cached=False,
+                           prompt_tokens=int(prompt_tokens), new_tokens=int(outputs.shape[1] - prompt_tokens))
                 
+                # 历史与缓存保存同样的文本，缓存命中和实际生成的轮次在历史中一致
+                response = response.strip()
                 self._history.append({"role": "assistant", "content": response, "timestamp": datetime.now().isoformat()})
                 
                 if len(self._history) > self._max_history * 2:
@@ -249,14 +377,74 @@ class QwenLLMModel:
                 self._save_history()
                 self._check_and_cleanup_history()
                 
-                return response.strip()
+                self._response_cache.put(cache_key, response)
+                return response
                 
             except Exception as e:
-                print(f"[Error] 生成回复失败: {e}")
+                emit_event("llm.generate", logging.ERROR, time.perf_counter() - start, exc_info=True, error=e)
                 return "抱歉，我暂时无法回答，请稍后再试。"
     
+    def _append_turn(self, user_input: str, response: str):
+        now = datetime.now().isoformat()
+        self._history.append({"role": "user", "content": user_input, "timestamp": now})
+        self._history.append({"role": "assistant", "content": response, "timestamp": now})
+        
+        if len(self._history) > self._max_history * 2:
+            self._history = self._history[-self._max_history * 2:]
+        
+        self._save_history()
+    
+    def commit_spoken_response(self, spoken_length: int, response: str = None) -> bool:
+        """回复播放被打断时，历史中只保留用户实际听到的前spoken_length个字符，未播放部分留待继续
+
+        response为被打断的回复原文，传入时只有它仍是最后一条回复才会修改（避免期间已有新的对话轮次）
+        """
+        with self._lock:
+            if not self._history or self._history[-1]["role"] != "assistant":
+                return False
+            
+            entry = self._history[-1]
+            full = entry.get("full_content", entry["content"]).strip()
+            if response is not None and full != response.strip():
+                return False
+            spoken_length = max(0, min(spoken_length, len(full)))
+            if spoken_length >= len(full):
+                return self._resume_entry(entry) is not None
+            
+            entry["full_content"] = full
+            entry["spoken_length"] = spoken_length
+            entry["content"] = full[:spoken_length] + "……"
+            self._save_history()
+            return True
+    
+    def _resume_entry(self, entry: Dict[str, Any]) -> Optional[str]:
+        if "full_content" not in entry:
+            return None
+        full = entry.pop("full_content")
+        spoken_length = entry.pop("spoken_length", 0)
+        entry["content"] = full
+        self._save_history()
+        return full[spoken_length:]
+    
+    def get_unspoken_response(self) -> str:
+        """上一条回复中被打断、尚未播放的部分"""
+        with self._lock:
+            if not self._history or "full_content" not in self._history[-1]:
+                return ""
+            entry = self._history[-1]
+            return entry["full_content"][entry.get("spoken_length", 0):]
+    
+    def resume_response(self) -> str:
+        """继续被打断的回复：返回未播放部分并把完整回复恢复到历史中，不重新生成"""
+        with self._lock:
+            if not self._history or self._history[-1]["role"] != "assistant":
+                return ""
+            return self._resume_entry(self._history[-1]) or ""
+    
     def set_system_prompt(self, prompt: str) -> bool:
         try:
+            if prompt != self._system_prompt:
+                self._response_cache.clear()
             self._system_prompt = prompt
             return True
         except Exception:
@@ -264,13 +452,22 @@ class QwenLLMModel:
     
     def set_ai_name(self, ai_name: str) -> bool:
         try:
+            if ai_name != self._ai_name:
+                self._response_cache.clear()
             self._ai_name = ai_name
             return True
         except Exception:
             return False
     
+    def configure_response_cache(self, **kwargs) -> bool:
+        return self._response_cache.configure(**kwargs)
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        return self._response_cache.get_stats()
+    
     def clear_history(self):
         self._history.clear()
+        self._response_cache.clear()
         self._save_history()
     
     def get_history(self) -> List[Dict[str, str]]:
@@ -288,6 +485,45 @@ class QwenLLMModel:
     def is_initialized(self) -> bool:
         return self._initialized
     
+    def get_model_name(self) -> str:
+        return self._model_name
+    
+    def is_offloaded(self) -> bool:
+        return self._offloaded
+    
+    def get_memory_footprint_mb(self) -> float:
+        if self._model is None:
+            return 0.0
+        return get_model_size_mb(self._model)
+    
+    def unload(self):
+        """释放模型权重，保留对话历史和回复缓存，下次使用时重新初始化"""
+        with self._lock:
+            self._model = None
+            self._tokenizer = None
+            self._initialized = False
+            self._offloaded = False
+        self.clear_cache()
+    
+    def offload(self) -> bool:
+        """将GPU上的模型权重转移到CPU内存，释放显存"""
+        with self._lock:
+            if self._model is None or self._device == "cpu" or self._offloaded:
+                return False
+            self._model = self._model.to("cpu")
+            self._offloaded = True
+        self.clear_cache()
+        return True
+    
+    def restore_device(self):
+        with self._lock:
+            self._restore_device_locked()
+    
+    def _restore_device_locked(self):
+        if self._offloaded and self._model is not None:
+            self._model = self._model.to(self._device)
+            self._offloaded = False
+    
     def get_device(self) -> str:
         return self._device
     
@@ -0,0 +1,189 @@
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Optional, List, Dict, Any
+
+# 上下文无关意图的关键词（问候、告别、感谢等），这类输入的回复不依赖历史对话
+CONTEXT_FREE_KEYWORDS = {
+    "greeting": ["你好", "您好", "嗨", "哈喽", "hello", "hi", "早上好", "早安", "中午好", "下午好", "晚上好"],
+    "farewell": ["再见", "拜拜", "下次见", "晚安", "bye"],
+    "thanks": ["谢谢", "多谢", "感谢", "麻烦了", "thanks", "thankyou"]
+}
+
+# 关键词之后允许的称呼和语气词，如"谢谢你啊"、"晚安啦"
+CONTEXT_FREE_SUFFIX = "(?:你|您|你们|大家)?[啊呀呢吧哦喔啦嘛哈了]*"
+
+_PUNCT_RE = re.compile(r"[\s\W_]+", re.UNICODE)
+
+
+def normalize_text(text: str) -> str:
+    """规范化用户输入：全角转半角、小写、去除空白和标点"""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return _PUNCT_RE.sub("", text)
+
+
+class ResponseCache:
+    """LLM回复缓存
+
+    键由规范化输入、情感和历史指纹组成，支持TTL过期、LRU容量限制、
+    命中统计，以及每个键存储k个回复变体轮流返回。
+
+    policy:
+        "context_free" - 仅缓存上下文无关的短句（问候、告别、感谢），历史指纹为空
+        "history"      - 所有输入都可缓存，历史指纹取最近history_window条消息的哈希
+        "off"          - 关闭缓存
+    """
+
+    POLICIES = ("context_free", "history", "off")
+
+    def __init__(self, max_size: int = 256, ttl: float = 3600.0, variants: int = 3,
+                 policy: str = "context_free", history_window: int = 4, max_input_length: int = 12):
+        if policy not in self.POLICIES:
+            raise ValueError(f"不支持的缓存策略: {policy}")
+        self._max_size = max(1, int(max_size))
+        self._ttl = ttl
+        self._variants = max(1, int(variants))
+        self._policy = policy
+        self._history_window = history_window
+        self._max_input_length = max_input_length
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._skips = 0
+        self._evictions = 0
+        # 整句匹配：规范化后的输入必须恰好是一个关键词（可带称呼和语气词），
+        # "你好难过"、"谢谢你帮我查天气"这类包含关键词的句子依赖上下文，不能缓存
+        keywords = sorted({normalize_text(w) for words in CONTEXT_FREE_KEYWORDS.values() for w in words},
+                          key=len, reverse=True)
+        self._keyword_re = re.compile(
+            "(?:" + "|".join(re.escape(w) for w in keywords) + ")" + CONTEXT_FREE_SUFFIX
+        )
+
+    def _is_context_free(self, normalized: str) -> bool:
+        if not normalized or len(normalized) > self._max_input_length:
+            return False
+        return self._keyword_re.fullmatch(normalized) is not None
+
+    def _history_fingerprint(self, history: List[Dict[str, Any]]) -> str:
+        if not history or self._history_window <= 0:
+            return ""
+        digest = hashlib.blake2b(digest_size=8)
+        for item in history[-self._history_window:]:
+            digest.update(item.get("role", "").encode("utf-8"))
+            digest.update(b"\x00")
+            digest.update(item.get("content", "").encode("utf-8"))
+            digest.update(b"\x01")
+        return digest.hexdigest()
+
+    def make_key(self, user_input: str, emotion: Optional[str], history: List[Dict[str, Any]] = None):
+        """计算缓存键，不可缓存时返回None"""
+        if self._policy == "off":
+            return None
+
+        normalized = normalize_text(user_input)
+        if not normalized:
+            return None
+
+        if self._policy == "context_free":
+            if not self._is_context_free(normalized):
+                return None
+            fingerprint = ""
+        else:
+            fingerprint = self._history_fingerprint(history)
+
+        return (normalized, emotion or "", fingerprint)
+
+    def get(self, key) -> Optional[str]:
+        """查询缓存，变体数量不足k个时视为未命中，以便继续采样新的变体"""
+        if key is None:
+            with self._lock:
+                self._skips += 1
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._ttl and now - entry["created"] > self._ttl:
+                del self._entries[key]
+                entry = None
+
+            if entry is None or len(entry["responses"]) < self._variants:
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            responses = entry["responses"]
+            response = responses[entry["cursor"] % len(responses)]
+            entry["cursor"] += 1
+            self._hits += 1
+            return response
+
+    def put(self, key, response: str):
+        """写入一个回复变体"""
+        if key is None or not response:
+            return
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = {"responses": [], "cursor": 0, "created": time.monotonic()}
+                self._entries[key] = entry
+
+            if response not in entry["responses"]:
+                entry["responses"].append(response)
+                del entry["responses"][:-self._variants]
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def configure(self, max_size: int = None, ttl: float = None, variants: int = None,
+                  policy: str = None, history_window: int = None) -> bool:
+        """运行时调整缓存参数，策略改变时清空缓存"""
+        if policy is not None and policy not in self.POLICIES:
+            return False
+
+        with self._lock:
+            if max_size is not None:
+                self._max_size = max(1, int(max_size))
+            if ttl is not None:
+                self._ttl = ttl
+            if variants is not None:
+                self._variants = max(1, int(variants))
+            if history_window is not None:
+                self._history_window = history_window
+            if policy is not None and policy != self._policy:
+                self._policy = policy
+                self._entries.clear()
+
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "policy": self._policy,
+                "size": len(self._entries),
+                "max_size": self._max_size,
+                "ttl": self._ttl,
+                "variants": self._variants,
+                "hits": self._hits,
+                "misses": self._misses,
+                "skips": self._skips,
+                "evictions": self._evictions,
+                "hit_rate": self._hits / lookups if lookups else 0.0
+            }
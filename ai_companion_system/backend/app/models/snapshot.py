@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+import importlib.util
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+
+from app.utils.events import emit_event
+from .optimization import MODEL_CACHE_DIR, get_safe_model_name
+
+SNAPSHOT_DIR = os.path.join(MODEL_CACHE_DIR, "snapshots")
+MANIFEST_NAME = "snapshot_manifest.json"
+
+
+class ModelSnapshotManager:
+    """本地模型快照管理
+
+    首次使用时从hub（镜像站）解析模型，并以safetensors格式保存到model_cache/snapshots；
+    之后只从本地快照加载：local_files_only不访问网络，safetensors通过mmap读取权重，
+    配合low_cpu_mem_usage避免先随机初始化再拷贝权重带来的峰值内存。
+    """
+
+    def __init__(self, root: str = SNAPSHOT_DIR):
+        self._root = root
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    def _get_lock(self, model_name: str) -> threading.Lock:
+        with self._locks_lock:
+            if model_name not in self._locks:
+                self._locks[model_name] = threading.Lock()
+            return self._locks[model_name]
+
+    def get_snapshot_dir(self, model_name: str) -> str:
+        return os.path.join(self._root, get_safe_model_name(model_name))
+
+    def _read_manifest(self, snapshot_dir: str) -> Optional[Dict[str, Any]]:
+        manifest_path = os.path.join(snapshot_dir, MANIFEST_NAME)
+        if not os.path.exists(manifest_path):
+            return None
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception:
+            return None
+
+    def has_snapshot(self, model_name: str) -> bool:
+        """快照完整性检查：清单存在且所有文件大小一致"""
+        snapshot_dir = self.get_snapshot_dir(model_name)
+        manifest = self._read_manifest(snapshot_dir)
+        if not manifest:
+            return False
+
+        for name, size in manifest.get("files", {}).items():
+            path = os.path.join(snapshot_dir, name)
+            if not os.path.exists(path) or os.path.getsize(path) != size:
+                return False
+        return True
+
+    def resolve(self, model_name: str, model_cls, processor_classes: List = None) -> str:
+        """返回模型的本地快照目录，不存在时下载并转换为safetensors（只执行一次）"""
+        snapshot_dir = self.get_snapshot_dir(model_name)
+        if self.has_snapshot(model_name):
+            return snapshot_dir
+
+        with self._get_lock(model_name):
+            if self.has_snapshot(model_name):
+                return snapshot_dir
+
+            # 首次创建需要下载并转换权重，耗时较长，开始时先记录一条
+            emit_event("model.snapshot", model=model_name, stage="start", path=snapshot_dir)
+            start = time.perf_counter()
+            tmp_dir = f"{snapshot_dir}.tmp"
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir, exist_ok=True)
+
+            try:
+                for processor_cls in processor_classes or []:
+                    processor = processor_cls.from_pretrained(model_name)
+                    processor.save_pretrained(tmp_dir)
+
+                # 保持原始权重精度，加载时再按需转换dtype
+                model = model_cls.from_pretrained(model_name, torch_dtype="auto", trust_remote_code=True)
+                model.save_pretrained(tmp_dir, safe_serialization=True)
+                del model
+
+                files = {}
+                for root, _, names in os.walk(tmp_dir):
+                    for name in names:
+                        path = os.path.join(root, name)
+                        files[os.path.relpath(path, tmp_dir)] = os.path.getsize(path)
+
+                if not any(name.endswith(".safetensors") for name in files):
+                    raise RuntimeError("快照中没有safetensors权重文件")
+
+                # 清单最后写入，作为快照完整的标志
+                manifest = {
+                    "model_name": model_name,
+                    "format": "safetensors",
+                    "created": datetime.now().isoformat(),
+                    "files": files
+                }
+                with open(os.path.join(tmp_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+                    json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+                shutil.rmtree(snapshot_dir, ignore_errors=True)
+                os.replace(tmp_dir, snapshot_dir)
+                emit_event("model.snapshot", duration=time.perf_counter() - start, model=model_name,
+                           stage="done", path=snapshot_dir)
+                return snapshot_dir
+            except Exception as e:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                emit_event("model.snapshot", logging.ERROR, time.perf_counter() - start, model=model_name,
+                           stage="failed", error=e)
+                raise
+
+    def get_weights_size_mb(self, model_name: str) -> float:
+        """快照中权重文件的总大小（MB），没有快照时返回0"""
+        manifest = self._read_manifest(self.get_snapshot_dir(model_name))
+        if not manifest:
+            return 0.0
+        return sum(
+            size for name, size in manifest.get("files", {}).items()
+            if name.endswith(".safetensors")
+        ) / (1024 * 1024)
+
+    @staticmethod
+    def get_load_kwargs() -> Dict[str, Any]:
+        """从本地快照加载时使用的参数"""
+        kwargs = {
+            "local_files_only": True,
+            "use_safetensors": True
+        }
+        # 旧版本transformers的low_cpu_mem_usage依赖accelerate
+        if importlib.util.find_spec("accelerate") is not None:
+            kwargs["low_cpu_mem_usage"] = True
+        return kwargs
+
+    def remove_snapshot(self, model_name: str) -> bool:
+        try:
+            shutil.rmtree(self.get_snapshot_dir(model_name), ignore_errors=True)
+            return True
+        except Exception:
+            return False
+
+
+snapshot_manager = ModelSnapshotManager()
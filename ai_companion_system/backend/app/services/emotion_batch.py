@@ -0,0 +1,388 @@
+import os
+import csv
+import time
+import uuid
+import shutil
+import zipfile
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Optional, Dict, Any, List
+
+import numpy as np
+
+from app.utils.logger import emotion_logger
+from app.utils.audio import AudioUtils
+from app.core.emotion_features import FEATURE_KEYS, extract_emotion_features_batch
+from app.core.emotion_classifier import load_classifier, features_to_matrix
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+BATCH_OUTPUT_DIR = os.path.join(PROJECT_DIR, "emotion_batch")
+# 通过API提交的目录只能位于此目录之下
+BATCH_INPUT_DIR = os.path.join(PROJECT_DIR, "emotion_batch_input")
+SAMPLE_RATE = 16000
+# 上传压缩包解压后的总大小和文件数上限（按压缩包目录中声明的大小计算，
+# zipfile读取时不会超出声明的大小），防止压缩炸弹占满磁盘
+MAX_EXTRACTED_BYTES = 8 * 1024 * 1024 * 1024
+MAX_EXTRACTED_FILES = 100000
+CSV_COLUMNS = ["path", "duration", "emotion", "confidence", "trend", "error", *FEATURE_KEYS]
+
+# 工作进程内的分类器，由进程池initializer加载一次
+_worker_classifier = None
+
+
+def _init_worker(model_path):
+    global _worker_classifier
+    _worker_classifier = load_classifier(model_path)
+
+
+def _compress_trend(labels):
+    """合并连续相同的走势标签，如 calm>calm>happy -> calm>happy"""
+    trend = [label for i, label in enumerate(labels) if i == 0 or label != labels[i - 1]]
+    return ">".join(trend)
+
+
+def _process_chunk(paths, window_seconds, step_seconds):
+    """工作进程：读取一组音频，批量提取特征并分类，返回列式结果"""
+    classifier = _worker_classifier or load_classifier()
+    audios, errors = [], []
+    for path in paths:
+        try:
+            audios.append(AudioUtils.load_wav(path, SAMPLE_RATE))
+            errors.append("")
+        except Exception as e:
+            audios.append(np.zeros(0, dtype=np.float32))
+            errors.append(str(e) or type(e).__name__)
+
+    features_list, windows_list = extract_emotion_features_batch(
+        audios, SAMPLE_RATE, window_seconds=window_seconds, step_seconds=step_seconds
+    )
+    matrix = features_to_matrix(features_list)
+    emotions = classifier.predict_many(features_list)
+    if hasattr(classifier, "predict_proba_batch"):
+        confidences = classifier.predict_proba_batch(features_to_matrix(features_list, classifier.feature_keys)).max(axis=1)
+    else:
+        confidences = np.full(len(paths), np.nan)
+
+    # 所有音频的滑动窗口一次性分类，再按音频切分
+    window_features = [features for windows in windows_list for _, features in windows]
+    window_labels = classifier.predict_many(window_features)
+    trends, offset = [], 0
+    for windows in windows_list:
+        trends.append(_compress_trend(window_labels[offset:offset + len(windows)]))
+        offset += len(windows)
+
+    for i, features in enumerate(features_list):
+        if not features:
+            emotions[i] = "calm"
+            confidences[i] = np.nan
+            errors[i] = errors[i] or "音频为空"
+
+    return {
+        "paths": list(paths),
+        "durations": [len(audio) / SAMPLE_RATE for audio in audios],
+        "emotions": emotions,
+        "confidences": [float(c) for c in confidences],
+        "trends": trends,
+        "errors": errors,
+        "features": matrix
+    }
+
+
+class EmotionBatchJob:
+    """一次批量情感分析任务的状态"""
+
+    def __init__(self, source: str, output_dir: str):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.source = source
+        self.output_dir = output_dir
+        self.status = "pending"
+        self.total = 0
+        self.processed = 0
+        self.failed = 0
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.csv_path = os.path.join(output_dir, "emotions.csv")
+        self.npz_path = os.path.join(output_dir, "emotions.npz")
+        self.emotion_counts: Dict[str, int] = {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = None
+        if self.started:
+            elapsed = (self.finished or time.time()) - self.started
+        return {
+            "job_id": self.job_id,
+            "source": self.source,
+            "status": self.status,
+            "total": self.total,
+            "processed": self.processed,
+            "failed": self.failed,
+            "elapsed_seconds": elapsed,
+            "files_per_second": self.processed / elapsed if elapsed else None,
+            "emotion_counts": self.emotion_counts,
+            "csv_path": self.csv_path,
+            "npz_path": self.npz_path,
+            "error": self.error
+        }
+
+
+class EmotionBatchService:
+    """批量情感分析服务
+
+    把目录（或上传的zip压缩包）中的WAV文件按chunk_size分组，交给进程池并行处理：
+    每个工作进程只加载一次分类器，组内逐段矩阵化提取特征、整组一次性分类；
+    结果按完成顺序逐行写入CSV，全部完成后写出列式的.npz（特征矩阵 + 各列数组），便于后续用numpy/pandas分析。
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self, output_root: str = BATCH_OUTPUT_DIR, input_root: str = BATCH_INPUT_DIR):
+        if hasattr(self, '_initialized') and self._initialized:
+            return
+
+        self._initialized = True
+        self._output_root = output_root
+        self._input_root = input_root
+        self._jobs: Dict[str, EmotionBatchJob] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _collect_files(directory: str, recursive: bool = True) -> List[str]:
+        if not recursive:
+            return sorted(
+                os.path.join(directory, name) for name in os.listdir(directory)
+                if name.lower().endswith(".wav")
+            )
+        paths = []
+        for root, _, names in os.walk(directory):
+            paths.extend(os.path.join(root, name) for name in names if name.lower().endswith(".wav"))
+        return sorted(paths)
+
+    def resolve_input_directory(self, directory: str) -> str:
+        """把客户端给出的目录（相对输入根目录）解析为绝对路径，解析后（含符号链接）不在输入根目录下时拒绝"""
+        root = os.path.realpath(self._input_root)
+        path = os.path.realpath(os.path.join(root, directory))
+        if os.path.commonpath([root, path]) != root:
+            raise ValueError(f"目录必须位于输入目录之下: {directory}")
+        return path
+
+    def submit_directory(self, directory: str, output_dir: Optional[str] = None, workers: Optional[int] = None,
+                         chunk_size: int = 32, recursive: bool = True, model_path: Optional[str] = None,
+                         window_seconds: float = 3.0, step_seconds: float = 1.0,
+                         cleanup_dir: Optional[str] = None) -> EmotionBatchJob:
+        """提交目录中所有WAV文件的批量分析任务，后台执行，立即返回任务对象"""
+        if not os.path.isdir(directory):
+            raise ValueError(f"目录不存在: {directory}")
+
+        job = self._create_job(directory, output_dir)
+        self._start_job(job, self._job_options(directory, workers, chunk_size, recursive, model_path,
+                                               window_seconds, step_seconds, cleanup_dir))
+        return job
+
+    def submit_archive(self, archive_path: str, output_dir: Optional[str] = None, workers: Optional[int] = None,
+                       chunk_size: int = 32, model_path: Optional[str] = None, window_seconds: float = 3.0,
+                       step_seconds: float = 1.0) -> EmotionBatchJob:
+        """提交zip压缩包中所有WAV文件的批量分析任务
+
+        压缩包的所有权交给任务：在任务线程中解压到临时目录后删除压缩包，临时目录在任务结束后删除。
+        """
+        if not zipfile.is_zipfile(archive_path):
+            raise ValueError("不是有效的zip压缩包")
+
+        job = self._create_job(os.path.basename(archive_path), output_dir)
+        options = self._job_options(None, workers, chunk_size, True, model_path, window_seconds, step_seconds, None)
+        options["archive_path"] = archive_path
+        self._start_job(job, options)
+        return job
+
+    def _create_job(self, source: str, output_dir: Optional[str]) -> EmotionBatchJob:
+        job = EmotionBatchJob(source, output_dir or "")
+        if not output_dir:
+            job.output_dir = os.path.join(self._output_root, job.job_id)
+            job.csv_path = os.path.join(job.output_dir, "emotions.csv")
+            job.npz_path = os.path.join(job.output_dir, "emotions.npz")
+        with self._lock:
+            self._jobs[job.job_id] = job
+        return job
+
+    @staticmethod
+    def _job_options(directory, workers, chunk_size, recursive, model_path, window_seconds, step_seconds,
+                     cleanup_dir) -> Dict[str, Any]:
+        return {
+            "directory": directory,
+            "workers": workers or max(1, (os.cpu_count() or 2) - 1),
+            "chunk_size": max(1, chunk_size),
+            "recursive": recursive,
+            "model_path": model_path,
+            "window_seconds": window_seconds,
+            "step_seconds": step_seconds,
+            "cleanup_dir": cleanup_dir,
+            "archive_path": None
+        }
+
+    def _start_job(self, job: EmotionBatchJob, options: Dict[str, Any]):
+        thread = threading.Thread(target=self._run_job, args=(job, options), daemon=True)
+        thread.start()
+
+    @staticmethod
+    def _extract_archive(archive_path: str) -> str:
+        """把压缩包中的WAV文件解压到新的临时目录并返回该目录"""
+        extract_dir = tempfile.mkdtemp(prefix="emotion_batch_")
+        try:
+            with zipfile.ZipFile(archive_path) as archive:
+                members = []
+                for member in archive.infolist():
+                    name = member.filename
+                    # 只解压WAV文件，拒绝绝对路径和../，防止写到临时目录之外
+                    if member.is_dir() or not name.lower().endswith(".wav"):
+                        continue
+                    if os.path.isabs(name) or ".." in name.replace("\\", "/").split("/"):
+                        emotion_logger.warning(f"跳过压缩包中不安全的路径: {name}")
+                        continue
+                    members.append(member)
+
+                # 解压前先检查总量，超出上限时整个压缩包拒绝处理
+                total_bytes = sum(member.file_size for member in members)
+                if len(members) > MAX_EXTRACTED_FILES:
+                    raise ValueError(f"压缩包中WAV文件过多: {len(members)} > {MAX_EXTRACTED_FILES}")
+                if total_bytes > MAX_EXTRACTED_BYTES:
+                    raise ValueError(f"压缩包解压后过大: {total_bytes} > {MAX_EXTRACTED_BYTES} 字节")
+                for member in members:
+                    archive.extract(member, extract_dir)
+        except Exception:
+            shutil.rmtree(extract_dir, ignore_errors=True)
+            raise
+        return extract_dir
+
+    def _run_job(self, job: EmotionBatchJob, options: Dict[str, Any]):
+        job.status = "running"
+        job.started = time.time()
+        try:
+            if options["archive_path"]:
+                try:
+                    options["directory"] = options["cleanup_dir"] = self._extract_archive(options["archive_path"])
+                finally:
+                    os.unlink(options["archive_path"])
+            paths = self._collect_files(options["directory"], options["recursive"])
+            job.total = len(paths)
+            os.makedirs(job.output_dir, exist_ok=True)
+            emotion_logger.info(f"批量情感分析任务 {job.job_id} 开始: {job.total} 个文件, {options['workers']} 个进程")
+
+            chunk_size = options["chunk_size"]
+            chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+            results = []
+
+            # 服务端为多线程环境，使用spawn启动工作进程，避免fork时复制其他线程持有的锁
+            context = multiprocessing.get_context("spawn")
+            with open(job.csv_path, "w", newline="", encoding="utf-8") as f, ProcessPoolExecutor(
+                max_workers=options["workers"],
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(options["model_path"],)
+            ) as executor:
+                writer = csv.writer(f)
+                writer.writerow(CSV_COLUMNS)
+                futures = {
+                    executor.submit(_process_chunk, chunk, options["window_seconds"], options["step_seconds"]): chunk
+                    for chunk in chunks
+                }
+                for future in as_completed(futures):
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # 一组失败（如工作进程崩溃）只把该组文件记为失败，其余继续处理
+                        emotion_logger.error(f"批量情感分析任务 {job.job_id} 的一组文件处理失败: {e}")
+                        result = self._failed_chunk(futures[future], str(e) or type(e).__name__)
+                    result["paths"] = [os.path.relpath(path, options["directory"]) for path in result["paths"]]
+                    results.append(result)
+                    self._write_rows(writer, result)
+                    self._update_progress(job, result)
+
+            self._write_columns(job.npz_path, results)
+            job.status = "completed"
+            emotion_logger.info(f"批量情感分析任务 {job.job_id} 完成: {job.to_dict()}")
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            emotion_logger.error(f"批量情感分析任务 {job.job_id} 失败: {e}")
+        finally:
+            job.finished = time.time()
+            if options["cleanup_dir"]:
+                shutil.rmtree(options["cleanup_dir"], ignore_errors=True)
+
+    @staticmethod
+    def _failed_chunk(paths: List[str], error: str) -> Dict[str, Any]:
+        """处理失败的一组文件，结果列与_process_chunk一致，每个文件都带上错误信息"""
+        return {
+            "paths": list(paths),
+            "durations": [0.0] * len(paths),
+            "emotions": [""] * len(paths),
+            "confidences": [float("nan")] * len(paths),
+            "trends": [""] * len(paths),
+            "errors": [error] * len(paths),
+            "features": np.zeros((len(paths), len(FEATURE_KEYS)), dtype=np.float32)
+        }
+
+    @staticmethod
+    def _write_rows(writer, result: Dict[str, Any]):
+        for i, path in enumerate(result["paths"]):
+            writer.writerow([
+                path,
+                f"{result['durations'][i]:.3f}",
+                result["emotions"][i],
+                "" if np.isnan(result["confidences"][i]) else f"{result['confidences'][i]:.4f}",
+                result["trends"][i],
+                result["errors"][i],
+                *(f"{value:.6g}" for value in result["features"][i])
+            ])
+
+    def _update_progress(self, job: EmotionBatchJob, result: Dict[str, Any]):
+        with self._lock:
+            job.processed += len(result["paths"])
+            job.failed += sum(1 for error in result["errors"] if error)
+            for emotion, error in zip(result["emotions"], result["errors"]):
+                if not error:
+                    job.emotion_counts[emotion] = job.emotion_counts.get(emotion, 0) + 1
+
+    @staticmethod
+    def _write_columns(path: str, results: List[Dict[str, Any]]):
+        """列式导出：每列一个数组，特征为(n, len(FEATURE_KEYS))的float32矩阵"""
+        def column(name):
+            return [value for result in results for value in result[name]]
+
+        features = (np.concatenate([result["features"] for result in results])
+                    if results else np.zeros((0, len(FEATURE_KEYS)), dtype=np.float32))
+        np.savez_compressed(
+            path,
+            paths=np.array(column("paths"), dtype=str),
+            durations=np.array(column("durations"), dtype=np.float32),
+            emotions=np.array(column("emotions"), dtype=str),
+            confidences=np.array(column("confidences"), dtype=np.float32),
+            trends=np.array(column("trends"), dtype=str),
+            errors=np.array(column("errors"), dtype=str),
+            feature_keys=np.array(FEATURE_KEYS),
+            features=features.astype(np.float32)
+        )
+
+    def get_job(self, job_id: str) -> Optional[EmotionBatchJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.to_dict() for job in sorted(jobs, key=lambda job: job.created, reverse=True)]
+
+
+def get_emotion_batch_service() -> EmotionBatchService:
+    return EmotionBatchService()
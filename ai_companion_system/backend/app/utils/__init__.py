@@ -1,10 +1,13 @@
-from .logger import app_logger, audio_logger, chat_logger, emotion_logger
-from .audio import AudioUtils
+# 日志模块导入时会创建日志目录并启动写线程，audio依赖numpy，按需延迟导入
+from .lazy import lazy_module
 
-__all__ = [
-    "app_logger",
-    "audio_logger",
-    "chat_logger",
-    "emotion_logger",
-    "AudioUtils"
-]
+__getattr__, __dir__, __all__ = lazy_module(__name__, {
+    "app_logger": ".logger",
+    "audio_logger": ".logger",
+    "chat_logger": ".logger",
+    "emotion_logger": ".logger",
+    "AudioUtils": ".audio",
+    "emit_event": ".events",
+    "timed_event": ".events",
+    "configure_events": ".events"
+})
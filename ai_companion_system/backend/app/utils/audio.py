@@ -1,7 +1,101 @@
-import pyaudio
+from functools import lru_cache
+from math import gcd
 import numpy as np
 from app.utils.logger import audio_logger
 
+AUDIO_FORMATS = ("int16", "float32", "bytes")
+
+
+@lru_cache(maxsize=32)
+def get_polyphase_filter(from_rate, to_rate, num_zeros=16, beta=8.0):
+    """按采样率对设计多相低通滤波器（结果缓存，每个采样率对只计算一次）
+
+    返回(up, down, phases, delay)：phases形状为(up, taps)，按时间正序存放，phases[p, taps - 1 - k] = h[p + k * up]；
+    delay为原型滤波器在上采样率下的群延迟，用于对齐输出。
+    """
+    g = gcd(int(from_rate), int(to_rate))
+    up, down = int(to_rate) // g, int(from_rate) // g
+
+    # Kaiser窗sinc，截止频率取输入/输出奈奎斯特频率中较低者（留5%过渡带）
+    cutoff = 0.95 / max(up, down)
+    taps = int(np.ceil(2 * num_zeros * max(up, down) / up))
+    length = taps * up
+    # 以整数延迟为中心，保证滤波器严格对称（长度为偶数时末尾补零）
+    delay = (length - 1) // 2
+    window = np.zeros(length)
+    window[:2 * delay + 1] = np.kaiser(2 * delay + 1, beta)
+    h = up * cutoff * np.sinc(cutoff * (np.arange(length) - delay)) * window
+
+    # 每个相位的系数翻转为时间正序，便于直接与连续的输入窗口做点积
+    phases = np.ascontiguousarray(h.reshape(taps, up).T[:, ::-1], dtype=np.float32)
+    phases.flags.writeable = False
+    return up, down, phases, delay
+
+
+class StreamResampler:
+    """流式多相重采样器
+
+    分块输入时保留滤波所需的历史样本，输出与一次性处理整段音频完全一致；
+    结束时调用flush输出滤波器延迟内剩余的样本。
+    """
+
+    def __init__(self, from_rate, to_rate):
+        self.from_rate = int(from_rate)
+        self.to_rate = int(to_rate)
+        self._up, self._down, self._phases, self._delay = get_polyphase_filter(self.from_rate, self.to_rate)
+        self._taps = self._phases.shape[1]
+        self.reset()
+
+    def reset(self):
+        # 缓冲区第一个样本的绝对序号，开头用零填充作为历史
+        self._buffer = np.zeros(self._taps - 1, dtype=np.float32)
+        self._buffer_start = -(self._taps - 1)
+        self._consumed = 0
+        self._out_pos = 0
+
+    def _emit(self, available, limit=None):
+        """输出所有依赖的输入样本序号小于available的输出样本"""
+        end = (available * self._up - 1 - self._delay) // self._down + 1
+        if limit is not None:
+            end = min(end, limit)
+        if end <= self._out_pos:
+            return np.zeros(0, dtype=np.float32)
+
+        t = np.arange(self._out_pos, end) * self._down + self._delay
+        n, phase = np.divmod(t, self._up)
+        # windows[j] = buffer[j:j + taps]（零拷贝视图），对应输入x[n - taps + 1 .. n]
+        windows = np.lib.stride_tricks.sliding_window_view(self._buffer, self._taps)
+        rows = n - (self._taps - 1) - self._buffer_start
+        out = np.einsum('ij,ij->i', windows[rows], self._phases[phase])
+        self._out_pos = end
+
+        # 只保留下一个输出样本仍需要的历史
+        next_n = (end * self._down + self._delay) // self._up
+        drop = next_n - (self._taps - 1) - self._buffer_start
+        if drop > 0:
+            self._buffer = self._buffer[drop:]
+            self._buffer_start += drop
+        return out.astype(np.float32, copy=False)
+
+    def process(self, samples):
+        """输入一块单声道样本（任意dtype按数值处理），返回float32输出"""
+        samples = np.asarray(samples, dtype=np.float32)
+        if len(samples) == 0:
+            return np.zeros(0, dtype=np.float32)
+        self._buffer = np.concatenate((self._buffer, samples))
+        self._consumed += len(samples)
+        return self._emit(self._consumed)
+
+    def flush(self):
+        """输出剩余样本并重置状态，总输出长度为ceil(输入长度 * to_rate / from_rate)"""
+        total = -(-self._consumed * self._up // self._down)
+        pad = self._delay // self._up + 2
+        self._buffer = np.concatenate((self._buffer, np.zeros(pad, dtype=np.float32)))
+        out = self._emit(self._consumed + pad, limit=total)
+        self.reset()
+        return out
+
+
 class AudioUtils:
     @staticmethod
     def calculate_energy(audio_frame):
@@ -35,23 +129,123 @@ class AudioUtils:
             return 0
     
     @staticmethod
-    def convert_audio_format(audio_data, from_format, to_format):
-        """转换音频格式"""
+    def to_int16(audio_data):
+        """字节串、int16或[-1, 1]浮点数组统一转换为int16数组（int16输入不拷贝）"""
+        if isinstance(audio_data, (bytes, bytearray, memoryview)):
+            return np.frombuffer(audio_data, dtype=np.int16)
+        audio = np.asarray(audio_data)
+        if audio.dtype == np.int16:
+            return audio
+        if np.issubdtype(audio.dtype, np.floating):
+            return (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+        return np.clip(audio, -32768, 32767).astype(np.int16)
+    
+    @staticmethod
+    def to_float32(audio_data):
+        """字节串、int16或浮点数组统一转换为[-1, 1]的float32数组"""
+        if isinstance(audio_data, (bytes, bytearray, memoryview)):
+            audio_data = np.frombuffer(audio_data, dtype=np.int16)
+        audio = np.asarray(audio_data)
+        if np.issubdtype(audio.dtype, np.floating):
+            return audio.astype(np.float32, copy=False)
+        return audio.astype(np.float32) / 32768.0
+    
+    @staticmethod
+    def convert_channels(audio_data, from_channels, to_channels):
+        """交错排列的多声道数据转换声道数（下混取平均，上混复制）"""
+        audio = np.asarray(audio_data)
+        if from_channels == to_channels:
+            return audio
+        frames = audio[:len(audio) - len(audio) % from_channels].reshape(-1, from_channels)
+        if to_channels == 1:
+            mixed = frames.mean(axis=1)
+            return mixed.astype(audio.dtype) if np.issubdtype(audio.dtype, np.integer) else mixed.astype(np.float32)
+        mono = frames.mean(axis=1) if from_channels > 1 else frames[:, 0]
+        return np.repeat(mono.astype(audio.dtype), to_channels)
+    
+    @staticmethod
+    def resample(audio_data, from_rate, to_rate):
+        """多相重采样，输出dtype与输入一致（字节串输入返回int16数组）"""
+        if isinstance(audio_data, (bytes, bytearray, memoryview)):
+            audio_data = np.frombuffer(audio_data, dtype=np.int16)
+        audio = np.asarray(audio_data)
+        if from_rate == to_rate or len(audio) == 0:
+            return audio
+        
+        resampler = StreamResampler(from_rate, to_rate)
+        block = 1 << 16
+        # 分块处理以限制中间矩阵的内存占用
+        parts = [resampler.process(audio[i:i + block]) for i in range(0, len(audio), block)]
+        parts.append(resampler.flush())
+        out = np.concatenate(parts)
+        if np.issubdtype(audio.dtype, np.integer):
+            return np.clip(np.round(out), -32768, 32767).astype(audio.dtype)
+        return out.astype(audio.dtype, copy=False)
+    
+    @staticmethod
+    def convert_audio_format(audio_data, from_format, to_format, from_rate=None, to_rate=None,
+                             from_channels=1, to_channels=1):
+        """转换音频格式
+
+        格式为"int16"、"float32"或"bytes"（int16 PCM字节串），可同时转换声道数和采样率
+        """
         try:
-            if from_format == to_format:
+            if from_format not in AUDIO_FORMATS or to_format not in AUDIO_FORMATS:
+                audio_logger.error(f"不支持的音频格式: {from_format} -> {to_format}")
+                return audio_data
+            if from_format == to_format and from_channels == to_channels and from_rate == to_rate:
                 return audio_data
             
-            # 这里可以添加不同格式之间的转换逻辑
-            audio_logger.info(f"转换音频格式: {from_format} -> {to_format}")
-            return audio_data
+            if from_format == "float32":
+                audio = np.asarray(audio_data, dtype=np.float32)
+            else:
+                audio = AudioUtils.to_int16(audio_data)
+            
+            audio = AudioUtils.convert_channels(audio, from_channels, to_channels)
+            if from_rate and to_rate and from_rate != to_rate:
+                # 统一在float32上滤波，避免多次量化
+                audio = AudioUtils.resample(AudioUtils.to_float32(audio), from_rate, to_rate)
+            
+            if to_format == "float32":
+                return AudioUtils.to_float32(audio)
+            audio = AudioUtils.to_int16(audio)
+            return audio.tobytes() if to_format == "bytes" else audio
         except Exception as e:
             audio_logger.error(f"转换音频格式失败: {e}")
             return audio_data
     
+    @staticmethod
+    def load_wav(path, target_rate=16000):
+        """读取PCM WAV文件（8/16/32位），下混为单声道并重采样到target_rate，返回[-1, 1]的float32数组
+        
+        只依赖标准库wave模块；格式不支持时抛出ValueError
+        """
+        import wave
+        with wave.open(path, 'rb') as wav:
+            channels = wav.getnchannels()
+            sample_width = wav.getsampwidth()
+            rate = wav.getframerate()
+            data = wav.readframes(wav.getnframes())
+        
+        if sample_width == 1:
+            audio = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+        elif sample_width == 2:
+            audio = np.frombuffer(data, dtype='<i2').astype(np.float32) / 32768.0
+        elif sample_width == 4:
+            audio = np.frombuffer(data, dtype='<i4').astype(np.float32) / 2147483648.0
+        else:
+            raise ValueError(f"不支持的WAV采样位宽: {sample_width * 8}位")
+        
+        audio = AudioUtils.convert_channels(audio, channels, 1)
+        if target_rate and rate != target_rate:
+            audio = AudioUtils.resample(audio, rate, target_rate)
+        return audio.astype(np.float32, copy=False)
+    
     @staticmethod
     def get_audio_devices():
         """获取音频设备列表"""
         try:
+            import pyaudio
             p = pyaudio.PyAudio()
             devices = []
             
@@ -0,0 +1,216 @@
+import fnmatch
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from app.utils.logger import app_logger
+
+
+class EventPolicy:
+    """一类事件的输出策略
+
+    enabled: 是否输出；sample_rate: 采样比例（0~1）；
+    rate_limit: 每秒最多输出条数（令牌桶，None为不限制），burst为桶容量。
+    """
+    __slots__ = ('enabled', 'sample_rate', 'rate_limit', 'burst')
+
+    def __init__(self, enabled=True, sample_rate=1.0, rate_limit=None, burst=None):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.rate_limit = rate_limit
+        self.burst = burst
+
+    def to_dict(self):
+        return {
+            'enabled': self.enabled,
+            'sample_rate': self.sample_rate,
+            'rate_limit': self.rate_limit,
+            'burst': self.burst
+        }
+
+
+class _EventState:
+    """单个事件的令牌桶与统计"""
+    __slots__ = ('policy', 'tokens', 'last', 'count', 'emitted', 'sampled_out', 'rate_limited',
+                 'suppressed', 'timed', 'total_ms', 'max_ms')
+
+    def __init__(self, policy):
+        self.policy = policy
+        self.tokens = policy.burst or policy.rate_limit or 0
+        self.last = time.monotonic()
+        self.count = 0
+        self.emitted = 0
+        self.sampled_out = 0
+        self.rate_limited = 0
+        # 上次输出之后被限流丢弃的条数，随下一条输出的事件一起记录
+        self.suppressed = 0
+        self.timed = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+
+class _EventFields:
+    """事件字段，记录未被日志级别过滤时才拼接为 key=value 文本"""
+    __slots__ = ('fields',)
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def __str__(self):
+        return ''.join(f' {key}={value}' for key, value in self.fields.items())
+
+
+# 按通配符匹配事件名的策略；默认每类事件每秒最多50条
+_policies = {'*': EventPolicy(rate_limit=50, burst=100)}
+_states = {}
+_lock = threading.Lock()
+_enabled = True
+
+
+def _resolve_policy(name):
+    # 多个通配符匹配时取最具体的（去掉通配符后最长的）
+    matches = [pattern for pattern in _policies if fnmatch.fnmatchcase(name, pattern)]
+    if not matches:
+        return EventPolicy()
+    return _policies[max(matches, key=lambda pattern: len(pattern.strip('*?')))]
+
+
+def _get_state(name):
+    state = _states.get(name)
+    if state is None:
+        state = _states[name] = _EventState(_resolve_policy(name))
+    return state
+
+
+def _take_token(state, now):
+    policy = state.policy
+    if policy.rate_limit is None:
+        return True
+    capacity = policy.burst or policy.rate_limit
+    state.tokens = min(capacity, state.tokens + (now - state.last) * policy.rate_limit)
+    state.last = now
+    if state.tokens >= 1:
+        state.tokens -= 1
+        return True
+    return False
+
+
+def emit_event(name, level=logging.INFO, duration=None, logger=None, exc_info=False, **fields):
+    """记录一条结构化事件
+
+    name为点分的事件名（如"tts.speak"），fields为附加字段，duration为耗时（秒）。
+    事件经由日志队列写入logger（默认app_logger）对应的日志文件，
+    并在LogRecord上附带event/event_fields/duration_ms属性供其他处理器使用。
+    按事件名的策略做开关、采样和限流，被丢弃的事件只计入统计，不做任何格式化。
+    """
+    if not _enabled:
+        return False
+    logger = logger or app_logger
+    duration_ms = None if duration is None else duration * 1000.0
+
+    with _lock:
+        state = _get_state(name)
+        state.count += 1
+        if duration_ms is not None:
+            state.timed += 1
+            state.total_ms += duration_ms
+            state.max_ms = max(state.max_ms, duration_ms)
+
+        policy = state.policy
+        # 错误级别的事件不采样
+        if not policy.enabled or not logger.isEnabledFor(level):
+            return False
+        if level < logging.ERROR and policy.sample_rate < 1.0 and random.random() >= policy.sample_rate:
+            state.sampled_out += 1
+            return False
+        if not _take_token(state, time.monotonic()):
+            state.rate_limited += 1
+            state.suppressed += 1
+            return False
+        state.emitted += 1
+        suppressed, state.suppressed = state.suppressed, 0
+
+    if duration_ms is not None:
+        fields['duration_ms'] = round(duration_ms, 2)
+    if suppressed:
+        fields['suppressed'] = suppressed
+    logger.log(
+        level, '[%s]%s', name, _EventFields(fields), exc_info=exc_info,
+        extra={'event': name, 'event_fields': fields, 'duration_ms': duration_ms}
+    )
+    return True
+
+
+@contextmanager
+def timed_event(name, level=logging.INFO, logger=None, **fields):
+    """计时事件：with块结束时记录耗时；块内抛出异常时以ERROR级别记录后继续抛出
+
+    with块内可以向返回的字典中补充字段。
+    """
+    start = time.perf_counter()
+    try:
+        yield fields
+    except Exception as e:
+        fields['error'] = e
+        emit_event(name, logging.ERROR, time.perf_counter() - start, logger, **fields)
+        raise
+    emit_event(name, level, time.perf_counter() - start, logger, **fields)
+
+
+def configure_events(pattern='*', enabled=None, sample_rate=None, rate_limit=None, burst=None):
+    """运行时调整匹配pattern（通配符，如"tts.*"）的事件的输出策略，未给出的参数保持不变
+
+    rate_limit传0表示不限流。
+    """
+    with _lock:
+        policy = _policies.get(pattern) or EventPolicy(**_resolve_policy(pattern).to_dict())
+        if enabled is not None:
+            policy.enabled = enabled
+        if sample_rate is not None:
+            policy.sample_rate = max(0.0, min(1.0, sample_rate))
+        if rate_limit is not None:
+            policy.rate_limit = rate_limit or None
+        if burst is not None:
+            policy.burst = burst or None
+        _policies[pattern] = policy
+
+        # 重新匹配已有事件的策略，统计保留
+        for event, state in _states.items():
+            state.policy = _resolve_policy(event)
+            state.tokens = min(state.tokens, state.policy.burst or state.policy.rate_limit or 0)
+        return policy
+
+
+def set_events_enabled(enabled):
+    """全局开关，关闭后emit_event直接返回"""
+    global _enabled
+    _enabled = enabled
+
+
+def get_event_policies():
+    with _lock:
+        return {pattern: policy.to_dict() for pattern, policy in _policies.items()}
+
+
+def get_event_stats():
+    """各事件的调用次数、实际输出/采样丢弃/限流丢弃次数及耗时统计"""
+    with _lock:
+        return {
+            name: {
+                'count': state.count,
+                'emitted': state.emitted,
+                'sampled_out': state.sampled_out,
+                'rate_limited': state.rate_limited,
+                'total_ms': round(state.total_ms, 2),
+                'avg_ms': round(state.total_ms / state.timed, 2) if state.timed else None,
+                'max_ms': round(state.max_ms, 2)
+            }
+            for name, state in _states.items()
+        }
+
+
+def reset_event_stats():
+    with _lock:
+        _states.clear()
@@ -0,0 +1,26 @@
+import importlib
+import sys
+
+
+def lazy_module(module_name, attrs):
+    """包的按需导入
+
+    attrs为{属性名: 相对模块名}，第一次访问属性时才导入对应子模块，并缓存到包的命名空间中。
+    在包的__init__.py中使用：
+
+        __getattr__, __dir__, __all__ = lazy_module(__name__, {"ChatGUI": ".chat_gui"})
+    """
+    names = list(attrs)
+
+    def __getattr__(name):
+        relative = attrs.get(name)
+        if relative is None:
+            raise AttributeError(f"module {module_name!r} has no attribute {name!r}")
+        value = getattr(importlib.import_module(relative, module_name), name)
+        setattr(sys.modules[module_name], name, value)
+        return value
+
+    def __dir__():
+        return sorted(set(vars(sys.modules[module_name])) | set(names))
+
+    return __getattr__, __dir__, names
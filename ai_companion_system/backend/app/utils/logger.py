@@ -1,5 +1,10 @@
+import atexit
+import copy
 import logging
+import logging.handlers
 import os
+import queue
+import threading
 
 # 默认日志目录
 DEFAULT_LOG_DIR = 'logs'
@@ -7,58 +12,189 @@ DEFAULT_LOG_DIR = 'logs'
 # 当前日志目录
 current_log_dir = DEFAULT_LOG_DIR
 
-def setup_logger(name, log_file, level=logging.INFO):
-    """设置日志记录器"""
-    # 简化日志格式
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    
-    # 确保日志目录存在
+# 子系统日志记录器及其日志文件名
+LOGGER_NAMES = ('app', 'audio', 'chat', 'emotion')
+
+# 每轮对话的延迟trace（JSONL，每行一轮），与日志共用队列和写线程
+TRACE_LOGGER_NAME = 'trace'
+TRACE_FILE = 'traces.jsonl'
+
+# 日志轮转：size按文件大小，time按天（午夜）
+ROTATION = 'size'
+MAX_BYTES = 10 * 1024 * 1024
+BACKUP_COUNT = 5
+
+# 队列容量：写线程跟不上时丢弃新记录，而不是阻塞调用方
+QUEUE_SIZE = 10000
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """只把日志记录放入队列的处理器
+
+    调用线程（如音频回调、推理线程）里只合并消息参数并做一次put_nowait：
+    时间和格式模板在写线程中处理，队列满时丢弃并计数，永远不会阻塞。
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 与标准QueueHandler一样在调用线程中合并msg % args：参数可能是可变对象，
+        # 写线程格式化时其值可能已被调用方修改；时间、级别等格式化仍在写线程中进行
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # 异常堆栈在这里展开为文本，避免在队列中持有traceback及其引用的栈帧
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _LoggingState:
+    """队列与唯一的写线程（QueueListener），切换日志目录时只替换文件处理器"""
+
+    def __init__(self):
+        self.queue = queue.Queue(QUEUE_SIZE)
+        self.queue_handler = _NonBlockingQueueHandler(self.queue)
+        self.listener = None
+        self.file_handlers = []
+        self.lock = threading.Lock()
+
+
+_state = _LoggingState()
+
+
+def _create_file_handler(log_file, rotation=None, max_bytes=None, backup_count=None, fmt=LOG_FORMAT):
+    """创建带轮转的文件处理器"""
+    rotation = rotation or ROTATION
+    backup_count = BACKUP_COUNT if backup_count is None else backup_count
+
     log_dir = os.path.dirname(log_file)
     if log_dir:
         os.makedirs(log_dir, exist_ok=True)
-    
-    # 文件处理器
-    file_handler = logging.FileHandler(log_file)
-    file_handler.setFormatter(formatter)
-    
-    # 创建日志记录器
-    logger = logging.getLogger(name)
-    
-    # 清除现有处理器
+
+    if rotation == 'time':
+        handler = logging.handlers.TimedRotatingFileHandler(
+            log_file, when='midnight', backupCount=backup_count, encoding='utf-8', delay=True
+        )
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=MAX_BYTES if max_bytes is None else max_bytes,
+            backupCount=backup_count, encoding='utf-8', delay=True
+        )
+    handler.setFormatter(logging.Formatter(fmt))
+    return handler
+
+
+def _restart_listener(file_handlers):
+    """停止旧的写线程（先写完队列中已有的记录），换上新的文件处理器后重新启动"""
+    with _state.lock:
+        if _state.listener is not None:
+            _state.listener.stop()
+        for handler in _state.file_handlers:
+            if handler not in file_handlers:
+                handler.close()
+
+        _state.file_handlers = file_handlers
+        _state.listener = logging.handlers.QueueListener(
+            _state.queue, *file_handlers, respect_handler_level=True
+        )
+        _state.listener.start()
+
+
+def _attach_queue_handler(logger, level):
     for handler in logger.handlers[:]:
         logger.removeHandler(handler)
-    
     logger.setLevel(level)
-    logger.addHandler(file_handler)
-    
+    logger.addHandler(_state.queue_handler)
+    # 不再向根记录器传播，避免其他同步处理器在调用线程中写日志
+    logger.propagate = False
+
+
+def setup_logger(name, log_file, level=logging.INFO, rotation=None):
+    """设置日志记录器：调用方只写队列，由后台写线程输出到带轮转的log_file"""
+    handler = _create_file_handler(log_file, rotation)
+    # 按记录器名称过滤，队列里的记录只写入对应的文件
+    handler.addFilter(logging.Filter(name))
+
+    with _state.lock:
+        others = [h for h in _state.file_handlers
+                  if not any(f.name == name for f in h.filters)]
+    _restart_listener(others + [handler])
+
+    logger = logging.getLogger(name)
+    _attach_queue_handler(logger, level)
     return logger
 
+
 def set_log_directory(log_dir):
     """设置日志目录"""
     global current_log_dir
     current_log_dir = log_dir
-    
+
     # 创建日志目录
     os.makedirs(log_dir, exist_ok=True)
-    
+
     # 重新初始化日志记录器
     initialize_loggers(log_dir)
 
-def initialize_loggers(log_dir=DEFAULT_LOG_DIR):
-    """初始化日志记录器"""
-    global app_logger, audio_logger, chat_logger, emotion_logger
-    
-    # 应用日志
-    app_logger = setup_logger('app', os.path.join(log_dir, 'app.log'))
-    
-    # 音频日志
-    audio_logger = setup_logger('audio', os.path.join(log_dir, 'audio.log'))
-    
-    # 对话日志
-    chat_logger = setup_logger('chat', os.path.join(log_dir, 'chat.log'))
-    
-    # 情感分析日志
-    emotion_logger = setup_logger('emotion', os.path.join(log_dir, 'emotion.log'))
+
+def initialize_loggers(log_dir=DEFAULT_LOG_DIR, level=logging.INFO, rotation=None):
+    """初始化日志记录器
+
+    记录器对象保持不变（其他模块在导入时已持有引用），只替换写线程的文件处理器。
+    """
+    global app_logger, audio_logger, chat_logger, emotion_logger, trace_logger
+
+    handlers = []
+    for name in LOGGER_NAMES:
+        handler = _create_file_handler(os.path.join(log_dir, f'{name}.log'), rotation)
+        handler.addFilter(logging.Filter(name))
+        handlers.append(handler)
+    trace_handler = _create_file_handler(os.path.join(log_dir, TRACE_FILE), rotation, fmt='%(message)s')
+    trace_handler.addFilter(logging.Filter(TRACE_LOGGER_NAME))
+    handlers.append(trace_handler)
+    _restart_listener(handlers)
+
+    loggers = [logging.getLogger(name) for name in LOGGER_NAMES]
+    for logger in loggers:
+        _attach_queue_handler(logger, level)
+
+    # 应用日志、音频日志、对话日志、情感分析日志
+    app_logger, audio_logger, chat_logger, emotion_logger = loggers
+
+    # trace记录不受日志级别影响
+    trace_logger = logging.getLogger(TRACE_LOGGER_NAME)
+    _attach_queue_handler(trace_logger, logging.INFO)
+
+
+def get_dropped_count():
+    """队列满时被丢弃的日志条数"""
+    return _state.queue_handler.dropped
+
+
+def shutdown_logging():
+    """停止写线程并写完队列中剩余的日志（程序退出时自动调用）"""
+    with _state.lock:
+        if _state.listener is not None:
+            _state.listener.stop()
+            _state.listener = None
+        for handler in _state.file_handlers:
+            handler.close()
+        _state.file_handlers = []
+
+
+atexit.register(shutdown_logging)
 
 # 初始化默认日志记录器
 initialize_loggers()
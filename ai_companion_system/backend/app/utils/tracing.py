@@ -0,0 +1,233 @@
+import contextvars
+import functools
+import itertools
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+from app.utils.logger import trace_logger
+
+# 每个阶段保留最近多少次耗时用于计算分位数
+STATS_WINDOW = 1000
+
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+_latencies = {}
+_latencies_lock = threading.Lock()
+
+
+class Span:
+    """一个阶段的耗时，时间为相对所属trace开始的单调时钟（纳秒）"""
+    __slots__ = ('name', 'span_id', 'parent_id', 'start_ns', 'end_ns', 'thread', 'attrs')
+
+    def __init__(self, name, span_id, parent_id, start_ns, attrs):
+        self.name = name
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.start_ns = start_ns
+        self.end_ns = None
+        self.thread = threading.current_thread().name
+        self.attrs = attrs
+
+    @property
+    def duration_ms(self):
+        return None if self.end_ns is None else (self.end_ns - self.start_ns) / 1e6
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self, origin_ns):
+        return {
+            'name': self.name,
+            'id': self.span_id,
+            'parent': self.parent_id,
+            'start_ms': round((self.start_ns - origin_ns) / 1e6, 3),
+            'duration_ms': None if self.end_ns is None else round(self.duration_ms, 3),
+            'thread': self.thread,
+            **({'attrs': self.attrs} if self.attrs else {})
+        }
+
+
+class Trace:
+    """一轮对话的时间线
+
+    由start_trace创建并放入当前上下文，各阶段用span()记录；
+    一轮对话会跨越多个线程（录音、并行阶段、TTS播放），由最后一个阶段调用finish()写出。
+    """
+
+    def __init__(self, name, attrs):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = dict(attrs)
+        self.wall_start = time.time()
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns = None
+        self.spans = []
+        self.marks = {}
+        self.finished = False
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def elapsed_ms(self):
+        return (time.perf_counter_ns() - self.start_ns) / 1e6
+
+    def mark(self, name):
+        """记录一个时间点（相对trace开始的毫秒数）"""
+        self.marks[name] = round(self.elapsed_ms(), 3)
+        return self.marks[name]
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def _new_span(self, name, parent, attrs):
+        return Span(name, next(self._ids), parent.span_id if parent else None, time.perf_counter_ns(), attrs)
+
+    def _add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def finish(self):
+        """结束本轮：写入trace文件并计入各阶段的延迟统计，重复调用无效"""
+        with self._lock:
+            if self.finished:
+                return False
+            self.finished = True
+            self.end_ns = time.perf_counter_ns()
+            spans = list(self.spans)
+
+        for span in spans:
+            if span.end_ns is not None:
+                record_latency(span.name, span.duration_ms)
+        record_latency(self.name, (self.end_ns - self.start_ns) / 1e6)
+        trace_logger.info('%s', _TraceLine(self))
+        return True
+
+    def cancel(self):
+        """放弃本轮（如未检测到语音），不写出也不计入统计"""
+        with self._lock:
+            self.finished = True
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'timestamp': self.wall_start,
+            'duration_ms': None if self.end_ns is None else round((self.end_ns - self.start_ns) / 1e6, 3),
+            'attrs': self.attrs,
+            'marks': self.marks,
+            'spans': [span.to_dict(self.start_ns) for span in sorted(self.spans, key=lambda s: s.start_ns)]
+        }
+
+
+class _TraceLine:
+    """trace的JSON行，记录未被日志级别过滤时才序列化"""
+    __slots__ = ('trace',)
+
+    def __init__(self, trace):
+        self.trace = trace
+
+    def __str__(self):
+        return json.dumps(self.trace.to_dict(), ensure_ascii=False, default=str)
+
+
+def start_trace(name='turn', **attrs):
+    """开始新一轮trace并设为当前上下文的trace"""
+    trace = Trace(name, attrs)
+    _current_trace.set(trace)
+    _current_span.set(None)
+    return trace
+
+
+def current_trace():
+    """当前上下文中未结束的trace，没有时返回None"""
+    trace = _current_trace.get()
+    if trace is None or trace.finished:
+        return None
+    return trace
+
+
+def detach_trace():
+    """当前上下文不再关联trace（已交给其他线程继续时调用），后续的span不再记录"""
+    _current_trace.set(None)
+    _current_span.set(None)
+
+
+@contextmanager
+def span(name, **attrs):
+    """记录一个阶段；当前上下文没有trace时不做任何记录，返回None"""
+    trace = _current_trace.get()
+    if trace is None or trace.finished:
+        yield None
+        return
+
+    parent = _current_span.get()
+    current = trace._new_span(name, parent, attrs)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.attrs['error'] = repr(e)
+        raise
+    finally:
+        current.end_ns = time.perf_counter_ns()
+        _current_span.reset(token)
+        trace._add(current)
+
+
+def wrap(func):
+    """绑定当前上下文（含trace和父span），用于提交到线程池或新线程
+
+    线程池和threading.Thread不会自动继承contextvars；每次提交都需要重新wrap一次。
+    """
+    return functools.partial(contextvars.copy_context().run, func)
+
+
+def record_latency(name, duration_ms):
+    with _latencies_lock:
+        samples = _latencies.get(name)
+        if samples is None:
+            samples = _latencies[name] = deque(maxlen=STATS_WINDOW)
+        samples.append(duration_ms)
+
+
+def summarize(samples):
+    """耗时样本（毫秒） -> 次数、均值、p50/p95/p99、最大值"""
+    values = np.asarray(samples, dtype=np.float64)
+    if values.size == 0:
+        return {'count': 0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        'count': int(values.size),
+        'mean': round(float(values.mean()), 2),
+        'p50': round(float(p50), 2),
+        'p95': round(float(p95), 2),
+        'p99': round(float(p99), 2),
+        'max': round(float(values.max()), 2)
+    }
+
+
+def get_latency_summary():
+    """最近STATS_WINDOW轮中各阶段耗时的分位数统计，{阶段: {count, mean, p50, p95, p99, max}}"""
+    with _latencies_lock:
+        snapshot = {name: list(samples) for name, samples in _latencies.items()}
+    return {name: summarize(samples) for name, samples in snapshot.items()}
+
+
+def format_latency_summary(names=None):
+    summary = get_latency_summary()
+    names = names or sorted(summary)
+    return "; ".join(
+        f"{name} p50 {summary[name]['p50']:.0f}/p95 {summary[name]['p95']:.0f}/p99 {summary[name]['p99']:.0f}ms"
+        for name in names if summary.get(name, {}).get('count')
+    )
+
+
+def reset_latency_stats():
+    with _latencies_lock:
+        _latencies.clear()
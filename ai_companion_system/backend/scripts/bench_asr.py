@@ -0,0 +1,97 @@
+"""ASR推理模式基准测试
+
+对比不同量化/编码器模式和线程数下的实时率（RTF = 识别耗时 / 音频时长，越小越好）。
+未指定音频文件时使用合成的语音频段信号，仅用于测耗时。
+
+用法:
+    python scripts/bench_asr.py --audio sample.wav --threads 1,2,4
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+CONFIGS = [
+    ("none", "eager"),
+    ("int8", "eager"),
+    ("none", "torchscript"),
+    ("int8", "torchscript"),
+    ("none", "compile"),
+]
+
+
+def load_audio(path: str, duration: float) -> np.ndarray:
+    if path:
+        import librosa
+        audio, _ = librosa.load(path, sr=16000)
+        return audio.astype(np.float32)
+
+    # 合成带调制的谐波信号，长度与真实语句相近
+    t = np.arange(int(16000 * duration)) / 16000
+    envelope = 0.5 * (1 + np.sin(2 * np.pi * 3 * t))
+    signal = sum(np.sin(2 * np.pi * f * t) / (i + 1) for i, f in enumerate((180, 360, 540, 720)))
+    rng = np.random.default_rng(0)
+    return (0.1 * envelope * signal + 0.005 * rng.standard_normal(len(t))).astype(np.float32)
+
+
+def bench_config(quantization, encoder_mode, num_threads, audio, repeats):
+    from app.models.asr_model import QwenASRModel
+
+    start = time.perf_counter()
+    model = QwenASRModel(device="cpu", quantization=quantization, encoder_mode=encoder_mode, num_threads=num_threads)
+    if not model.initialize():
+        return None
+    load_time = time.perf_counter() - start
+
+    # 第一次调用包含编译/追踪等一次性开销，不计入统计
+    text = model.transcribe(audio)
+    timings = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        model.transcribe(audio)
+        timings.append(time.perf_counter() - t0)
+
+    info = model.get_optimization_info()
+    model.unload()
+    return {
+        "load_time_s": load_time,
+        "rtf": float(np.median(timings)) / (len(audio) / 16000),
+        "encoder_optimized": info["encoder_optimized"],
+        "text": text,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ASR推理模式基准测试")
+    parser.add_argument("--audio", default=None, help="16kHz音频文件，不指定则使用合成信号")
+    parser.add_argument("--duration", type=float, default=5.0, help="合成信号时长（秒）")
+    parser.add_argument("--threads", default=str(os.cpu_count() or 1), help="逗号分隔的线程数列表")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    audio = load_audio(args.audio, args.duration)
+    print(f"音频时长: {len(audio) / 16000:.2f}s")
+    print(f"{'量化':<6}{'编码器':<13}{'线程':>4}{'加载(s)':>10}{'RTF':>8}{'加速比':>8}  文本")
+
+    for threads in [int(n) for n in args.threads.split(",")]:
+        baseline_rtf = None
+        for quantization, encoder_mode in CONFIGS:
+            result = bench_config(quantization, encoder_mode, threads, audio, args.repeats)
+            if result is None:
+                print(f"{quantization:<6}{encoder_mode:<13}{threads:>4}  加载失败")
+                continue
+            if baseline_rtf is None:
+                baseline_rtf = result["rtf"]
+            mode_label = encoder_mode if result["encoder_optimized"] or encoder_mode == "eager" else f"{encoder_mode}(回退)"
+            print(f"{quantization:<6}{mode_label:<13}{threads:>4}{result['load_time_s']:>10.2f}"
+                  f"{result['rtf']:>8.3f}{baseline_rtf / result['rtf']:>8.2f}  {result['text'][:20]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""回声抑制基准测试
+
+合成"TTS播放参考信号 -> 延迟+衰减的房间回声 -> 麦克风"的场景（中间插入一段近端说话），
+按30ms帧逐帧运行EchoSuppressor，报告实时率（处理耗时 / 音频时长）、单核余量和回声抑制量（ERLE）。
+
+用法:
+    python scripts/bench_echo.py --duration 60 --taps 512
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+RATE = 16000
+
+
+def speech_like(num_samples, rng, base_freq):
+    """带音节包络和基频抖动的谐波信号"""
+    t = np.arange(num_samples) / RATE
+    f0 = base_freq * (1 + 0.1 * np.sin(2 * np.pi * 0.7 * t))
+    phase = 2 * np.pi * np.cumsum(f0) / RATE
+    signal = sum(np.sin(k * phase) / k for k in range(1, 6))
+    envelope = np.clip(np.sin(2 * np.pi * 2.5 * t + rng.uniform(0, np.pi)), 0, None)
+    return (0.3 * envelope * signal + 0.01 * rng.standard_normal(num_samples)).astype(np.float32)
+
+
+def build_scene(duration, rng, echo_delay_ms):
+    n = int(duration * RATE)
+    reference = speech_like(n, rng, 180)
+
+    # 指数衰减的随机房间冲激响应 + 扬声器到麦克风的传播延迟
+    ir_length = 256
+    ir = rng.standard_normal(ir_length) * np.exp(-np.arange(ir_length) / 40)
+    ir = 0.6 * ir / np.linalg.norm(ir)
+    delay = int(echo_delay_ms * RATE / 1000)
+    echo = np.convolve(np.concatenate((np.zeros(delay), reference)), ir)[:n]
+
+    near = np.zeros(n, dtype=np.float32)
+    start, end = int(n * 0.6), int(n * 0.7)
+    near[start:end] = speech_like(end - start, rng, 240)
+    mic = echo + near + 0.001 * rng.standard_normal(n)
+    return reference, mic.astype(np.float32), echo.astype(np.float32), (start, end)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回声抑制基准测试")
+    parser.add_argument("--duration", type=float, default=30.0, help="合成音频时长（秒）")
+    parser.add_argument("--taps", type=int, default=512, help="NLMS滤波器长度")
+    parser.add_argument("--frame-ms", type=int, default=30)
+    parser.add_argument("--echo-delay-ms", type=float, default=8.0)
+    args = parser.parse_args()
+
+    from app.core.echo import EchoSuppressor, PlaybackReference
+    from app.utils.audio import AudioUtils
+
+    rng = np.random.default_rng(0)
+    reference, mic, echo, (near_start, near_end) = build_scene(args.duration, rng, args.echo_delay_ms)
+
+    # 参考信号按发声时间发布，麦克风帧按相同时间轴读取
+    playback = PlaybackReference(buffer_seconds=int(args.duration) + 1)
+    origin = time.monotonic()
+    playback.publish(reference, origin)
+    suppressor = EchoSuppressor(taps=args.taps, reference=playback)
+
+    frame = RATE * args.frame_ms // 1000
+    mic_int16 = AudioUtils.to_int16(mic)
+    out = np.zeros(len(mic), dtype=np.float32)
+    frame_times = []
+    for i in range(0, len(mic) - frame + 1, frame):
+        t0 = time.perf_counter()
+        out[i:i + frame] = AudioUtils.to_float32(suppressor.process(mic_int16[i:i + frame], origin + i / RATE))
+        frame_times.append(time.perf_counter() - t0)
+
+    audio_seconds = len(frame_times) * frame / RATE
+    rtf = sum(frame_times) / audio_seconds
+    frame_ms = np.array(frame_times) * 1000
+
+    def erle(mask):
+        return 10 * np.log10(np.mean(echo[mask] ** 2) / max(np.mean(out[mask] ** 2), 1e-12))
+
+    idx = np.arange(len(mic))
+    echo_only = (idx > 2 * RATE) & ((idx < near_start) | (idx >= near_end))
+    near_mask = (idx >= near_start) & (idx < near_end)
+    near_error = out[near_mask] - (mic[near_mask] - echo[near_mask])
+
+    print(f"音频时长: {audio_seconds:.1f}s  帧长: {args.frame_ms}ms  滤波器长度: {args.taps}")
+    print(f"实时率RTF: {rtf:.4f}  单核余量: {1 / rtf:.0f}x")
+    print(f"单帧耗时: 平均 {frame_ms.mean():.3f}ms  p99 {np.percentile(frame_ms, 99):.3f}ms  最大 {frame_ms.max():.3f}ms")
+    print(f"收敛后回声抑制ERLE: {erle(echo_only):.1f} dB  估计延迟: {suppressor.delay * 1000:.1f}ms")
+    print(f"双讲期间近端语音失真(SNR): {10 * np.log10(np.mean((mic[near_mask] - echo[near_mask]) ** 2) / max(np.mean(near_error ** 2), 1e-12)):.1f} dB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""情感特征提取基准测试
+
+对比原librosa实现（piptrack + rms + spectral_centroid + spectral_bandwidth + zero_crossing_rate，各自重新计算STFT）
+与单次STFT融合提取器的耗时和特征值。未安装librosa时只测试融合提取器。
+
+用法:
+    python scripts/bench_emotion_features.py --duration 10
+    python scripts/bench_emotion_features.py --audio sample.wav
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+RATE = 16000
+
+
+def load_audio(path: str, duration: float) -> np.ndarray:
+    if path:
+        import librosa
+        audio, _ = librosa.load(path, sr=RATE)
+        return audio.astype(np.float32)
+
+    # 基频在150~210Hz间缓慢变化、带音节包络的谐波信号
+    t = np.arange(int(RATE * duration)) / RATE
+    f0 = 180 + 30 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / RATE
+    envelope = np.clip(np.sin(2 * np.pi * 2.5 * t), 0, None)
+    signal = sum(np.sin(k * phase) / k for k in range(1, 6))
+    rng = np.random.default_rng(0)
+    return (0.2 * envelope * signal + 0.005 * rng.standard_normal(len(t))).astype(np.float32)
+
+
+def librosa_features(audio):
+    import librosa
+    f0, _ = librosa.piptrack(y=audio, sr=RATE)
+    f0 = f0[f0 > 0]
+    energy = librosa.feature.rms(y=audio)[0]
+    return {
+        'f0_mean': float(np.mean(f0)) if len(f0) else 0,
+        'f0_std': float(np.std(f0)) if len(f0) else 0,
+        'energy_mean': float(np.mean(energy)),
+        'spectral_centroid': float(np.mean(librosa.feature.spectral_centroid(y=audio, sr=RATE)[0])),
+        'spectral_bandwidth': float(np.mean(librosa.feature.spectral_bandwidth(y=audio, sr=RATE)[0])),
+        'zero_crossing_rate': float(np.mean(librosa.feature.zero_crossing_rate(y=audio)[0])),
+    }
+
+
+def best_time(func, audio, repeats):
+    func(audio)
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        result = func(audio)
+        times.append(time.perf_counter() - t0)
+    return min(times) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="情感特征提取基准测试")
+    parser.add_argument("--audio", default=None, help="音频文件，不指定则使用合成信号")
+    parser.add_argument("--duration", type=float, default=10.0, help="合成信号时长（秒）")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    from app.core.emotion_features import extract_emotion_features
+
+    audio = load_audio(args.audio, args.duration)
+    print(f"音频时长: {len(audio) / RATE:.1f}s")
+
+    fused_ms, fused = best_time(lambda a: extract_emotion_features(a, RATE), audio, args.repeats)
+    try:
+        librosa_ms, reference = best_time(librosa_features, audio, args.repeats)
+    except ImportError:
+        librosa_ms, reference = None, {}
+
+    print(f"融合提取器: {fused_ms:8.1f} ms")
+    if librosa_ms is not None:
+        print(f"librosa:    {librosa_ms:8.1f} ms  加速比 {librosa_ms / fused_ms:.0f}x")
+    print(f"{'特征':<20}{'融合':>12}{'librosa':>12}")
+    for key, value in fused.items():
+        ref = reference.get(key)
+        print(f"{key:<20}{value:>12.4f}{'' if ref is None else f'{ref:>12.4f}'}")
+    # piptrack返回所有频谱峰（含谐波），其f0与自相关基频不可直接比较
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""LLM量化模式基准测试
+
+每种模式在独立子进程中加载，避免内存统计互相干扰。输出加载耗时、常驻内存、
+模型权重大小、每token解码延迟，以及与float32基线贪心解码结果的文本相似度。
+
+用法:
+    python scripts/bench_llm_quantization.py --modes none,int8,bf16 --tokens 64
+"""
+import argparse
+import difflib
+import json
+import os
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+PROMPTS = [
+    "你好，今天心情有点低落。",
+    "能给我推荐一本适合睡前读的书吗？",
+    "请用两句话介绍一下你自己。",
+]
+
+
+def get_rss_mb() -> float:
+    """读取当前进程常驻内存（MB）"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_child(mode: str, max_new_tokens: int) -> dict:
+    import torch
+    from app.models.qwen_llm import QwenLLMModel
+    from app.models.optimization import get_model_size_mb
+
+    rss_before = get_rss_mb()
+    start = time.perf_counter()
+    llm = QwenLLMModel(device="cpu", quantization=mode)
+    if not llm.initialize():
+        return {"mode": mode, "error": "模型加载失败"}
+    load_time = time.perf_counter() - start
+
+    tokenizer = llm._tokenizer
+    model = llm._model
+    outputs = []
+    decode_times = []
+    for prompt in PROMPTS:
+        messages = [{"role": "user", "content": prompt}]
+        text = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        inputs = tokenizer([text], return_tensors="pt")
+        prompt_len = inputs["input_ids"].shape[1]
+
+        with torch.no_grad():
+            # 先生成1个token得到预填充耗时，再从总耗时中扣除，得到纯解码耗时
+            t0 = time.perf_counter()
+            model.generate(**inputs, max_new_tokens=1, do_sample=False, pad_token_id=tokenizer.eos_token_id)
+            prefill = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            generated = model.generate(**inputs, max_new_tokens=max_new_tokens, do_sample=False,
+                                       pad_token_id=tokenizer.eos_token_id)
+            total = time.perf_counter() - t0
+
+        new_tokens = generated.shape[1] - prompt_len
+        if new_tokens > 1:
+            decode_times.append((total - prefill) / (new_tokens - 1))
+        outputs.append(tokenizer.decode(generated[0][prompt_len:], skip_special_tokens=True))
+
+    return {
+        "mode": mode,
+        "load_time_s": load_time,
+        "rss_mb": get_rss_mb() - rss_before,
+        "model_size_mb": get_model_size_mb(model),
+        "decode_ms_per_token": 1000 * sum(decode_times) / len(decode_times) if decode_times else None,
+        "outputs": outputs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM量化模式基准测试")
+    parser.add_argument("--modes", default="none,int8,bf16", help="逗号分隔的量化模式")
+    parser.add_argument("--tokens", type=int, default=64, help="每条提示生成的最大token数")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.child, args.tokens), ensure_ascii=False))
+        return
+
+    results = []
+    for mode in args.modes.split(","):
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", mode, "--tokens", str(args.tokens)],
+            capture_output=True, text=True
+        )
+        lines = [line for line in proc.stdout.splitlines() if line.startswith("{")]
+        if not lines:
+            print(f"[Error] 模式{mode}运行失败:\n{proc.stderr[-2000:]}")
+            continue
+        results.append(json.loads(lines[-1]))
+
+    baseline = next((r for r in results if r.get("mode") == "none" and "outputs" in r), None)
+
+    print(f"{'模式':<6}{'加载(s)':>10}{'RSS(MB)':>10}{'权重(MB)':>10}{'解码(ms/token)':>16}{'相似度':>8}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['mode']:<6}{r['error']}")
+            continue
+        similarity = "-"
+        if baseline and r is not baseline:
+            ratios = [difflib.SequenceMatcher(None, a, b).ratio() for a, b in zip(baseline["outputs"], r["outputs"])]
+            similarity = f"{sum(ratios) / len(ratios):.2f}"
+        decode = r["decode_ms_per_token"]
+        print(f"{r['mode']:<6}{r['load_time_s']:>10.2f}{r['rss_mb']:>10.0f}{r['model_size_mb']:>10.0f}"
+              f"{(f'{decode:.1f}' if decode else '-'):>16}{similarity:>8}")
+
+
+if __name__ == "__main__":
+    main()
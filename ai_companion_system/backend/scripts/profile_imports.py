@@ -0,0 +1,79 @@
+"""启动导入耗时分析
+
+在独立子进程中用 python -X importtime 导入各入口模块，汇总总耗时，
+并列出累计耗时最高的模块，用来检查重量级依赖是否被意外提前导入。
+
+用法:
+    python scripts/profile_imports.py
+    python scripts/profile_imports.py --targets app.core,app.api --top 15
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FRONTEND_DIR = os.path.join(os.path.dirname(BACKEND_DIR), "frontend")
+
+DEFAULT_TARGETS = [
+    "app.core",
+    "app.models",
+    "app.api",
+    "main",
+    "gui.config_gui",
+]
+
+# 这些库不应出现在启动路径上
+HEAVY_MODULES = ["torch", "transformers", "librosa", "webrtcvad", "pyaudio", "pyttsx3", "speech_recognition"]
+
+
+def profile_target(target: str):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([BACKEND_DIR, FRONTEND_DIR, env.get("PYTHONPATH", "")])
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        capture_output=True, text=True, cwd=BACKEND_DIR, env=env
+    )
+
+    entries = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # 格式: "import time:  self_us | cumulative_us | name"
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3:
+            continue
+        try:
+            entries.append((int(fields[1]), int(fields[0]), fields[2].rstrip()))
+        except ValueError:
+            continue
+
+    error = None
+    if proc.returncode != 0:
+        error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "导入失败"
+    return entries, error
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动导入耗时分析")
+    parser.add_argument("--targets", default=",".join(DEFAULT_TARGETS), help="逗号分隔的模块列表")
+    parser.add_argument("--top", type=int, default=10, help="每个模块显示的最慢导入数量")
+    args = parser.parse_args()
+
+    for target in args.targets.split(","):
+        entries, error = profile_target(target)
+        own = next((e for e in entries if e[2].strip() == target), None)
+        total_ms = own[0] / 1000 if own else sum(e[1] for e in entries) / 1000
+        heavy = sorted({e[2].strip().split(".")[0] for e in entries} & set(HEAVY_MODULES))
+
+        print(f"== {target}: {total_ms:.1f} ms")
+        if error:
+            print(f"   [Error] {error}")
+        if heavy:
+            print(f"   [Warning] 启动路径导入了重量级依赖: {', '.join(heavy)}")
+        for cumulative_us, self_us, name in sorted(entries, reverse=True)[:args.top]:
+            print(f"   {cumulative_us / 1000:>9.1f} ms  (self {self_us / 1000:>7.1f})  {name}")
+
+
+if __name__ == "__main__":
+    main()
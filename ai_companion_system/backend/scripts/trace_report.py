@@ -0,0 +1,84 @@
+"""每轮对话延迟trace统计
+
+读取GUI写出的traces.jsonl（日志目录下，每行一轮对话的时间线），
+按阶段（record/emotion/asr/text_emotion/fusion/llm/display/save_history/tts）统计p50/p95/p99，
+并给出响应延迟（用户说完到回复开始播放）和整轮耗时。
+
+用法:
+    python scripts/trace_report.py logs/traces.jsonl
+    python scripts/trace_report.py logs/traces.jsonl --last 200 --source voice
+"""
+import argparse
+import json
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def load_traces(path, source=None):
+    traces = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                trace = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"[Warning] 跳过第{line_no}行：不是有效的JSON")
+                continue
+            if source and trace.get("attrs", {}).get("source") != source:
+                continue
+            traces.append(trace)
+    return traces
+
+
+def collect(traces):
+    """{阶段: [耗时ms, ...]}，同一轮中同名阶段出现多次时分别计入"""
+    samples = {}
+    for trace in traces:
+        for span in trace.get("spans", []):
+            if span.get("duration_ms") is not None:
+                samples.setdefault(span["name"], []).append(span["duration_ms"])
+        if trace.get("attrs", {}).get("response_ms") is not None:
+            samples.setdefault("response", []).append(trace["attrs"]["response_ms"])
+        if trace.get("duration_ms") is not None:
+            samples.setdefault(trace.get("name", "turn"), []).append(trace["duration_ms"])
+    return samples
+
+
+def main():
+    from app.utils.tracing import summarize
+
+    parser = argparse.ArgumentParser(description="每轮对话延迟trace统计")
+    parser.add_argument("trace_file", help="traces.jsonl路径")
+    parser.add_argument("--last", type=int, default=0, help="只统计最近N轮，0为全部")
+    parser.add_argument("--source", choices=["voice", "text"], default=None, help="只统计语音或文字输入的轮次")
+    args = parser.parse_args()
+
+    traces = load_traces(args.trace_file, args.source)
+    if args.last > 0:
+        traces = traces[-args.last:]
+    if not traces:
+        print("[Error] 没有可统计的trace")
+        return
+
+    interrupted = sum(1 for trace in traces if trace.get("attrs", {}).get("interrupted"))
+    print(f"轮数: {len(traces)}  被打断: {interrupted}")
+    print(f"{'阶段':<14}{'次数':>6}{'均值':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'最大':>10}  (ms)")
+
+    samples = collect(traces)
+    order = ["record", "emotion", "asr", "text_emotion", "fusion", "llm", "display", "save_history", "tts",
+             "response", "turn"]
+    names = [name for name in order if name in samples] + sorted(set(samples) - set(order))
+    for name in names:
+        stats = summarize(samples[name])
+        print(f"{name:<14}{stats['count']:>6}{stats['mean']:>10.1f}{stats['p50']:>10.1f}"
+              f"{stats['p95']:>10.1f}{stats['p99']:>10.1f}{stats['max']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
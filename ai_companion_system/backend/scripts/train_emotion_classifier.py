@@ -0,0 +1,144 @@
+"""训练/评估情感分类模型
+
+数据目录按情感标签分子目录存放WAV文件（标签名为happy/sad/angry/anxious/calm/surprised中的一个）:
+    data/
+        happy/xxx.wav
+        sad/yyy.wav
+        ...
+
+提取与运行时相同的情感特征，按比例划分训练/测试集，训练numpy逻辑回归或小型MLP，
+保存为.npz（默认保存到model_cache/emotion_classifier.npz，EmotionAnalyzer启动时自动加载），
+并与阈值规则对比测试集准确率和单条推理耗时。
+
+用法:
+    python scripts/train_emotion_classifier.py --data data/emotion --hidden 16
+    python scripts/train_emotion_classifier.py --data data/emotion --hidden "" --out logreg.npz
+    python scripts/train_emotion_classifier.py --data data/emotion --evaluate model_cache/emotion_classifier.npz
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+RATE = 16000
+
+
+def load_dataset(data_dir, labels):
+    from app.core.emotion_features import extract_emotion_features
+    from app.utils.audio import AudioUtils
+
+    features_list, targets = [], []
+    for label in sorted(os.listdir(data_dir)):
+        label_dir = os.path.join(data_dir, label)
+        if not os.path.isdir(label_dir):
+            continue
+        if label not in labels:
+            print(f"[Warning] 跳过未知标签目录: {label}")
+            continue
+        for name in sorted(os.listdir(label_dir)):
+            if not name.lower().endswith(".wav"):
+                continue
+            try:
+                audio = AudioUtils.load_wav(os.path.join(label_dir, name), RATE)
+            except Exception as e:
+                print(f"[Warning] 读取失败 {label}/{name}: {e}")
+                continue
+            features = extract_emotion_features(audio, RATE)
+            if features:
+                features_list.append(features)
+                targets.append(label)
+    return features_list, targets
+
+
+def split_dataset(n, test_split, seed):
+    order = np.random.default_rng(seed).permutation(n)
+    n_test = int(round(n * test_split))
+    return order[n_test:], order[:n_test]
+
+
+def report(name, classifier, matrix, targets):
+    from app.core.emotion_classifier import evaluate
+
+    accuracy, confusion = evaluate(classifier, matrix, targets)
+    repeats = 200
+    sample = matrix[:1]
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        classifier.predict_batch(sample)
+    single_us = (time.perf_counter() - t0) / repeats * 1e6
+    t0 = time.perf_counter()
+    classifier.predict_batch(matrix)
+    batch_us = (time.perf_counter() - t0) / max(1, len(matrix)) * 1e6
+
+    print(f"{name:<10} 准确率 {accuracy:6.1%}  单条推理 {single_us:7.1f} us  批量 {batch_us:6.2f} us/条")
+    return accuracy, confusion
+
+
+def main():
+    from app.core.emotion_classifier import (
+        EMOTION_LABELS, DEFAULT_MODEL_PATH, NumpyEmotionClassifier,
+        ThresholdEmotionClassifier, features_to_matrix
+    )
+
+    parser = argparse.ArgumentParser(description="训练/评估情感分类模型")
+    parser.add_argument("--data", required=True, help="按标签分子目录的WAV数据目录")
+    parser.add_argument("--out", default=DEFAULT_MODEL_PATH, help="模型保存路径(.npz)")
+    parser.add_argument("--hidden", default="16", help="逗号分隔的隐层大小，空字符串为逻辑回归")
+    parser.add_argument("--epochs", type=int, default=500)
+    parser.add_argument("--lr", type=float, default=0.01)
+    parser.add_argument("--l2", type=float, default=1e-4)
+    parser.add_argument("--test-split", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--evaluate", default=None, help="只评估已有模型，不训练")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    features_list, targets = load_dataset(args.data, EMOTION_LABELS)
+    if not features_list:
+        print("[Error] 数据目录中没有可用的WAV文件")
+        return
+    matrix = features_to_matrix(features_list)
+    counts = {label: targets.count(label) for label in EMOTION_LABELS if label in targets}
+    print(f"样本数: {len(targets)}  {counts}  特征提取 {time.perf_counter() - t0:.1f}s")
+
+    if args.evaluate:
+        classifier = NumpyEmotionClassifier.load(args.evaluate)
+        report("threshold", ThresholdEmotionClassifier(), matrix, targets)
+        report("model", classifier, matrix, targets)
+        return
+
+    train_idx, test_idx = split_dataset(len(targets), args.test_split, args.seed)
+    train_targets = [targets[i] for i in train_idx]
+    test_targets = [targets[i] for i in test_idx]
+    hidden_sizes = tuple(int(n) for n in args.hidden.split(",") if n.strip())
+
+    t0 = time.perf_counter()
+    classifier = NumpyEmotionClassifier.fit(
+        matrix[train_idx], train_targets,
+        hidden_sizes=hidden_sizes, epochs=args.epochs, learning_rate=args.lr, l2=args.l2,
+        label_set=EMOTION_LABELS, seed=args.seed
+    )
+    model_type = f"MLP{list(hidden_sizes)}" if hidden_sizes else "逻辑回归"
+    print(f"训练完成: {model_type}，训练集 {len(train_idx)} 条，耗时 {time.perf_counter() - t0:.2f}s")
+
+    eval_matrix, eval_targets = (matrix[test_idx], test_targets) if len(test_idx) else (matrix, targets)
+    report("threshold", ThresholdEmotionClassifier(), eval_matrix, eval_targets)
+    _, confusion = report("model", classifier, eval_matrix, eval_targets)
+
+    print("混淆矩阵（行: 真实标签，列: 预测标签）")
+    print(" " * 10 + "".join(f"{label:>10}" for label in classifier.labels))
+    for label, row in zip(classifier.labels, confusion):
+        print(f"{label:<10}" + "".join(f"{count:>10}" for count in row))
+
+    classifier.save(args.out)
+    print(f"模型已保存: {args.out} ({os.path.getsize(args.out)} 字节)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from app.core.echo import EchoSuppressor, PlaybackReference  # noqa: E402
+from app.utils.audio import AudioUtils  # noqa: E402
+
+RATE = 16000
+FRAME = 480
+
+
+def scene(duration, delay_ms, seed=0):
+    rng = np.random.default_rng(seed)
+    n = int(duration * RATE)
+    t = np.arange(n) / RATE
+    phase = 2 * np.pi * np.cumsum(180 * (1 + 0.1 * np.sin(2 * np.pi * 0.7 * t))) / RATE
+    envelope = np.clip(np.sin(2 * np.pi * 2.5 * t), 0, None)
+    reference = (0.3 * envelope * sum(np.sin(k * phase) / k for k in range(1, 6))
+                 + 0.01 * rng.standard_normal(n)).astype(np.float32)
+    ir = rng.standard_normal(128) * np.exp(-np.arange(128) / 20)
+    ir = 0.6 * ir / np.linalg.norm(ir)
+    delay = int(delay_ms * RATE / 1000)
+    echo = np.convolve(np.concatenate((np.zeros(delay), reference)), ir)[:n]
+    return reference, (echo + 0.001 * rng.standard_normal(n)).astype(np.float32)
+
+
+def run(suppressor, mic, origin):
+    out = np.zeros(len(mic), dtype=np.float32)
+    for i in range(0, len(mic) - FRAME + 1, FRAME):
+        frame = AudioUtils.to_int16(mic[i:i + FRAME])
+        out[i:i + FRAME] = AudioUtils.to_float32(suppressor.process(frame, origin + i / RATE))
+    return out
+
+
+def test_bulk_delay_beyond_filter_length_is_estimated():
+    reference, mic = scene(8.0, delay_ms=100)
+    playback = PlaybackReference(buffer_seconds=10)
+    origin = time.monotonic()
+    playback.publish(reference, origin)
+    suppressor = EchoSuppressor(reference=playback)
+
+    out = run(suppressor, mic, origin)
+
+    assert abs(suppressor.delay * 1000 - 100) < 5
+    tail = slice(5 * RATE, None)
+    assert np.mean(out[tail] ** 2) < 0.5 * np.mean(mic[tail] ** 2)
+
+
+def test_output_never_louder_than_mic():
+    # 延迟估计关闭且对不齐时滤波器无法抵消回声，此时应原样输出麦克风信号
+    reference, mic = scene(4.0, delay_ms=100)
+    playback = PlaybackReference(buffer_seconds=10)
+    origin = time.monotonic()
+    playback.publish(reference, origin)
+    suppressor = EchoSuppressor(reference=playback, auto_delay=False)
+
+    out = run(suppressor, mic, origin)
+
+    for i in range(0, len(mic) - FRAME + 1, FRAME):
+        assert np.sum(out[i:i + FRAME] ** 2) <= np.sum(mic[i:i + FRAME] ** 2) * 1.01 + 1e-6
+
+
+def test_recovers_after_echo_path_change():
+    # 收敛后回声增益变为3倍（如调大音量），不能一直被判为双讲而停止自适应
+    reference, mic = scene(16.0, delay_ms=8)
+    mic[8 * RATE:] *= 3.0
+    playback = PlaybackReference(buffer_seconds=20)
+    origin = time.monotonic()
+    playback.publish(reference, origin)
+    suppressor = EchoSuppressor(reference=playback)
+
+    out = np.zeros(len(mic), dtype=np.float32)
+    double_talk = 0
+    for i in range(0, len(mic) - FRAME + 1, FRAME):
+        frame = AudioUtils.to_int16(np.clip(mic[i:i + FRAME], -1.0, 1.0))
+        out[i:i + FRAME] = AudioUtils.to_float32(suppressor.process(frame, origin + i / RATE))
+        if i >= 8 * RATE:
+            double_talk += suppressor.double_talk
+
+    before = slice(6 * RATE, 8 * RATE)
+    after = slice(14 * RATE, 16 * RATE)
+    assert double_talk < 0.2 * (8 * RATE // FRAME)
+    assert np.mean(out[after] ** 2) / np.mean(mic[after] ** 2) < 1.5 * np.mean(out[before] ** 2) / np.mean(mic[before] ** 2)
@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from app.core.interrupt import BargeInDetector  # noqa: E402
+
+RATE = 16000
+FRAME = 480
+
+
+def tone(amplitude, f0=200.0, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(FRAME) / RATE
+    return (amplitude * np.sin(2 * np.pi * f0 * t) + rng.standard_normal(FRAME) * 20).astype(np.int16)
+
+
+def make_detector():
+    detector = BargeInDetector(RATE)
+    # 只测试能量和回声门限，不依赖是否安装webrtcvad
+    detector.vad = None
+    for i in range(20):
+        detector.process_frame(tone(0.0, seed=i))
+    return detector
+
+
+def play(detector, reference, coupling, frames, near=0.0):
+    """播放期间输入frames帧：回声为参考信号乘以耦合系数（能量比），可叠加近端语音"""
+    events = []
+    for i in range(frames):
+        now = time.monotonic()
+        detector.update_reference(reference, now)
+        echo = reference.astype(np.float32) * np.sqrt(coupling)
+        mic = echo + tone(near, f0=310.0, seed=100 + i).astype(np.float32)
+        event = detector.process_frame(np.clip(mic, -32768, 32767).astype(np.int16), now)
+        if event:
+            events.append(event)
+    return events
+
+
+def test_strong_echo_coupling_does_not_barge_in():
+    # 耦合系数0.5时 0.5 * echo_ratio >= 1，初始耦合估计0.1下每帧回声都会通过门限
+    detector = make_detector()
+    detector.set_active(True)
+    reference = tone(8000.0)
+
+    assert play(detector, reference, coupling=0.5, frames=100) == []
+    assert detector.get_stats()["echo_coupling"] > 0.3
+
+
+def test_near_speech_over_echo_still_barges_in():
+    detector = make_detector()
+    detector.set_active(True)
+    reference = tone(4000.0)
+    play(detector, reference, coupling=0.5, frames=20)
+
+    assert play(detector, reference, coupling=0.5, frames=10, near=20000.0)
@@ -0,0 +1,92 @@
+import os
+import sys
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from app.core.vad import VoiceActivityDetector, ENERGY_THRESHOLD_MAX  # noqa: E402
+
+RATE = 16000
+
+
+def make_detector():
+    detector = VoiceActivityDetector(RATE, frame_duration=30)
+    # 只测试能量预筛和片段合并，不依赖是否安装webrtcvad
+    detector.vad = None
+    return detector
+
+
+def voiced(duration, amplitude=3000.0, f0=150.0, modulation=None):
+    t = np.arange(int(duration * RATE)) / RATE
+    signal = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in (1, 2, 3))
+    signal = signal / np.max(np.abs(signal))
+    if modulation is not None:
+        rate, depth = modulation
+        signal = signal * (1.0 - depth * (0.5 + 0.5 * np.sin(2 * np.pi * rate * t)))
+    return (amplitude * signal).astype(np.int16)
+
+
+def noise(duration, rms=50.0, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.standard_normal(int(duration * RATE)) * rms).astype(np.int16)
+
+
+def test_steady_voiced_tone_is_one_segment():
+    segments = make_detector().detect_segments(voiced(10.0))
+    assert len(segments) == 1
+    start, end = segments[0]
+    assert start == 0
+    assert end >= 10.0 * RATE - 2 * 480
+
+
+def test_modulated_continuous_speech_is_not_fragmented():
+    audio = voiced(10.0, modulation=(4.0, 0.7))
+    segments = make_detector().detect_segments(audio)
+    assert len(segments) == 1
+
+
+def test_speech_after_silence_starts_at_speech():
+    audio = np.concatenate((noise(1.0), voiced(2.0), noise(1.0, seed=1)))
+    segments = make_detector().detect_segments(audio)
+    assert len(segments) == 1
+    start, end = segments[0] / RATE
+    assert abs(start - 1.0) <= 0.03
+    assert abs(end - 3.0) <= 0.03
+
+
+def test_threshold_is_capped_for_loud_noise_floor():
+    energy = np.full(100, 1e5 * 0.9)
+    assert VoiceActivityDetector._energy_threshold(energy) <= ENERGY_THRESHOLD_MAX
+
+
+class AcceptAllVad:
+    """预筛通过的帧一律判为语音，便于不依赖webrtcvad测试公开接口"""
+
+    def is_speech(self, frame, rate):
+        return True
+
+
+def test_process_audio_stream_returns_per_frame_tuples():
+    detector = make_detector()
+    detector.vad = AcceptAllVad()
+    audio = np.concatenate((noise(1.0), voiced(0.3), noise(1.0, seed=1)))
+    frames = detector.process_audio_stream(audio.tobytes(), RATE)
+    # 旧接口按帧返回：每个元组正好一帧，且相邻帧首尾相接
+    assert all(end - start == 30 and start % 30 == 0 for start, end in frames)
+    assert all(a[1] == b[0] for a, b in zip(frames, frames[1:]))
+    assert abs(frames[0][0] - 1000) <= 30
+    assert abs(frames[-1][1] - 1300) <= 30
+
+
+def test_process_audio_segments_merges_frames():
+    detector = make_detector()
+    detector.vad = AcceptAllVad()
+    audio = np.concatenate((noise(1.0), voiced(2.0), noise(1.0, seed=1)))
+    segments = detector.process_audio_segments(audio, RATE)
+    assert len(segments) == 1
+    start, end = segments[0]
+    assert abs(start - 1000) <= 30
+    assert abs(end - 3000) <= 30
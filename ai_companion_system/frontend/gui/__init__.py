@@ -1,5 +1,8 @@
-from .chat_gui import ChatGUI
-from .config_gui import ConfigGUI
-from .model_load_gui import ModelLoadGUI
+# 各窗口按需导入，启动时只加载配置窗口
+from app.utils.lazy import lazy_module
 
-__all__ = ["ChatGUI", "ConfigGUI", "ModelLoadGUI"]
+__getattr__, __dir__, __all__ = lazy_module(__name__, {
+    "ChatGUI": ".chat_gui",
+    "ConfigGUI": ".config_gui",
+    "ModelLoadGUI": ".model_load_gui"
+})
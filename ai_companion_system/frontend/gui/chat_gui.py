@@ -28,6 +28,7 @@ class ChatGUI:
         self._llm_loaded = llm_loaded
         
         self._model_manager = None
+        self._model_wait_timeout = 300
         self._is_recording = False
         self._recording_thread = None
         self._audio_queue = queue.Queue()
@@ -36,15 +37,39 @@ class ChatGUI:
         self._interrupted = False
         self._current_speech_text = ""
         
+        # 回复被打断后可"继续"：完整回复、已播放到的位置，以及回复是否来自LLM（需要同步对话历史）
+        self._interrupt_handler = None
+        self._last_reply = ""
+        self._reply_from_llm = False
+        self._resume_position = None
+        self._resume_commands = ("继续", "继续说", "接着说", "你继续", "你继续说", "然后呢")
+        
         self._emotion_analyzer = None
         self._voice_adjuster = None
         self._interrupt_detector = None
         self._vad = None
+        # 录音端点检测参数：VAD帧长(10/20/30ms)、语音结束前的静音时长、语音开始前保留的预录时长
+        self._vad_frame_duration = 30
+        self._vad_end_silence_ms = 800
+        self._vad_preroll_ms = 300
         
         self._current_user_emotion = "calm"
         self._current_speech_rate = 1.0
-        
-        self._init_modules()
+        # 每轮对话融合声学、文本和历史得到的情感估计，界面、声音调节和LLM提示词共用
+        self._emotion_fusion = None
+        self._current_estimate = None
+        
+        # 录音结束后情感分析、ASR、文本情感并行执行；ASR正常情况下的等待上限，以及ASR完成后情感阶段的额外等待上限（秒）
+        self._stage_executor = None
+        self._stage_lock = threading.Lock()
+        self._asr_timeout = 30
+        self._emotion_timeout = 2.0
+        # 每轮对话的延迟trace写入日志目录的traces.jsonl；每隔若干轮打印一次分位数统计
+        self._turn_count = 0
+        self._latency_report_interval = 10
+        
+        self.tts = None
+        self._modules_ready = threading.Event()
         
         self.load_background_image()
         
@@ -60,12 +85,10 @@ class ChatGUI:
         
         self.chat_history = []
         
-        try:
-            from app.core.tts import TextToSpeech
-            self.tts = TextToSpeech()
-            self.setup_voice_parameters()
-        except Exception as e:
-            self.tts = None
+        # 语音相关模块（librosa、pyaudio、pyttsx3等）在后台加载，窗口先显示出来
+        modules_thread = threading.Thread(target=self._init_modules_async)
+        modules_thread.daemon = True
+        modules_thread.start()
         
         self.setup_main_background()
         
@@ -95,10 +118,36 @@ class ChatGUI:
             thread.daemon = True
             thread.start()
     
+    def _init_modules_async(self):
+        try:
+            self._init_modules()
+            
+            try:
+                from app.core.tts import TextToSpeech
+                self.tts = TextToSpeech()
+                self.setup_voice_parameters()
+            except Exception as e:
+                print(f"[Error] TTS模块初始化失败: {e}")
+                self.tts = None
+            
+            if self.tts and self._interrupt_detector:
+                from app.core.interrupt import InterruptHandler
+                self._interrupt_handler = InterruptHandler(self.tts, self._interrupt_detector)
+        finally:
+            self._modules_ready.set()
+    
+    def _wait_modules_ready(self, timeout=30):
+        if not self._modules_ready.wait(timeout):
+            print("[Warning] 语音模块尚未加载完成")
+            return False
+        return True
+    
     def _init_modules(self):
         try:
             from app.core.emotion import EmotionAnalyzer
+            from app.core.emotion_fusion import EmotionFusion
             self._emotion_analyzer = EmotionAnalyzer()
+            self._emotion_fusion = EmotionFusion(self._emotion_analyzer)
             print("[Info] 情感分析模块初始化成功")
         except Exception as e:
             print(f"[Error] 情感分析模块初始化失败: {e}")
@@ -119,7 +168,7 @@ class ChatGUI:
         
         try:
             from app.core.vad import VoiceActivityDetector
-            self._vad = VoiceActivityDetector()
+            self._vad = VoiceActivityDetector(frame_duration=self._vad_frame_duration)
             print("[Info] VAD模块初始化成功")
         except Exception as e:
             print(f"[Error] VAD模块初始化失败: {e}")
@@ -334,6 +383,16 @@ class ChatGUI:
             )
             print(f"[Info] 综合调整声音参数: {params}")
     
+    def _adjust_voice_for_estimate(self, estimate):
+        if self._voice_adjuster and self.tts:
+            params = self._voice_adjuster.adjust_voice_for_estimate(estimate)
+            self.tts.set_parameters(
+                speed=params.get("speed", 1.0),
+                pitch=params.get("pitch", 1.0),
+                volume=params.get("volume", 1.0)
+            )
+            print(f"[Info] 根据融合情感调整声音参数: {params}")
+    
     def _analyze_emotion(self, audio_data, sample_rate=16000):
         if self._emotion_analyzer:
             try:
@@ -356,6 +415,7 @@ class ChatGUI:
         self.root.after(0, lambda: self.emotion_label.config(text=f"情感: {emotion_text}"))
     
     def _speak_with_interrupt(self, message):
+        self._wait_modules_ready()
         if not self.tts:
             return False
         
@@ -363,18 +423,19 @@ class ChatGUI:
         self._current_speech_text = message
         self._interrupted = False
         
+        # 启动打断检测（已在运行时直接返回）
+        self._monitor_interrupt()
         if self._interrupt_detector:
             self._interrupt_detector.set_tts_playing(True)
         
-        # 启动打断检测线程
-        interrupt_thread = threading.Thread(target=self._monitor_interrupt)
-        interrupt_thread.daemon = True
-        interrupt_thread.start()
-        
-        try:
-            result = self.tts.speak(message)
-        except Exception:
-            result = False
+        from app.utils.tracing import span
+        with span("tts", chars=len(message)) as current:
+            try:
+                result = self.tts.speak(message)
+            except Exception:
+                result = False
+            if current is not None:
+                current.set(interrupted=self._interrupted)
         
         self._tts_playing = False
         if self._interrupt_detector:
@@ -383,58 +444,81 @@ class ChatGUI:
         return result
     
     def _monitor_interrupt(self):
-        """监控用户语音输入，检测打断"""
+        """启动打断检测
+
+        检测器在后台常驻读取共享采集流，TTS未播放时只跟踪环境噪声底，
+        播放期间由检测器统一完成语音/能量/回声判断和多帧确认。
+        """
+        if not self._interrupt_detector:
+            return False
         try:
-            import pyaudio
-            
-            CHUNK = 1024
-            FORMAT = pyaudio.paInt16
-            CHANNELS = 1
-            RATE = 16000
-            
-            p = pyaudio.PyAudio()
-            stream = p.open(format=FORMAT,
-                           channels=CHANNELS,
-                           rate=RATE,
-                           input=True,
-                           frames_per_buffer=CHUNK)
-            
-            while self._tts_playing and not self._interrupted:
-                data = stream.read(CHUNK, exception_on_overflow=False)
-                
-                # 使用VAD检测语音活动
-                if self._vad:
-                    is_voice = self._vad.is_voice(data)
-                    if is_voice:
-                        # 检测到用户语音，打断TTS播放
-                        print("[Info] 检测到用户语音，打断TTS播放")
-                        if self.tts:
-                            self.tts.stop()
-                        self._interrupted = True
-                        self._tts_playing = False
-                        if self._interrupt_detector:
-                            self._interrupt_detector.set_tts_playing(False)
-                        break
-                
-                # 使用打断检测器
-                if self._interrupt_detector:
-                    audio_chunk = np.frombuffer(data, dtype=np.int16)
-                    energy = np.abs(audio_chunk).mean()
-                    if energy > 500 and self._interrupt_detector.get_interrupt_status():
-                        print("[Info] 打断检测器触发，打断TTS播放")
-                        if self.tts:
-                            self.tts.stop()
-                        self._interrupted = True
-                        self._tts_playing = False
-                        self._interrupt_detector.set_tts_playing(False)
-                        break
-            
-            stream.stop_stream()
-            stream.close()
-            p.terminate()
-            
+            return self._interrupt_detector.start_detection(self._on_barge_in)
         except Exception as e:
             print(f"[Error] 打断监控失败: {e}")
+            return False
+    
+    def _on_barge_in(self):
+        """检测器确认打断后的回调（在检测线程中执行）"""
+        if not self._tts_playing or self._interrupted:
+            return
+        event = self._interrupt_detector.get_last_event() if self._interrupt_detector else None
+        latency = f"，延迟{event['latency_ms']:.0f}ms" if event else ""
+        print(f"[Info] 检测到用户语音，打断TTS播放{latency}")
+        # 先标记打断再停止播放，播放线程返回时即可看到打断状态
+        self._interrupted = True
+        if self.tts:
+            self.tts.stop()
+        self._tts_playing = False
+        if self._interrupt_detector:
+            self._interrupt_detector.set_tts_playing(False)
+    
+    def _speak_reply(self, reply, offset=0):
+        """播放回复中从offset开始的部分；被打断时记录用户实际听到的位置，并只把已播放部分提交到LLM历史"""
+        from app.utils.tracing import current_trace, record_latency, format_latency_summary
+        self._last_reply = reply
+        self._resume_position = None
+        trace = current_trace()
+        if trace is not None:
+            trace.mark("tts_start")
+        result = self._speak_with_interrupt(reply[offset:])
+        
+        if self._interrupted and self._interrupt_handler:
+            self._interrupt_handler.handle_interrupted_speech(reply[offset:])
+            heard = offset + self._interrupt_handler.interrupt_position
+            if heard < len(reply):
+                self._resume_position = heard
+                llm_model = self._model_manager.get_llm_model() if self._model_manager and self._reply_from_llm else None
+                if llm_model:
+                    llm_model.commit_spoken_response(heard, reply)
+                print(f"[Info] 回复在第{heard}/{len(reply)}个字符处被打断")
+        
+        if trace is not None:
+            # 响应延迟：用户说完（或发送文字）到回复开始播放
+            response_start = trace.marks.get("speech_end", 0.0)
+            response_ms = trace.marks["tts_start"] - response_start
+            record_latency("response", response_ms)
+            trace.set(response_ms=round(response_ms, 3), interrupted=self._interrupted)
+            trace.finish()
+            self._turn_count += 1
+            if self._turn_count % self._latency_report_interval == 0:
+                print(f"[Info] 延迟统计: {format_latency_summary(['response', 'asr', 'llm', 'tts', 'turn'])}")
+        return result
+    
+    def _resume_reply(self):
+        """继续播放上一条被打断的回复，不重新生成"""
+        offset = self._resume_position
+        if self._reply_from_llm and self._model_manager:
+            llm_model = self._model_manager.get_llm_model()
+            if llm_model:
+                llm_model.resume_response()
+        
+        self.display_message(self._ai_name, self._last_reply[offset:])
+        self.root.update_idletasks()
+        
+        from app.utils.tracing import wrap
+        thread = threading.Thread(target=wrap(self._speak_reply), args=(self._last_reply, offset))
+        thread.daemon = True
+        thread.start()
     
     def speak_message(self, message):
         return self._speak_with_interrupt(message)
@@ -453,14 +537,17 @@ class ChatGUI:
             print("[Error] TTS未初始化")
     
     def display_message(self, sender, message):
-        self.chat_history_text.config(state=tk.NORMAL)
-        self.chat_history_text.insert(tk.END, f"{sender}: {message}\n\n")
-        self.chat_history_text.config(state=tk.DISABLED)
-        self.chat_history_text.see(tk.END)
-        
-        self.chat_history.append({"sender": sender, "message": message})
+        from app.utils.tracing import span
+        with span("display"):
+            self.chat_history_text.config(state=tk.NORMAL)
+            self.chat_history_text.insert(tk.END, f"{sender}: {message}\n\n")
+            self.chat_history_text.config(state=tk.DISABLED)
+            self.chat_history_text.see(tk.END)
+            
+            self.chat_history.append({"sender": sender, "message": message})
         
-        self.save_chat_history()
+        with span("save_history"):
+            self.save_chat_history()
     
     def toggle_recording(self):
         if self._is_recording:
@@ -471,8 +558,8 @@ class ChatGUI:
             self.mic_button.config(text="⏹", bg='#d9534f')
             
             if self._tts_playing and self.tts:
-                self.tts.stop()
                 self._interrupted = True
+                self.tts.stop()
                 self._tts_playing = False
                 if self._interrupt_detector:
                     self._interrupt_detector.set_tts_playing(False)
@@ -482,89 +569,94 @@ class ChatGUI:
             self._recording_thread.start()
     
     def _record_audio_vad(self):
+        self._wait_modules_ready()
         try:
-            import pyaudio
+            from app.core.capture import get_capture_service
+            from app.core.vad import VADFramer, SpeechEndpointer
+            from app.utils.tracing import start_trace, span, detach_trace
             
             CHUNK = 1024
-            FORMAT = pyaudio.paInt16
-            CHANNELS = 1
             RATE = 16000
             
             SILENCE_THRESHOLD = 500
-            SILENCE_FRAMES = 25
-            
-            p = pyaudio.PyAudio()
             
-            stream = p.open(format=FORMAT,
-                           channels=CHANNELS,
-                           rate=RATE,
-                           input=True,
-                           frames_per_buffer=CHUNK)
-            
-            frames = []
-            silence_count = 0
-            has_speech = False
-            start_time = time.time()
-            
-            self.root.after(0, lambda: self.mic_button.config(text="⏹", bg='#d9534f'))
-            
-            while self._is_recording:
-                data = stream.read(CHUNK, exception_on_overflow=False)
-                frames.append(data)
-                
-                audio_chunk = np.frombuffer(data, dtype=np.int16)
-                energy = np.abs(audio_chunk).mean()
-                
-                # 使用VAD检测语音活动
-                vad_detected = False
+            # 共享采集服务常驻运行，录音只是新增一个读者，不再每轮打开/关闭设备
+            subscription = get_capture_service().subscribe()
+            # 本轮trace从开始录音起，经过并行阶段、LLM，到TTS播放结束
+            trace = start_trace("turn", source="voice")
+            if subscription is None:
+                trace.cancel()
+                print("[Error] 录音失败: 麦克风不可用")
+                self.root.after(0, lambda: self.mic_button.config(text="🎤", bg='#5cb85c'))
+                return
+            
+            # 录音中途出错时也要注销读者，否则采集服务会一直向它写入
+            try:
+                # 采集块按VAD帧长重新切分，每一帧都参与检测，再由状态机平滑得到语音起止点
                 if self._vad:
-                    is_voice = self._vad.is_voice(data)
-                    if is_voice:
-                        has_speech = True
-                        silence_count = 0
-                        vad_detected = True
-                    elif has_speech:
-                        silence_count += 1
+                    framer = self._vad.create_framer()
+                    endpointer = self._vad.create_endpointer(self._vad_end_silence_ms, self._vad_preroll_ms)
+                else:
+                    framer = VADFramer(int(RATE * self._vad_frame_duration / 1000) * 2)
+                    endpointer = SpeechEndpointer(self._vad_frame_duration, self._vad_end_silence_ms, self._vad_preroll_ms)
+                use_vad = self._vad is not None and self._vad.vad is not None
+                # 语音开始后逐帧累计情感特征，端点检测结束时情感结果即已就绪
+                accumulator = self._emotion_analyzer.create_stream_accumulator(RATE) if self._emotion_analyzer else None
+                start_time = time.time()
                 
-                # 如果VAD不可用或未检测到语音，使用能量检测作为后备
-                if not vad_detected:
-                    if energy > SILENCE_THRESHOLD:
-                        has_speech = True
-                        silence_count = 0
-                    elif has_speech:
-                        silence_count += 1
+                self.root.after(0, lambda: self.mic_button.config(text="⏹", bg='#d9534f'))
                 
-                # 检查是否需要停止录音
-                if has_speech and silence_count > SILENCE_FRAMES:
-                    break
+                with span("record"):
+                    while self._is_recording and endpointer.state != "ended":
+                        # 超时保护，最多录音30秒
+                        if time.time() - start_time > 30:
+                            break
+                    
+                        data = subscription.read_bytes(CHUNK, timeout=1.0)
+                        if data is None:
+                            continue
+                    
+                        for frame in framer.push(data):
+                            # 使用VAD检测语音活动，VAD不可用或未检测到语音时使用能量检测作为后备
+                            is_speech = use_vad and self._vad.is_voice(frame)
+                            if not is_speech:
+                                energy = np.abs(np.frombuffer(frame, dtype=np.int16)).mean()
+                                is_speech = energy > SILENCE_THRESHOLD
+                    
+                            event = endpointer.process(frame, is_speech)
+                            if accumulator is not None and endpointer.triggered:
+                                # 触发时带上预录帧，之后每帧（含结束前的静音拖尾）与整段分析保持一致
+                                trend = accumulator.push(b''.join(endpointer.frames) if event == "start" else frame)
+                                if trend:
+                                    self._update_emotion_indicator(trend[-1][1])
+                            if event == "end":
+                                break
                 
-                # 超时保护，最多录音30秒
-                if time.time() - start_time > 30:
-                    break
-            
-            stream.stop_stream()
-            stream.close()
-            p.terminate()
+                frames = endpointer.frames
+                has_speech = endpointer.triggered
+            finally:
+                subscription.close()
             
             if frames and has_speech:
+                trace.mark("speech_end")
                 audio_data = np.frombuffer(b''.join(frames), dtype=np.int16)
                 audio_data_float = audio_data.astype(np.float32) / 32768.0
                 
                 speech_duration = len(audio_data) / RATE
+                trace.set(speech_seconds=round(speech_duration, 3))
                 
                 self.root.after(0, lambda: self.mic_button.config(text="识别中...", bg='#f0ad4e'))
                 
-                emotion, features = self._analyze_emotion(audio_data_float, RATE)
-                self._current_user_emotion = emotion
-                self._update_emotion_indicator(emotion)
-                
-                text = self._transcribe_audio(audio_data_float)
+                text, estimate = self._process_utterance(audio_data_float, accumulator, RATE)
                 
                 if text and speech_duration > 0:
-                    text_length = len(text)
-                    self._current_speech_rate = text_length / speech_duration
-                    # 自动发送识别结果
-                    self.send_message(text)
+                    # 自动发送识别结果，trace随回复播放线程继续
+                    self.send_message(text, estimate)
+                else:
+                    trace.finish()
+            else:
+                trace.cancel()
+            detach_trace()
                 
             self.root.after(0, lambda: self.mic_button.config(text="🎤", bg='#5cb85c'))
             
@@ -572,14 +664,115 @@ class ChatGUI:
             print(f"[Error] 录音失败: {e}")
             self.root.after(0, lambda: self.mic_button.config(text="🎤", bg='#5cb85c'))
     
+    def _get_stage_executor(self):
+        with self._stage_lock:
+            if self._stage_executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._stage_executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix="turn-stage")
+            return self._stage_executor
+    
+    @staticmethod
+    def _timed_stage(timings, name, func, *args):
+        from app.utils.tracing import span
+        start = time.perf_counter()
+        try:
+            with span(name):
+                return func(*args)
+        finally:
+            timings[name] = (time.perf_counter() - start) * 1000
+    
+    def _process_utterance(self, audio_data, accumulator=None, sample_rate=16000):
+        """录音结束后的处理：音频情感与ASR并行，ASR完成后立即做文本情感，按截止时间汇合
+        
+        本轮耗时取决于最慢的阶段而不是各阶段之和；返回(识别出的文本, 融合后的情感估计)。
+        """
+        from concurrent.futures import TimeoutError as FutureTimeoutError
+        from app.utils.tracing import span, wrap
+        executor = self._get_stage_executor()
+        timings = {}
+        turn_start = time.perf_counter()
+        
+        # 线程池不继承contextvars，提交时绑定当前trace，各阶段作为子span记录
+        if accumulator is not None:
+            emotion_future = executor.submit(wrap(self._timed_stage), timings, "emotion",
+                                             self._emotion_analyzer.finish_stream, accumulator)
+        else:
+            emotion_future = executor.submit(wrap(self._timed_stage), timings, "emotion",
+                                             self._analyze_emotion, audio_data, sample_rate)
+        asr_future = executor.submit(wrap(self._timed_stage), timings, "asr", self._transcribe_audio, audio_data)
+        
+        # 模型仍在加载时ASR会排队等待加载完成，此时放宽截止时间
+        asr_timeout = self._asr_timeout
+        if self._model_manager and self._model_manager.is_model_loading("asr"):
+            asr_timeout = self._model_wait_timeout
+        try:
+            text = asr_future.result(timeout=asr_timeout)
+        except FutureTimeoutError:
+            print(f"[Warning] ASR超过{asr_timeout}秒未完成，放弃本轮识别结果")
+            text = ""
+        except Exception as e:
+            print(f"[Error] ASR识别失败: {e}")
+            text = ""
+        
+        text_future = None
+        if text and self._emotion_analyzer:
+            text_future = executor.submit(wrap(self._timed_stage), timings, "text_emotion",
+                                          self._emotion_analyzer.text_scores, text)
+        
+        try:
+            emotion, features = emotion_future.result(timeout=self._emotion_timeout)
+        except FutureTimeoutError:
+            print("[Warning] 音频情感分析超时，仅使用文本情感")
+            emotion, features = None, {}
+        except Exception as e:
+            print(f"[Error] 情感分析失败: {e}")
+            emotion, features = None, {}
+        
+        text_scores = None
+        if text_future is not None:
+            try:
+                text_scores = text_future.result(timeout=self._emotion_timeout)
+            except FutureTimeoutError:
+                print("[Warning] 文本情感分析超时")
+            except Exception as e:
+                print(f"[Error] 文本情感分析失败: {e}")
+        
+        duration = len(audio_data) / sample_rate
+        if text and duration > 0:
+            self._current_speech_rate = len(text) / duration
+        with span("fusion"):
+            estimate = self._fuse_emotion(features=features, acoustic_emotion=emotion, text=text,
+                                          text_scores=text_scores or {}, speech_rate=self._current_speech_rate)
+        
+        total_ms = (time.perf_counter() - turn_start) * 1000
+        stages = ", ".join(f"{name} {timings[name]:.0f}ms" for name in ("emotion", "asr", "text_emotion") if name in timings)
+        print(f"[Info] 录音后处理耗时: 总计 {total_ms:.0f}ms（{stages}）")
+        return text, estimate
+    
+    def _fuse_emotion(self, **sources):
+        """融合本轮的情感来源并更新界面，融合模块不可用时返回None"""
+        if not self._emotion_fusion:
+            return None
+        try:
+            estimate = self._emotion_fusion.fuse(self._emotion_fusion.begin_turn(), **sources)
+        except Exception as e:
+            print(f"[Error] 情感融合失败: {e}")
+            return None
+        self._current_estimate = estimate
+        self._current_user_emotion = estimate.emotion
+        self._update_emotion_indicator(estimate.emotion)
+        return estimate
+    
     def _transcribe_audio(self, audio_data):
         if self._model_manager:
-            asr_model = self._model_manager.get_asr_model()
-            if asr_model:
-                try:
-                    return asr_model.transcribe(audio_data)
-                except Exception as e:
-                    print(f"[Error] ASR识别失败: {e}")
+            # 模型仍在后台加载时，当前请求排队等待加载完成
+            # 识别期间持有模型，空闲回收不会在推理中途卸载它
+            with self._model_manager.use_asr_model(timeout=self._model_wait_timeout) as asr_model:
+                if asr_model:
+                    try:
+                        return asr_model.transcribe(audio_data)
+                    except Exception as e:
+                        print(f"[Error] ASR识别失败: {e}")
         
         try:
             from app.core.asr import SpeechRecognizer
@@ -590,49 +783,85 @@ class ChatGUI:
         
         return ""
     
-    def send_message(self, user_input):
+    def send_message(self, user_input, estimate=None):
         if not user_input:
             return
         
+        from app.utils.tracing import current_trace, start_trace, span, wrap, detach_trace
+        # 语音输入沿用录音时开始的trace，文字输入从这里开始新的一轮
+        trace = current_trace() or start_trace("turn", source="text")
+        
         if self.tts:
             try:
+                # 播放中发送新消息等同于打断
+                if self._tts_playing:
+                    self._interrupted = True
                 self.tts.stop()
             except Exception:
                 pass
         
         self.display_message("远边", user_input)
         
-        self._adjust_voice_combined(self._current_user_emotion, self._current_speech_rate)
+        if self._resume_position is not None and user_input.strip().rstrip("吧。！!") in self._resume_commands:
+            trace.set(resume=True)
+            self._resume_reply()
+            detach_trace()
+            return
+        
+        # 语音输入在录音后处理中已融合；文字输入只有文本和历史两个来源
+        if estimate is None:
+            estimate = self._fuse_emotion(text=user_input)
         
-        response = self._get_llm_response(user_input, self._current_user_emotion)
+        if estimate is not None:
+            self._adjust_voice_for_estimate(estimate)
+            response = self._get_llm_response(user_input, estimate.emotion, estimate.confidence)
+        else:
+            self._adjust_voice_combined(self._current_user_emotion, self._current_speech_rate)
+            response = self._get_llm_response(user_input, self._current_user_emotion)
         
         enhanced_response = f"{response}"
+        trace.mark("reply_ready")
         
         self.display_message(self._ai_name, enhanced_response)
         
         self.root.update_idletasks()
         
-        thread = threading.Thread(target=self._speak_with_interrupt, args=(enhanced_response,))
+        # 播放线程继续本轮trace，播放结束时写出
+        thread = threading.Thread(target=wrap(self._speak_reply), args=(enhanced_response,))
         thread.daemon = True
         thread.start()
+        detach_trace()
+    
+    def _get_llm_response(self, user_input, emotion=None, emotion_confidence=None):
+        from app.utils.tracing import span
+        with span("llm") as current:
+            response, source = self._generate_response(user_input, emotion, emotion_confidence)
+            if current is not None:
+                current.set(source=source, chars=len(response))
+            return response
     
-    def _get_llm_response(self, user_input, emotion=None):
+    def _generate_response(self, user_input, emotion=None, emotion_confidence=None):
+        """依次尝试LLM、本地对话模型和关键词模板，返回(回复, 来源)"""
         if self._model_manager:
-            llm_model = self._model_manager.get_llm_model()
-            if llm_model:
-                try:
-                    return llm_model.get_response(user_input, emotion)
-                except Exception as e:
-                    print(f"[Error] LLM回复失败: {e}")
-        
+            if self._model_manager.is_model_loading("llm"):
+                self.root.after(0, lambda: self.mic_button.config(text="等待模型...", bg='#f0ad4e'))
+            with self._model_manager.use_llm_model(timeout=self._model_wait_timeout) as llm_model:
+                if llm_model:
+                    try:
+                        self._reply_from_llm = True
+                        return llm_model.get_response(user_input, emotion, emotion_confidence), "llm"
+                    except Exception as e:
+                        print(f"[Error] LLM回复失败: {e}")
+        
+        self._reply_from_llm = False
         try:
             from app.core.chat import LocalChatModel
             chat_model = LocalChatModel()
-            return chat_model.get_response(user_input)
+            return chat_model.get_response(user_input), "local"
         except Exception as e:
             print(f"[Error] 本地模型回复失败: {e}")
         
-        return self.get_simple_response(user_input)
+        return self.get_simple_response(user_input), "template"
     
     def get_simple_response(self, user_input):
         keywords = {
@@ -733,6 +962,11 @@ class ChatGUI:
             print(f"[Error] 删除聊天历史文件失败: {e}")
         
         self._current_user_emotion = "calm"
+        self._current_estimate = None
+        if self._emotion_fusion:
+            self._emotion_fusion.reset()
+        if self._voice_adjuster:
+            self._voice_adjuster.reset_smoothing()
         self._update_emotion_indicator("calm")
         
         welcome_message = f"你好，我是{self._ai_name}"
@@ -20,6 +20,8 @@ class ModelLoadGUI:
         self._asr_loaded = False
         self._llm_loaded = False
         self._loading = False
+        self._pending_loads = 0
+        self._pending_lock = threading.Lock()
         
         self._model_manager = None
         
@@ -171,70 +173,87 @@ class ModelLoadGUI:
         if self._loading:
             return
         
+        if not self._model_manager:
+            print("[Error] 模型管理器尚未初始化")
+            return
+        
         self._loading = True
         self.load_button.config(text="加载中...", state=tk.DISABLED)
-        self.start_button.config(state=tk.DISABLED)
         
-        thread = threading.Thread(target=self._load_models_thread)
-        thread.daemon = True
-        thread.start()
+        # ASR和LLM在后台线程池中并行加载，聊天窗口可以立即打开，首个请求会等待模型就绪
+        futures = self._model_manager.load_models_async(progress_callback=self._on_load_progress)
+        self.start_button.config(state=tk.NORMAL)
+        
+        self._pending_loads = len(futures)
+        for future in futures.values():
+            future.add_done_callback(self._on_load_done)
+        
+        tts_thread = threading.Thread(target=self._warmup_tts)
+        tts_thread.daemon = True
+        tts_thread.start()
     
-    def _load_models_thread(self):
+    def _warmup_tts(self):
         try:
-            if self._model_manager:
-                self._update_asr_status("创建模型...", '#f0ad4e')
-                
-                asr_model = self._model_manager.load_asr_model()
-                if asr_model:
-                    self._update_asr_status("初始化中...", '#f0ad4e')
-                    
-                    if self._model_manager.initialize_asr_model():
-                        self._asr_loaded = True
-                        self._update_asr_status("已加载", '#5cb85c')
-                    else:
-                        self._update_asr_status("初始化失败", '#d9534f')
-                else:
-                    self._update_asr_status("创建失败", '#d9534f')
-                
-                self._update_llm_status("创建模型...", '#f0ad4e')
-                
-                llm_model = self._model_manager.load_llm_model()
-                if llm_model:
-                    self._update_llm_status("初始化中...", '#f0ad4e')
-                    
-                    if self._model_manager.initialize_llm_model():
-                        self._llm_loaded = True
-                        self._update_llm_status("已加载", '#5cb85c')
-                    else:
-                        self._update_llm_status("初始化失败", '#d9534f')
-                else:
-                    self._update_llm_status("创建失败", '#d9534f')
-                
-                self._update_memory_info()
+            from app.core.tts import TextToSpeech
+            elapsed = TextToSpeech().warmup()
+            if elapsed >= 0:
+                print(f"[Info] TTS预热完成，耗时{elapsed:.2f}秒")
         except Exception as e:
-            print(f"[Error] 加载模型失败: {e}")
-            import traceback
-            traceback.print_exc()
-        finally:
-            self._loading = False
+            print(f"[Error] TTS预热失败: {e}")
+    
+    def _on_load_progress(self, model_type: str, stage: str):
+        status = {
+            "creating": ("创建模型...", '#f0ad4e'),
+            "initializing": ("初始化中...", '#f0ad4e'),
+            "loaded": ("已加载", '#5cb85c'),
+            "warming": ("已加载，预热中...", '#5cb85c'),
+            "ready": ("已就绪", '#5cb85c'),
+            "failed": ("加载失败", '#d9534f')
+        }.get(stage)
+        if not status:
+            return
+        
+        loaded = stage in ("loaded", "warming", "ready")
+        if model_type == "asr":
+            self._asr_loaded = loaded
+            self._update_asr_status(*status)
+        elif model_type == "llm":
+            self._llm_loaded = loaded
+            self._update_llm_status(*status)
+    
+    def _on_load_done(self, future):
+        with self._pending_lock:
+            self._pending_loads -= 1
+            finished = self._pending_loads <= 0
+        
+        if not finished:
+            return
+        
+        self._loading = False
+        try:
+            self.root.after(0, self._update_memory_info)
             self.root.after(0, lambda: self.load_button.config(text="加载模型", state=tk.NORMAL))
-            # 只有当ASR和LLM模型都加载完成时，才启用开始聊天按钮
-            if self._asr_loaded and self._llm_loaded:
-                self.root.after(0, lambda: self.start_button.config(state=tk.NORMAL))
-            else:
-                self.root.after(0, lambda: self.start_button.config(state=tk.DISABLED))
+        except Exception:
+            # 聊天窗口已打开，加载窗口被销毁
+            pass
     
     def _update_asr_status(self, status: str, color: str):
-        self.root.after(0, lambda: self.asr_status_label.config(
-            text=f"● ASR模型: {status}",
-            fg=color
-        ))
+        try:
+            self.root.after(0, lambda: self.asr_status_label.config(
+                text=f"● ASR模型: {status}",
+                fg=color
+            ))
+        except Exception:
+            pass
     
     def _update_llm_status(self, status: str, color: str):
-        self.root.after(0, lambda: self.llm_status_label.config(
-            text=f"● LLM模型: {status}",
-            fg=color
-        ))
+        try:
+            self.root.after(0, lambda: self.llm_status_label.config(
+                text=f"● LLM模型: {status}",
+                fg=color
+            ))
+        except Exception:
+            pass
     
     def start_chat(self):
         if self.on_start_chat:
@@ -16,7 +16,6 @@ if os.path.exists(frontend_path):
 
 print("[Info] 初始化完成，准备启动GUI")
 
-from gui.chat_gui import ChatGUI
 from gui.config_gui import ConfigGUI
 
 chat_gui = None
@@ -28,6 +27,9 @@ def on_config_save(log_path, mic_enabled=False, asr_loaded=False, llm_loaded=Fal
     if config_root:
         config_root.destroy()
     
+    # 聊天窗口依赖numpy等较重的库，打开时再导入
+    from gui.chat_gui import ChatGUI
+    
     chat_root = tk.Tk()
     chat_gui = ChatGUI(chat_root, log_path, mic_enabled, asr_loaded, llm_loaded, ai_name)
     chat_root.mainloop()